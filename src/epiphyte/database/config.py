@@ -10,6 +10,7 @@ Paths:
 - `PATH_PATIENT_ALIGNED_LABELS`: Path to the folder containing the patient-aligned annotations.
 - `PATH_TO_PATIENT_DATA`: Path to the folder containing the refractored mock patient data.
 - `PATH_TO_SESSION_DATA`: Path to the folder containing the refractored mock session data.
+- `PATH_TO_LABEL_STORE`: Path to the folder of the memory-mapped frame label store.
 
 Variables:
 
@@ -32,6 +33,7 @@ PATH_TO_LABELS = os.path.join(PATH_TO_DATA, "movie_annotations")
 PATH_PATIENT_ALIGNED_LABELS = os.path.join(PATH_TO_DATA, "patient_aligned_annotations")
 PATH_TO_PATIENT_DATA = os.path.join(PATH_TO_DATA, "patient_data")
 PATH_TO_SESSION_DATA = os.path.join(PATH_TO_DATA, "session_data")
+PATH_TO_LABEL_STORE = os.path.join(PATH_TO_DATA, "label_store")
 
 PTS_MOVIE_new = [round((x * 0.04), 2) for x in range(1, 125726)]  # movie length: 5029 seconds 
 
@@ -22,7 +22,7 @@ import numpy as np
 from .access_info import *
 from . import config, helpers
 
-from ..preprocessing.data_preprocessing import data_utils
+from ..preprocessing.data_preprocessing import data_utils, create_vectors_from_time_points
 from ..preprocessing.annotation.stimulus_driven_annotation.movies import processing_labels
 
 
@@ -405,7 +405,7 @@ class PatientAlignedMovieAnnotation(dj.Computed):
     """
 
     def make(self, key):
-        """Align indicator to PTS and derive start/stop in neural time."""
+        """Align all indicators of a session to PTS at once and derive start/stop in neural time."""
         patient_ids, session_nrs = MovieSession.fetch("patient_id", "session_nr")
         entries = (MovieAnnotation).fetch('KEY')
 
@@ -415,43 +415,40 @@ class PatientAlignedMovieAnnotation(dj.Computed):
                 
                 print(f"Patient {pat} session {sesh}..")
 
+                session = MovieSession & f"patient_id={pat}" & f"session_nr={sesh}"
+                already_aligned = set(zip(*(PatientAlignedMovieAnnotation & f"patient_id={pat}"
+                                            & f"session_nr={sesh}").fetch("label_name", "annotator_id")))
+
+                new_entries = []
                 for entry in entries:
-                    
-                    annotator_id = entry["annotator_id"]
-                    label_name = entry["label_name"]
-                    annotation_date = entry["annotation_date"]
-
-                    try:
-                        check = (PatientAlignedMovieAnnotation & f"patient_id={pat}" & f"session_nr={sesh}"
-                                    & f"label_name='{label_name}'" & f"annotator_id='{annotator_id}'").fetch("values")
-                        if check.any():
-                            print(f"    ... {label_name} already in database.")
-                            continue
-                        else:
-                            print(f"    ... Adding patient {pat} session {sesh} label {label_name} to database.")
-                            pass
-                    except:
-                        print(f"    ... Adding patient {pat} session {sesh} label {label_name} to database.")
-                        pass
-                    
-                    patient_pts = (MovieSession & f"patient_id={pat}" & f"session_nr={sesh}").fetch("pts")[0]
-                    neural_rectime = (MovieSession & f"patient_id={pat}" & f"session_nr={sesh}").fetch("neural_recording_time")[0]
-                    
-                    default_label = (MovieAnnotation & f"annotator_id='{annotator_id}'" & f"label_name='{label_name}'").fetch("indicator_function")[0]
-                    patient_aligned_label = match_label_to_patient_pts_time(default_label, patient_pts)
-                    values, starts, stops = create_vectors_from_time_points.get_start_stop_times_from_label(neural_rectime, 
-                                                                                            patient_aligned_label)
+                    if (entry["label_name"], entry["annotator_id"]) in already_aligned:
+                        print(f"    ... {entry['label_name']} already in database.")
+                        continue
+                    print(f"    ... Adding patient {pat} session {sesh} label {entry['label_name']} to database.")
+                    new_entries.append(entry)
 
-                    self.insert1({'patient_id': pat,
-                                    'session_nr': sesh,
-                                    'annotator_id': annotator_id,
-                                    'label_name': label_name,
-                                    'annotation_date': annotation_date,
-                                    'label_in_patient_time': np.array(patient_aligned_label),
-                                    'values': np.array(values),
-                                    'start_times': np.array(starts),
-                                    'stop_times': np.array(stops),
-                                    }, skip_duplicates=True)
+                if not new_entries:
+                    continue
+
+                patient_pts = session.fetch("pts")[0]
+                neural_rectime = session.fetch("neural_recording_time")[0]
+
+                # align all labels of the session with a single frame index lookup
+                annotation_keys, default_labels = (MovieAnnotation & new_entries).fetch("KEY", "indicator_function")
+                patient_aligned_labels = helpers.align_labels_to_pts(np.stack(default_labels), patient_pts)
+                values, starts, stops = create_vectors_from_time_points.get_start_stop_times_from_label(
+                    neural_rectime, patient_aligned_labels)
+
+                self.insert([{'patient_id': pat,
+                              'session_nr': sesh,
+                              'annotator_id': annotation_key["annotator_id"],
+                              'label_name': annotation_key["label_name"],
+                              'annotation_date': annotation_key["annotation_date"],
+                              'label_in_patient_time': patient_aligned_labels[i_label],
+                              'values': values[i_label],
+                              'start_times': starts[i_label],
+                              'stop_times': stops[i_label],
+                              } for i_label, annotation_key in enumerate(annotation_keys)], skip_duplicates=True)
 
 
 @epi_schema
@@ -470,7 +467,7 @@ class MovieSkips(dj.Computed):
     """
     
     def make(self, key):
-        """Detect non-continuous segments (skips) from watchlogs and DAQ logs."""
+        """Detect non-continuous segments (skips) from the aligned frames of ``MovieSession``."""
         patient_ids, session_nrs = MovieSession.fetch("patient_id", "session_nr")
 
         for i_pat, pat in enumerate(patient_ids):
@@ -489,35 +486,12 @@ class MovieSkips(dj.Computed):
                     print(f"    ... Adding patient {pat} session {sesh} to database.")
                     pass
 
-                main_patient_dir = Path(config.PATH_TO_PATIENT_DATA, str(pat), f"session_{sesh}")
-
-                session_info = np.load(main_patient_dir / "session_info.npy", allow_pickle=True)
-                date = session_info.item().get("date")
-                time = session_info.item().get("time")
-                time = datetime.strptime(time, '%H-%M-%S').strftime('%H:%M.%S')
-
-                path_wl =  main_patient_dir / "watchlogs" 
-                ffplay_file = next(path_wl.glob("ffplay*"), None)
-
-                if ffplay_file:
-                    print(" Found ffplay file:", ffplay_file)
-                else:
-                    print(" No ffplay file found in the watchlogs directory.")
-                    break
-
-                path_daq = main_patient_dir / "daq_files" 
-                daq_file = next(path_daq.glob("timedDAQ*"), None)
-                
-                if ffplay_file:
-                    print(" Found DAQ file:", daq_file)
-                else:
-                    print(" No DAQ file found in the daq_files directory.")
-                    break
-                    
-                path_events = main_patient_dir / "event_file" / "Events.npy"
-                time_conversion = data_utils.TimeConversion(path_to_wl=ffplay_file, path_to_dl=daq_file,
-                                                                    path_to_events=path_events)
-                starts, stops, values = time_conversion.convert_skips()
+                # the aligned frames are already stored, so no log has to be parsed again
+                pts, rectime = (MovieSession & f"patient_id={pat}" & f"session_nr={sesh}").fetch1(
+                    "pts", "neural_recording_time")
+                skips = data_utils.detect_skips(pts, rectime)
+                starts, stops, values = skips.start_times, skips.stop_times, skips.values
+                print(f" Found {len(skips) - 1} skips.")
 
                 self.insert1({'patient_id': pat, 
                             'session_nr': sesh,
@@ -602,6 +576,12 @@ class MoviePauses(dj.Computed):
 def populate_lfp_data_table() -> None:
     """Populate ``LFPData`` from ``lfp_data`` files under each session directory.
 
+    Channels are read either from pre-converted ``.npy`` dicts or directly from
+    Neuralynx ``.ncs`` files. ``LFPData`` keeps a whole channel in one row, so
+    ingest stays whole-channel: the memory-mapped records are converted chunk by
+    chunk into preallocated output arrays (:meth:`NcsChannel.read`), which hold
+    the full channel when it is inserted. Binning streams the ``.ncs`` records
+    instead (see ``binning.bin_lfp``).
     Skips already-inserted channel entries.
     """
 
@@ -632,19 +612,83 @@ def populate_lfp_data_table() -> None:
 
             for ds_file in path_ds_dir.iterdir():
                 
-                csc_nr = ds_file.name.split('_')[0][3:]
+                csc_nr = ds_file.stem.split('_')[0][3:]
                 region = channel_names[int(csc_nr)-1]
                 print(f"  .. adding csc {csc_nr}..")
-                ds_dict = np.load(ds_file, allow_pickle=True)
+
+                if ds_file.suffix.lower() == ".ncs":
+                    channel = data_utils.NcsChannel(ds_file)
+                    # one row per channel, so the channel is assembled in full
+                    timestamps, samples = channel.read()
+                    sample_rate = int(channel.sample_rate)
+                else:
+                    ds_dict = np.load(ds_file, allow_pickle=True)
+                    samples = ds_dict.item().get("samples")
+                    timestamps = ds_dict.item().get("timestamps")
+                    sample_rate = ds_dict.item().get("sample_rate")[0]
+
                 LFPData.insert1({
                     'patient_id': pat,
                     'session_nr': sesh,
                     'csc_nr': csc_nr,
-                    'samples': ds_dict.item().get("samples"),
-                    'timestamps': ds_dict.item().get("timestamps"),
-                    'sample_rate': ds_dict.item().get("sample_rate")[0],
+                    'samples': samples,
+                    'timestamps': timestamps,
+                    'sample_rate': sample_rate,
                     'brain_region': region
                 })
 
 
                 print(f"  .. csc {csc_nr} added.")
+
+
+def populate_movie_annotations_from_advene(
+    path_to_file: str,
+    annotator_id: str,
+    annotation_date: str,
+    category: str,
+    label_names: list = None,
+    streaming: bool = False,
+) -> None:
+    """Populate ``MovieAnnotation`` with all labels of one Advene json export.
+
+    The export is parsed once for all labels. Only labels listed in ``LabelName``
+    are added; labels already in the table are skipped.
+
+    Args:
+        path_to_file (str): Path to the Advene json export.
+        annotator_id (str): ID of the annotator (see ``Annotator``).
+        annotation_date (str): Date of the annotation, formatted ``%Y%m%d``.
+        category (str): Category of the labels, e.g. ``'character'``.
+        label_names (list, optional): If provided, only these labels are added.
+        streaming (bool): Parse the export incrementally, for very large files.
+    """
+
+    known_labels = set(LabelName.fetch("label_name"))
+    existing_labels = set((MovieAnnotation & f"annotator_id='{annotator_id}'").fetch("label_name"))
+
+    labels = processing_labels.read_advene_json(path_to_file, label_names, streaming)
+
+    for label_name, (values, start_times, stop_times) in labels.items():
+        if label_name not in known_labels:
+            print(f"    {label_name} is not in LabelName, skipping.")
+            continue
+        if label_name in existing_labels:
+            print(f"    {label_name} already in database.")
+            continue
+
+        print(f"    Adding {label_name}, category {category} to database...")
+        values = values.astype(int)
+        ind_func = processing_labels.make_label_from_start_stop_times(values, start_times, stop_times,
+                                                                      config.PTS_MOVIE_new)
+
+        print(f"    ... # of occurrences: {int(sum(values))}\n")
+
+        MovieAnnotation.insert1({'label_name': label_name,
+                                 'annotator_id': annotator_id,
+                                 'annotation_date': datetime.strptime(annotation_date, '%Y%m%d'),
+                                 'category': category,
+                                 'values': values,
+                                 'start_times': start_times,
+                                 'stop_times': stop_times,
+                                 'indicator_function': np.array(ind_func)
+                                 }, skip_duplicates=True)
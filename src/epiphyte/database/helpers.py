@@ -131,6 +131,29 @@ def extract_name_unit_id_from_unit_level_data_cleaning(
     return name, unit_id, annotator
 
 
+def align_labels_to_pts(
+    indicator_matrix: np.ndarray, patient_pts: np.ndarray, frame_duration: float = 0.04
+) -> np.ndarray:
+    """Align default label indicator functions to patient PTS frames.
+
+    The canonical frame index of every watched frame is computed once and
+    applied to all labels by fancy indexing.
+
+    Args:
+        indicator_matrix (np.ndarray): Indicator vectors (per canonical frame), of shape
+            ``(n_labels, N)`` or ``(N,)`` for a single label.
+        patient_pts (np.ndarray): Watched frame times in seconds, rounded to 2 decimals.
+        frame_duration (float): Duration of one canonical movie frame in seconds.
+
+    Returns:
+        np.ndarray: Indicator values of shape ``(n_labels, len(patient_pts))``
+        (or ``(len(patient_pts),)`` for a single label).
+    """
+
+    frame_indices = np.round(np.asarray(patient_pts) / frame_duration).astype(np.int64) - 1
+    return np.asarray(indicator_matrix)[..., frame_indices]
+
+
 def match_label_to_patient_pts_time(
     default_label: np.ndarray, patient_pts: np.ndarray
 ) -> List[int]:
@@ -144,10 +167,7 @@ def match_label_to_patient_pts_time(
         List[int]: Indicator value for each patient frame.
     """
 
-    return [
-        default_label[int(np.round(frame / 0.04, 0)) - 1]
-        for _, frame in enumerate(patient_pts)
-    ]
+    return align_labels_to_pts(default_label, patient_pts).tolist()
 
 
 def get_list_of_patient_ids(patient_dict: Sequence[Dict[str, Any]]) -> List[int]:
@@ -26,13 +26,51 @@ def get_spike_times(patient_id, session_nr, unit_id):
     return (db.SpikeData & key).fetch1("spike_times")
 
 
+def get_session_spike_times(patient_id, session_nr):
+    key = dict(patient_id=patient_id, session_nr=session_nr)
+    return (db.SpikeData & key).fetch("unit_id", "spike_times", order_by="unit_id")
+
+
 def get_spike_amps(patient_id, session_nr, unit_id):
     key = dict(patient_id=patient_id, session_nr=session_nr, unit_id=unit_id)
     return (db.SpikeData & key).fetch1("spike_amps")
 
 
+def get_lfp_data(patient_id, session_nr, csc_nr):
+    key = dict(patient_id=patient_id, session_nr=session_nr, csc_nr=csc_nr)
+    return (db.LFPData & key).fetch1("samples", "timestamps", "sample_rate")
+
+
 def get_patient_aligned_label_info(patient_id, session_nr, label_name):
     key = dict(patient_id=patient_id, session_nr=session_nr, label_name=label_name)
     return (db.PatientAlignedMovieAnnotation & key).fetch1(
         "values", "start_times", "stop_times"
     )
+
+
+def get_movie_annotation_keys():
+    return db.MovieAnnotation.fetch("KEY", order_by=["label_name", "annotator_id", "annotation_date"])
+
+
+def get_movie_annotation_segments():
+    return db.MovieAnnotation.fetch(
+        "KEY", "values", "start_times", "stop_times", order_by=["label_name", "annotator_id", "annotation_date"]
+    )
+
+
+def get_patient_aligned_annotation_keys(patient_id, session_nr):
+    key = dict(patient_id=patient_id, session_nr=session_nr)
+    return (db.PatientAlignedMovieAnnotation & key).fetch(
+        "KEY", order_by=["label_name", "annotator_id", "annotation_date"]
+    )
+
+
+def get_patient_aligned_annotation_segments(patient_id, session_nr):
+    key = dict(patient_id=patient_id, session_nr=session_nr)
+    return (db.PatientAlignedMovieAnnotation & key).fetch(
+        "KEY", "values", "start_times", "stop_times", order_by=["label_name", "annotator_id", "annotation_date"]
+    )
+
+
+def get_movie_indicator_functions(keys):
+    return (db.MovieAnnotation & keys).fetch("KEY", "indicator_function")
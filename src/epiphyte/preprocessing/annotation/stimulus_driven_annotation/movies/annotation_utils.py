@@ -2,28 +2,121 @@
 
 Provides utilities to split neural activity by label values for downstream
 analysis and visualization.
+
+Splitting is done with :class:`LabelGroups`: the label vector is sorted once
+(stable argsort), the activity is reordered once along the bin axis, and every
+label value then maps to a contiguous slice (a view) of the reordered activity.
 """
 
-import sys
-from typing import Dict, Iterable, List, Optional
-from types import SimpleNamespace
+from functools import lru_cache
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
-import inflect
 
-# Local application imports 
-from database.db_setup import *
-import preprocessing.data_preprocessing.binning as binning
-import preprocessing.data_preprocessing.create_vectors_from_time_points as create
+
+@lru_cache(maxsize=1)
+def _number_engine():
+    # inflect is only needed for the optional value names
+    import inflect
+    return inflect.engine()
+
+
+@lru_cache(maxsize=None)
+def value_name(value: int) -> str:
+    """Convert a label value to its word, for easy referencing during analysis (e.g. ``1 -> 'one'``).
+
+    Args:
+        value (int): Label value.
+
+    Returns:
+        str: Value as word. Requires the optional ``inflect`` package.
+    """
+    return _number_engine().number_to_words(int(value))
+
+
+class LabelGroups(object):
+    """Groups of time bins sharing the same label value, from one stable argsort.
+
+    Attributes:
+        order (np.ndarray): Bin indices sorted by label value (stable, so ascending within a group).
+        values (np.ndarray): Unique label values.
+        group_starts (np.ndarray): Position of the first bin of each value in ``order``.
+        counts (np.ndarray): Number of bins per value.
+    """
+
+    def __init__(self, binned_label: np.ndarray) -> None:
+        binned_label = np.asarray(binned_label)
+        self.order = np.argsort(binned_label, kind="stable")
+        self.values, self.group_starts, self.counts = np.unique(binned_label[self.order], return_index=True,
+                                                                return_counts=True)
+
+    def group_slice(self, value: int) -> slice:
+        """Slice of ``order`` holding the bins of one value (empty if the value does not occur)."""
+        position = np.searchsorted(self.values, value)
+        if position == len(self.values) or self.values[position] != value:
+            return slice(0, 0)
+        return slice(self.group_starts[position], self.group_starts[position] + self.counts[position])
+
+    def indices(self, value: int) -> np.ndarray:
+        """Bin indices (ascending) at which the label takes ``value``."""
+        return self.order[self.group_slice(value)]
+
+    def split(
+        self,
+        binned_activity: np.ndarray,
+        values: Optional[Iterable[int]] = None,
+        axis: int = 0,
+    ) -> Dict[Hashable, np.ndarray]:
+        """Split activity into one array per label value.
+
+        The activity is reordered once; the returned arrays are views into that
+        single reordered copy.
+
+        Args:
+            binned_activity (np.ndarray): Binned activity, bins along ``axis``.
+            values (Optional[Iterable[int]]): If provided, only these label values are used.
+            axis (int): Bin axis of ``binned_activity`` (e.g. ``1`` for units x bins).
+
+        Returns:
+            Dict[Hashable, np.ndarray]: Mapping ``{value: activity_subset}``.
+        """
+        grouped = np.take(binned_activity, self.order, axis=axis)
+        values = self.values if values is None else values
+
+        index = [slice(None)] * grouped.ndim
+        ret_vectors = {}
+        for value in values:
+            index[axis] = self.group_slice(value)
+            ret_vectors[value] = grouped[tuple(index)]
+
+        return ret_vectors
 
 
-# split activity based on condition 
+def joint_label(binned_labels: Union[Sequence[np.ndarray], np.ndarray]) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """Combine several binned labels into one integer label of value combinations.
+
+    Args:
+        binned_labels (Union[Sequence[np.ndarray], np.ndarray]): Labels aligned to the same bins,
+            one per row.
+
+    Returns:
+        Tuple[np.ndarray, List[np.ndarray]]: ``(codes, label_values)``: one code per bin (the
+        raveled index of the value combination) and the unique values of every label.
+    """
+    uniques, inverses = zip(*[np.unique(label, return_inverse=True) for label in binned_labels])
+    codes = np.ravel_multi_index([inverse.ravel() for inverse in inverses], [len(values) for values in uniques])
+    return codes, list(uniques)
+
+
+# split activity based on condition
 
 def split_activity_by_value(
     binned_activity: np.ndarray,
     binned_label: np.ndarray,
     specific_values: Optional[Iterable[int]] = None,
-) -> Dict[str, np.ndarray]:
+    axis: int = 0,
+    use_names: bool = True,
+) -> Dict[Union[str, int], np.ndarray]:
     """Split binned activity by the values in a binned label vector.
 
     Example:
@@ -33,40 +126,64 @@ def split_activity_by_value(
         activity is split per unique value.
 
     Args:
-        binned_activity (np.ndarray): Binned neural activity (shape ``(N, ...)``).
+        binned_activity (np.ndarray): Binned neural activity (shape ``(N, ...)``, or bins along ``axis``).
         binned_label (np.ndarray): Binned label aligned to the activity (length ``N``).
         specific_values (Optional[Iterable[int]]): If provided, only these label values are used.
-        
+        axis (int): Bin axis of ``binned_activity``, e.g. ``1`` to split a units x bins matrix.
+        use_names (bool): If ``True``, keys are the values as words (``'zero'``, ``'one'``, ...),
+            otherwise the values themselves.
+
     Returns:
-        Dict[str, np.ndarray]: Mapping ``{value_name: activity_subset}``.
+        Dict[Union[str, int], np.ndarray]: Mapping ``{value_name: activity_subset}``.
     """
-    # Set up for number --> word converstion 
-    alph = inflect.engine()
-    
-    if not specific_values:
-        values = np.unique(binned_label)
-        
-        ret_vectors = {}
-        
-        for value in values:
-            
-            indices = np.isin(binned_label, value)
-            activity_from_val = binned_activity[indices]
-            
-            # Convert value number to the word, for easy referencing during analysis
-            name = alph.number_to_words(int(value))
-            
-            ret_vectors[name] = activity_from_val
-            
-    if specific_values:
-        
-        ret_vectors = {}
-        
-        for value in specific_values:
-            indices = np.isin(binned_label, value)
-            activity_from_val = binned_activity[indices]
-            
-            name = alph.number_to_words(int(value))
-            ret_vectors[name] = activity_from_val
-            
-    return ret_vectors
\ No newline at end of file
+    specific_values = [] if specific_values is None else list(specific_values)
+    split = LabelGroups(binned_label).split(binned_activity, specific_values or None, axis)
+
+    if not use_names:
+        return {value.item() if isinstance(value, np.generic) else value: activity
+                for value, activity in split.items()}
+    return {value_name(value): activity for value, activity in split.items()}
+
+
+def split_activity_by_labels(
+    binned_activity: np.ndarray,
+    binned_labels: Union[Sequence[np.ndarray], np.ndarray],
+    specific_values: Optional[Iterable[tuple]] = None,
+    axis: int = 0,
+) -> Dict[tuple, np.ndarray]:
+    """Split binned activity by the joint values of several binned labels.
+
+    Example:
+        With labels ``[a, b]``, the key ``(1, 0)`` holds the bins where ``a`` is
+        present and ``b`` is not ("A and not B").
+
+    Args:
+        binned_activity (np.ndarray): Binned neural activity, bins along ``axis``.
+        binned_labels (Union[Sequence[np.ndarray], np.ndarray]): Labels aligned to the activity,
+            one per row.
+        specific_values (Optional[Iterable[tuple]]): If provided, only these value combinations are used.
+        axis (int): Bin axis of ``binned_activity``.
+
+    Returns:
+        Dict[tuple, np.ndarray]: Mapping ``{(value_label_0, value_label_1, ...): activity_subset}``.
+    """
+    codes, label_values = joint_label(binned_labels)
+    shape = [len(values) for values in label_values]
+    groups = LabelGroups(codes)
+
+    if specific_values is None:
+        combinations = [tuple(values[i].item() for values, i in zip(label_values, np.unravel_index(code, shape)))
+                        for code in groups.values]
+        specific_codes = groups.values
+    else:
+        combinations = [tuple(values) for values in specific_values]
+        specific_codes = []
+        for combination in combinations:
+            positions = [np.searchsorted(values, value) for values, value in zip(label_values, combination)]
+            found = all(position < len(values) and values[position] == value
+                        for values, value, position in zip(label_values, combination, positions))
+            # combinations that never occur get an empty group
+            specific_codes.append(np.ravel_multi_index(positions, shape) if found else -1)
+
+    split = groups.split(binned_activity, specific_codes, axis)
+    return {combination: split[code] for combination, code in zip(combinations, specific_codes)}
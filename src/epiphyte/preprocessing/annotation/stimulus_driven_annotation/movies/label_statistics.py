@@ -0,0 +1,182 @@
+"""Overlap and co-occurrence statistics across all movie labels.
+
+Labels are kept run-length encoded (values, start and stop times as stored in
+``MovieAnnotation`` / ``PatientAlignedMovieAnnotation``). The start and stop
+times of all labels split the movie into pieces on which every label is
+constant; the pairwise overlap durations then follow from one weighted matrix
+product over the labels x pieces activity matrix.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from epiphyte.database import query_functions
+import epiphyte.preprocessing.annotation.stimulus_driven_annotation.movies.rle_label as rle_label
+
+CHUNK_PIECES = 8192
+
+_cooccurrence_cache: Dict[tuple, Tuple[np.ndarray, List[Tuple[str, str]]]] = {}
+
+
+def label_activity(
+    values: Sequence[np.ndarray],
+    start_times: Sequence[np.ndarray],
+    stop_times: Sequence[np.ndarray],
+    default_value: int = 0,
+    frame_duration: float = rle_label.FRAME_DURATIONS["pts"],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Build the labels x pieces activity matrix of many run-length encoded labels.
+
+    Segments need not be contiguous: a segment covers its start up to and
+    including its stop frame, i.e. until ``stop + frame_duration``, and gaps
+    between segments are ``default_value``. Where segments of a label overlap,
+    the later one wins, as in ``make_label_from_start_stop_times``.
+
+    Args:
+        values (Sequence[np.ndarray]): Segment values, one array per label.
+        start_times (Sequence[np.ndarray]): Segment start times, one array per label.
+        stop_times (Sequence[np.ndarray]): Segment stop times (inclusive), one array per label.
+        default_value (int): Value meaning "label not present".
+        frame_duration (float): Duration of one frame in the time base of the segments.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: ``(activity, durations)``: boolean matrix of shape
+        ``(n_labels, n_pieces)`` and the duration of every piece.
+    """
+    n_labels = len(values)
+    lengths = np.array([len(label_values) for label_values in values])
+    if not lengths.sum():
+        return np.zeros((n_labels, 0), dtype=bool), np.zeros(0)
+
+    starts = np.concatenate([np.asarray(times, dtype=float) for times in start_times])
+    ends = np.concatenate([np.asarray(times, dtype=float) for times in stop_times]) + frame_duration
+    segment_values = np.concatenate([np.asarray(label_values) for label_values in values])
+    label_index = np.repeat(np.arange(n_labels), lengths)
+
+    # piece bounds at every start and end; bounds closer than half a frame (float error) are one
+    tolerance = frame_duration / 2
+    bounds = np.unique(np.concatenate((starts, ends)))
+    bounds = bounds[np.concatenate(([True], np.diff(bounds) > tolerance))]
+    durations = np.diff(bounds)
+    n_pieces = len(durations)
+
+    first_piece = np.searchsorted(bounds, starts + tolerance, side="right") - 1
+    end_piece = np.searchsorted(bounds, ends + tolerance, side="right") - 1
+
+    # union of the present segments of every label
+    present = segment_values != default_value
+    delta = np.zeros((n_labels, n_pieces + 1), dtype=np.int16)
+    np.add.at(delta, (label_index[present], first_piece[present]), 1)
+    np.add.at(delta, (label_index[present], end_piece[present]), -1)
+    activity = np.cumsum(delta[:, :-1], axis=1) > 0
+
+    # segments with the default value blank out earlier segments: repaint those labels in order
+    for label in np.unique(label_index[~present]):
+        segments = np.flatnonzero(label_index == label)
+        activity[label] = False
+        for segment in segments:
+            activity[label, first_piece[segment]:end_piece[segment]] = present[segment]
+
+    return activity, durations
+
+
+def overlap_matrix(activity: np.ndarray, durations: np.ndarray, chunk_pieces: int = CHUNK_PIECES) -> np.ndarray:
+    """Pairwise overlap durations from an activity matrix.
+
+    Args:
+        activity (np.ndarray): Boolean matrix of shape ``(n_labels, n_pieces)``.
+        durations (np.ndarray): Duration of every piece.
+        chunk_pieces (int): Number of pieces multiplied at once, bounds the memory use.
+
+    Returns:
+        np.ndarray: Symmetric matrix of shape ``(n_labels, n_labels)``; the diagonal holds
+        the total duration each label is present.
+    """
+    n_labels = activity.shape[0]
+    overlap = np.zeros((n_labels, n_labels))
+
+    for first in range(0, activity.shape[1], chunk_pieces):
+        chunk = activity[:, first:first + chunk_pieces].astype(float)
+        overlap += (chunk * durations[first:first + chunk_pieces]) @ chunk.T
+
+    return overlap
+
+
+def cooccurrence_fractions(overlap: np.ndarray) -> np.ndarray:
+    """Fraction of the time label ``i`` is present during which label ``j`` is present too.
+
+    Args:
+        overlap (np.ndarray): Output of :func:`overlap_matrix`.
+
+    Returns:
+        np.ndarray: Matrix with entry ``[i, j] = overlap[i, j] / overlap[i, i]``
+        (``NaN`` for labels that are never present).
+    """
+    presence = np.diag(overlap)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(presence[:, None] > 0, overlap / presence[:, None], np.nan)
+
+
+def label_cooccurrence(
+    patient_id: Optional[int] = None,
+    session_nr: Optional[int] = None,
+    labels: Optional[List[str]] = None,
+) -> Tuple[np.ndarray, List[Tuple[str, str]]]:
+    """Overlap durations between all labels and annotators of the movie or of a session.
+
+    Without ``patient_id``/``session_nr`` the labels of ``MovieAnnotation`` are used
+    (durations in seconds of movie time); otherwise the labels aligned to the
+    session in ``PatientAlignedMovieAnnotation`` (durations in ms of neural
+    recording time). Results are cached per annotation version, i.e. they are
+    recomputed once a label gets a new annotation date. The cached overlap
+    matrix is read-only; use ``overlap.copy()`` to modify it.
+
+    Args:
+        patient_id (Optional[int]): ID of the patient.
+        session_nr (Optional[int]): Session number of the experiment.
+        labels (Optional[List[str]]): If provided, only these label names are used.
+
+    Returns:
+        Tuple[np.ndarray, List[Tuple[str, str]]]: ``(overlap, label_keys)`` with the overlap
+        matrix of :func:`overlap_matrix` and ``(label_name, annotator_id)`` per row.
+    """
+    if patient_id is None:
+        annotation_keys = query_functions.get_movie_annotation_keys()
+    else:
+        annotation_keys = query_functions.get_patient_aligned_annotation_keys(patient_id, session_nr)
+
+    if labels is not None:
+        annotation_keys = [key for key in annotation_keys if key["label_name"] in labels]
+
+    versions = tuple((key["label_name"], key["annotator_id"], str(key["annotation_date"])) for key in annotation_keys)
+    cache_key = (patient_id, session_nr, versions)
+    if cache_key in _cooccurrence_cache:
+        overlap, label_keys = _cooccurrence_cache[cache_key]
+        return overlap, list(label_keys)
+
+    if patient_id is None:
+        keys, values, start_times, stop_times = query_functions.get_movie_annotation_segments()
+        frame_duration = rle_label.FRAME_DURATIONS["pts"]
+    else:
+        keys, values, start_times, stop_times = query_functions.get_patient_aligned_annotation_segments(patient_id,
+                                                                                                        session_nr)
+        frame_duration = rle_label.FRAME_DURATIONS["neural"]
+
+    wanted = set(versions)
+    selected = [i for i, key in enumerate(keys)
+                if (key["label_name"], key["annotator_id"], str(key["annotation_date"])) in wanted]
+
+    activity, durations = label_activity([values[i] for i in selected], [start_times[i] for i in selected],
+                                         [stop_times[i] for i in selected], frame_duration=frame_duration)
+    overlap = overlap_matrix(activity, durations)
+    label_keys = [(keys[i]["label_name"], keys[i]["annotator_id"]) for i in selected]
+
+    overlap.setflags(write=False)
+    _cooccurrence_cache[cache_key] = (overlap, label_keys)
+    return overlap, list(label_keys)
+
+
+def clear_cooccurrence_cache() -> None:
+    """Drop all cached results of :func:`label_cooccurrence`."""
+    _cooccurrence_cache.clear()
@@ -0,0 +1,198 @@
+"""Memory-mapped store of frame-level movie labels.
+
+All indicator functions of ``MovieAnnotation`` are kept in one contiguous
+labels x frames ``.npy`` file in the smallest sufficient dtype, next to a json
+index of the label rows. The file is memory-mapped, so selecting a label is a
+zero-copy row view instead of a database fetch.
+
+Example:
+    ```python
+    store = FrameLabelStore()
+    store.sync()                       # fetches only new or changed labels
+    summer = store.label("summer")     # row view, one value per movie frame
+    ```
+"""
+
+import json
+import os
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from epiphyte.database import config, query_functions
+
+LABELS_FILENAME = "frame_labels.npy"
+INDEX_FILENAME = "frame_labels_index.json"
+
+
+def smallest_dtype(labels: np.ndarray) -> np.dtype:
+    """Smallest integer dtype (or bool) that holds all values of a label matrix.
+
+    Args:
+        labels (np.ndarray): Integer label values.
+
+    Returns:
+        np.dtype: ``bool`` for 0/1 labels, otherwise the smallest fitting integer dtype.
+    """
+    if labels.size == 0:
+        return np.dtype(bool)
+
+    low, high = int(np.min(labels)), int(np.max(labels))
+    if low >= 0 and high <= 1:
+        return np.dtype(bool)
+    for dtype in (np.uint8, np.uint16, np.uint32) if low >= 0 else (np.int8, np.int16, np.int32):
+        if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def _annotation_version(key: dict) -> List[str]:
+    return [key["label_name"], key["annotator_id"], str(key["annotation_date"])]
+
+
+class FrameLabelStore(object):
+    """Labels x frames matrix of all movie annotations, memory-mapped from disk.
+
+    Attributes:
+        directory (str): Folder holding the matrix and its index.
+        index (List[List[str]]): ``[label_name, annotator_id, annotation_date]`` per row.
+        labels (Optional[np.memmap]): Read-only labels x frames matrix, ``None`` before the first sync.
+    """
+
+    def __init__(self, directory: Optional[str] = None) -> None:
+        self.directory = config.PATH_TO_LABEL_STORE if directory is None else directory
+        self.index = []
+        self.labels = None
+        self._open()
+
+    @property
+    def labels_path(self) -> str:
+        return os.path.join(self.directory, LABELS_FILENAME)
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.directory, INDEX_FILENAME)
+
+    def _open(self) -> None:
+        self.index, self.labels = [], None
+        if not (os.path.exists(self.labels_path) and os.path.exists(self.index_path)):
+            return
+        with open(self.index_path, "r") as handle:
+            index = json.load(handle)
+        labels = np.load(self.labels_path, mmap_mode="r")
+
+        # the two files are swapped in one after the other, a crash in between leaves them inconsistent
+        expected_shape = (index.get("n_rows", len(index["rows"])), index["n_frames"])
+        if labels.shape != expected_shape or len(index["rows"]) != expected_shape[0] or \
+                labels.dtype != np.dtype(index["dtype"]):
+            print("Label store in {} is inconsistent (matrix {} {}, index {} {}), the next sync rebuilds it.".format(
+                self.directory, labels.shape, labels.dtype, expected_shape, index["dtype"]))
+            return
+        self.index, self.labels = index["rows"], labels
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def label_names(self) -> List[str]:
+        """Label name of every row."""
+        return [row[0] for row in self.index]
+
+    def rows(self, label_name: str, annotator_id: Optional[str] = None) -> List[int]:
+        """Row numbers of a label, optionally of one annotator only."""
+        return [i for i, (name, annotator, _) in enumerate(self.index)
+                if name == label_name and (annotator_id is None or annotator == annotator_id)]
+
+    def label(self, label_name: str, annotator_id: Optional[str] = None) -> np.ndarray:
+        """Frame-level label as a zero-copy view of the store.
+
+        Args:
+            label_name (str): Name of the label.
+            annotator_id (Optional[str]): Annotator, required if several annotators labelled it.
+
+        Returns:
+            np.ndarray: One value per movie frame.
+        """
+        rows = self.rows(label_name, annotator_id)
+        if len(rows) != 1:
+            raise KeyError("Expected one row for label '{}' (annotator {}), found {}.".format(
+                label_name, annotator_id, len(rows)))
+        return self.labels[rows[0]]
+
+    def select(self, label_names: Sequence[str]) -> np.ndarray:
+        """Stack several labels (first row per name) into a labels x frames array.
+
+        Consecutive rows are returned as a view, any other selection as a copy.
+
+        Raises:
+            KeyError: If a label is not in the store.
+        """
+        rows = []
+        for label_name in label_names:
+            label_rows = self.rows(label_name)
+            if not label_rows:
+                raise KeyError("Label '{}' is not in the store.".format(label_name))
+            rows.append(label_rows[0])
+        if rows and rows == list(range(rows[0], rows[0] + len(rows))):
+            return self.labels[rows[0]:rows[-1] + 1]
+        return self.labels[rows]
+
+    def sync(self) -> Dict[str, int]:
+        """Bring the store up to date with ``MovieAnnotation``.
+
+        Only labels that are new or have a new annotation date are fetched; rows
+        of unchanged labels are copied from the current file. The matrix and the
+        index are written to temporary files first and then swapped in; the
+        index records the matrix shape and dtype, so a store left half-swapped
+        is detected on opening and rebuilt by the next sync.
+
+        Returns:
+            Dict[str, int]: Number of ``fetched``, ``kept`` and ``removed`` rows.
+        """
+        keys = query_functions.get_movie_annotation_keys()
+        new_index = [_annotation_version(key) for key in keys]
+        if new_index == self.index:
+            return {"fetched": 0, "kept": len(self.index), "removed": 0}
+
+        old_rows = {tuple(row): i for i, row in enumerate(self.index)}
+        missing = [key for key, version in zip(keys, new_index) if tuple(version) not in old_rows]
+
+        fetched = {}
+        if missing:
+            fetched_keys, indicator_functions = query_functions.get_movie_indicator_functions(missing)
+            fetched = {tuple(_annotation_version(key)): np.asarray(function)
+                       for key, function in zip(fetched_keys, indicator_functions)}
+
+        if self.labels is not None:
+            n_frames = self.labels.shape[1]
+        else:
+            n_frames = len(next(iter(fetched.values()))) if fetched else 0
+
+        dtypes = [np.dtype(bool)] + [smallest_dtype(function) for function in fetched.values()]
+        if self.labels is not None:
+            dtypes.append(self.labels.dtype)
+        dtype = np.result_type(*dtypes)
+
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_labels_path = self.labels_path + ".tmp.npy"
+        matrix = np.lib.format.open_memmap(tmp_labels_path, mode="w+", dtype=dtype, shape=(len(new_index), n_frames))
+        for i, version in enumerate(new_index):
+            version = tuple(version)
+            matrix[i] = fetched[version] if version in fetched else self.labels[old_rows[version]]
+        matrix.flush()
+        del matrix
+
+        tmp_index_path = self.index_path + ".tmp"
+        with open(tmp_index_path, "w") as handle:
+            json.dump({"n_rows": len(new_index), "n_frames": n_frames, "dtype": np.dtype(dtype).str,
+                       "rows": new_index}, handle)
+
+        n_kept = len(new_index) - len(fetched)
+        n_removed = len(self.index) - n_kept
+
+        self.labels = None
+        os.replace(tmp_labels_path, self.labels_path)
+        os.replace(tmp_index_path, self.index_path)
+        self._open()
+
+        print(f"Label store: fetched {len(fetched)}, kept {n_kept}, removed {n_removed} labels.")
+        return {"fetched": len(fetched), "kept": n_kept, "removed": n_removed}
@@ -119,3 +119,65 @@ def rm_pauses_spikes(
         output = unit_no_pauses
     
     return output
+
+
+def in_pauses(times: np.ndarray, start: np.ndarray, stop: np.ndarray) -> np.ndarray:
+    """Flag time points that fall into paused playback.
+
+    Vectorized counterpart of the membership test in :func:`rm_pauses_spikes`;
+    pause bounds are inclusive and pauses may overlap.
+
+    Args:
+        times (np.ndarray): Time points (ms).
+        start (np.ndarray): Pause starts (ms).
+        stop (np.ndarray): Pause stops (ms).
+    Returns:
+        np.ndarray: Boolean mask, ``True`` where a time point lies within a pause.
+    """
+    times = np.asarray(times)
+    start = np.asarray(start, dtype=float)
+    stop = np.asarray(stop, dtype=float)
+
+    if start.size == 0:
+        return np.zeros(times.shape, dtype=bool)
+
+    order = np.argsort(start, kind="stable")
+    start = start[order]
+    # running maximum so that a pause nested in a longer one cannot end it early
+    stop = np.maximum.accumulate(stop[order])
+
+    index = np.searchsorted(start, times, side="right") - 1
+    return (index >= 0) & (times <= stop[np.clip(index, 0, None)])
+
+
+def overlaps_pauses(
+    interval_starts: np.ndarray,
+    interval_stops: np.ndarray,
+    start: np.ndarray,
+    stop: np.ndarray,
+) -> np.ndarray:
+    """Flag intervals that overlap paused playback.
+
+    Args:
+        interval_starts (np.ndarray): Interval starts (ms).
+        interval_stops (np.ndarray): Interval stops (ms).
+        start (np.ndarray): Pause starts (ms).
+        stop (np.ndarray): Pause stops (ms).
+    Returns:
+        np.ndarray: Boolean mask, ``True`` where an interval shares any time with a pause.
+    """
+    interval_starts = np.asarray(interval_starts)
+    interval_stops = np.asarray(interval_stops)
+    start = np.asarray(start, dtype=float)
+    stop = np.asarray(stop, dtype=float)
+
+    if start.size == 0:
+        return np.zeros(interval_starts.shape, dtype=bool)
+
+    order = np.argsort(start, kind="stable")
+    start = start[order]
+    stop = np.maximum.accumulate(stop[order])
+
+    # latest pause starting before the interval ends must not stop before it begins
+    index = np.searchsorted(start, interval_stops, side="right") - 1
+    return (index >= 0) & (stop[np.clip(index, 0, None)] >= interval_starts)
@@ -1,38 +1,47 @@
 import json
-from typing import Sequence, Union, List
+import os
+import re
+from typing import Dict, Iterator, Optional, Sequence, Tuple, Union, List
 import numpy as np
 from collections.abc import Sequence
 from ....data_preprocessing import create_vectors_from_time_points
+from . import rle_label
 
 
 def make_label_from_start_stop_times(
-    values: Sequence[int],
-    start_times: Sequence[float],
-    stop_times: Sequence[float],
-    ref_vec: Union[Sequence[float], np.ndarray],
+    values: Union[Sequence[int], "rle_label.RLELabel"],
+    start_times: Optional[Sequence[float]] = None,
+    stop_times: Optional[Sequence[float]] = None,
+    ref_vec: Optional[Union[Sequence[float], np.ndarray]] = None,
     default_value: int = 0,
-) -> List[int]:
+) -> Union[List[int], int]:
     """
     This function takes a vector with tuples with start and stop times and converts it to the default label
 
     Args:
-        ref_vec (np.ndarray): reference vector, e.g. either PTS of movie or neural recording time of patient
+        ref_vec (np.ndarray): reference vector, e.g. either PTS of movie or neural recording time of patient (required)
         default_value (int): default value of label, which shall be added to all gaps in start stop times
-        values (list): vector with all values
-        start_times (list): vector with all start_times of segments
-        stop_times (list): vector with all stop times of segments
+        values (list | RLELabel): vector with all values, or an ``RLELabel`` (start and stop times are then taken from it)
+        start_times (list): vector with all start_times of segments, if ``values`` is not an ``RLELabel``
+        stop_times (list): vector with all stop times of segments, if ``values`` is not an ``RLELabel``
     Returns:
         list[int] | int: Label vector, or ``-1`` on error.
     """
+    values, start_times, stop_times = rle_label.unpack_label(values, start_times, stop_times)
+    if start_times is None or stop_times is None or ref_vec is None:
+        print("start_times, stop_times (or an RLELabel) and ref_vec are required")
+        return -1
     if not (len(values) == len(start_times) == len(stop_times)):
         print("vectors values, starts and stops have to be the same length")
         return -1
     
     default_label = [default_value] * len(ref_vec)
+    start_indices = create_vectors_from_time_points.nearest_indices(ref_vec, start_times)
+    end_indices = create_vectors_from_time_points.nearest_indices(ref_vec, stop_times)
     
     for i in range(len(values)):
-        start_index_in_default_vec = create_vectors_from_time_points.get_index_nearest_timestamp_in_vector(np.array(ref_vec), start_times[i])
-        end_index_in_default_vec = create_vectors_from_time_points.get_index_nearest_timestamp_in_vector(np.array(ref_vec), stop_times[i])
+        start_index_in_default_vec = start_indices[i]
+        end_index_in_default_vec = end_indices[i]
 
         default_label[start_index_in_default_vec:(end_index_in_default_vec+1)] = \
             [int(values[i])]*(end_index_in_default_vec - start_index_in_default_vec + 1)
@@ -40,6 +49,33 @@ def make_label_from_start_stop_times(
     return default_label
 
 
+ADVENE_ANNOTATION_XML = '<annotation id="{}{}" type="#{}"><millisecond-fragment begin="{}" end="{}"/><content>num={}</content></annotation>'
+
+
+def iter_advene_xml(
+    id_name: str,
+    start_end_times_vector: Sequence[Tuple[float, float]],
+    label_name: str,
+    values: Optional[Sequence[int]] = None,
+) -> Iterator[str]:
+    """
+    Generate the XML annotation elements of one label for the movie annotation tool Advene, one element at a time.
+
+    Args:
+        id_name (str): name of ID in XML file
+        start_end_times_vector (list): input vector that contains the start and end times of the label in seconds
+        label_name (str): the name of the label how it shall be displayed in the GUI of Advene
+        values (list): value of each segment, written to the content of the annotation; ``1`` if not provided
+    Yields:
+        str: one ``<annotation>`` element
+    """
+    if values is None:
+        values = [1] * len(start_end_times_vector)
+
+    for id_, ((start, end), value) in enumerate(zip(start_end_times_vector, values)):
+        yield ADVENE_ANNOTATION_XML.format(id_name, id_, label_name, int(start * 1000), int(end * 1000), value)
+
+
 def create_xml_for_advene(id_name: str, start_end_times_vector: list[tuple[float, float]], label_name: str) -> str:
     """
     This function creates an XML string, which can be imported to the movie annotation tool Advene
@@ -52,22 +88,180 @@ def create_xml_for_advene(id_name: str, start_end_times_vector: list[tuple[float
     Returns:
         str: an XML string that can be copied to the content.xml file and loaded to Advene
     """
-    new_annotations = ""
-    id_ = 0
+    return "".join(iter_advene_xml(id_name, start_end_times_vector, label_name))
+
 
-    for start, end in start_end_times_vector:
-        string_new_annotation = '<annotation id="{}{}" type="#{}"><millisecond-fragment begin="{}" end="{}"/><content>num=1</content></annotation>'.format(
-            id_name, id_, label_name, int(start * 1000), int(end * 1000))
+def write_advene_xml(file, annotation_rows, default_value: int = 0) -> int:
+    """
+    Stream the segments of many labels to an Advene XML file, e.g. straight from ``MovieAnnotation`` rows.
 
-        new_annotations += string_new_annotation
+    Only segments in which a label is present (value different from ``default_value``) are written;
+    the value goes to the content of the annotation. Rows are consumed one at a time, so a query
+    result or generator of rows can be exported without holding all XML in memory.
 
-        id_ += 1
-    return new_annotations
+    Example:
+        ```python
+        with open("content_annotations.xml", "w") as handle:
+            write_advene_xml(handle, MovieAnnotation.fetch(as_dict=True))
+        ```
+
+    Args:
+        file (str | file object): path or text file handle the annotation elements are written to
+        annotation_rows (iterable): dicts with ``label_name``, ``values``, ``start_times`` and ``stop_times``
+            (start and stop times in seconds of movie time); ``annotator_id`` is used in the IDs if present
+        default_value (int): value meaning "label not present"
+    Returns:
+        int: number of annotation elements written
+    """
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'w') as handle:
+            return write_advene_xml(handle, annotation_rows, default_value)
+
+    n_written = 0
+    for row in annotation_rows:
+        values = np.asarray(row["values"])
+        present = values != default_value
+        start_end_times = list(zip(np.asarray(row["start_times"])[present], np.asarray(row["stop_times"])[present]))
+        id_name = "{}_{}_".format(row["label_name"], row.get("annotator_id", ""))
+
+        file.writelines(iter_advene_xml(id_name, start_end_times, row["label_name"], values[present].tolist()))
+        n_written += len(start_end_times)
+
+    return n_written
+
+
+ADVENE_CHUNK_SIZE = 1 << 20
+
+_ANNOTATIONS_KEY = re.compile(r'"annotations"\s*:\s*\[')
+_advene_cache = {}
+
+
+def iter_advene_annotations(path_to_file: str, chunk_size: int = ADVENE_CHUNK_SIZE) -> Iterator[dict]:
+    """
+    Incrementally parse the annotations of an Advene json export.
+
+    Only the ``"annotations"`` array is decoded, one annotation object at a time,
+    so the whole export never has to be held in memory.
+
+    Args:
+        path_to_file (str): path to json file
+        chunk_size (int): number of characters read from the file at once
+    Yields:
+        dict: one annotation (with keys such as ``type``, ``begin``, ``end``, ``title``)
+    """
+    decoder = json.JSONDecoder()
+
+    with open(path_to_file, 'r') as jsonfile:
+        buffer = ""
+        eof = False
+
+        # skip everything before the annotations array
+        while True:
+            match = _ANNOTATIONS_KEY.search(buffer)
+            if match:
+                buffer = buffer[match.end():]
+                break
+            if eof:
+                return
+            chunk = jsonfile.read(chunk_size)
+            eof = not chunk
+            # keep the tail, the key might be split across two chunks
+            buffer = buffer[-32:] + chunk
+
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+
+            if position < len(buffer) and buffer[position] == "]":
+                return
+
+            try:
+                annotation, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # the next annotation is not complete yet, read on
+                chunk = jsonfile.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+
+            yield annotation
+            position = end
+
+
+def _parse_advene_json(path_to_file: str, streaming: bool) -> Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Bucket the annotations of an Advene json export by type in one pass (times in milliseconds).
+    Results are cached until the file changes; their arrays are read-only, as they are shared between calls.
+    """
+    stat = os.stat(path_to_file)
+    cache_key = (os.path.abspath(path_to_file), stat.st_mtime_ns, stat.st_size)
+    if cache_key in _advene_cache:
+        return _advene_cache[cache_key]
+
+    if streaming:
+        annotations = iter_advene_annotations(path_to_file)
+    else:
+        with open(path_to_file, 'r') as jsonfile:
+            annotations = json.load(jsonfile).get("annotations")
+
+    buckets = {}
+    for annotation in annotations:
+        bucket = buckets.setdefault(annotation.get("type"), ([], [], []))
+        bucket[0].append(annotation.get("title"))
+        bucket[1].append(annotation.get("begin"))
+        bucket[2].append(annotation.get("end"))
+
+    labels = {label_name: (_read_only(values), _read_only(begins), _read_only(ends))
+              for label_name, (values, begins, ends) in buckets.items()}
+
+    _advene_cache.clear()
+    _advene_cache[cache_key] = labels
+    return labels
+
+
+def _read_only(values: list) -> np.ndarray:
+    array = np.array(values)
+    array.setflags(write=False)
+    return array
+
+
+def read_advene_json(
+    path_to_file: str,
+    label_names: Optional[Sequence[str]] = None,
+    streaming: bool = False,
+) -> Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Read the values, start and stop times of all labels of an Advene json export at once.
+
+    Args:
+        path_to_file (str): path to json file
+        label_names (list): if provided, only these labels (how they were specified in the json file) are returned
+        streaming (bool): parse the file incrementally (see :func:`iter_advene_annotations`)
+            instead of loading it at once, for very large exports
+    Returns:
+        dict: ``{label_name: (values, start_times, stop_times)}`` with times in seconds;
+        labels without annotations are returned as empty arrays
+    """
+    labels = _parse_advene_json(path_to_file, streaming)
+    if label_names is None:
+        label_names = list(labels)
+
+    empty = (np.array([]), np.array([]), np.array([]))
+    return {label_name: (labels.get(label_name, empty)[0],
+                         labels.get(label_name, empty)[1] / 1000,
+                         labels.get(label_name, empty)[2] / 1000)
+            for label_name in label_names}
 
 
 def start_stop_values_from_json(path_to_file: str, label_name: str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
     """
-    This function extracts start times, stop times and values of all segments of a label from a json file
+    This function extracts start times, stop times and values of all segments of a label from a json file.
+    The file is parsed once for all labels (see :func:`read_advene_json`), so reading many labels
+    from the same file is cheap.
     
     Args:
         path_to_file (str): path to json file
@@ -75,21 +269,7 @@ def start_stop_values_from_json(path_to_file: str, label_name: str) -> tuple[np.
     Returns:
         np.ndarray, np.ndarray, np.ndarray: first array: values of label, second array: start times of label segments in seconds, third array: stop times of label segments in seconds
     """
-    # open and read json file
-    with open(path_to_file,'r') as jsonfile:
-        labels_json_file = json.load(jsonfile) 
-        
-    start_times = []
-    stop_times = []
-    values = []
-    # iterate through elements in json file to extract time points of segments
-    for annotation in labels_json_file.get("annotations"):
-        if annotation.get("type") == label_name:
-            start_times.append(annotation.get("begin"))
-            stop_times.append(annotation.get("end"))
-            values.append(annotation.get("title"))
-            
-    return np.array(values), np.array(start_times)/1000, np.array(stop_times)/1000
+    return read_advene_json(path_to_file, [label_name])[label_name]
 
 
 def export_labels_from_json_file(
@@ -107,15 +287,10 @@ def export_labels_from_json_file(
     Returns:
         list: new label, aligned with movie (default label)
     """
-    with open(path_to_file, 'r') as jsonfile:
-        labels_json_file = json.load(jsonfile)
+    values, begins, ends = _parse_advene_json(path_to_file, False).get(label_name, ([], [], []))
 
-    label_start_end_times = []
-    values = []
-    for annotation in labels_json_file.get("annotations"):
-        if annotation.get("type") == label_name:
-            label_start_end_times.append([annotation.get("begin"), annotation.get("end")])
-            values.append(annotation.get("title"))
+    label_start_end_times = [[begin, end] for begin, end in zip(np.asarray(begins).tolist(), np.asarray(ends).tolist())]
+    values = np.asarray(values).tolist()
 
     # if requested, the start and end times will be saved
     if bool_save_start_end_times:
@@ -125,28 +300,15 @@ def export_labels_from_json_file(
     return label_start_end_times, values
 
 
-def get_start_stop_times_from_label(neural_rec_time: np.ndarray, patient_aligned_label: np.ndarray) -> tuple[list, list, list]:
+def get_start_stop_times_from_label(neural_rec_time: np.ndarray, patient_aligned_label: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
     """
     This function takes the patient aligned label and extracts the start and stop times from that.
+    Thin wrapper around :func:`create_vectors_from_time_points.run_length_encode`.
 
     Args:
         neural_rec_time (array): neural recording time of patient
         patient_aligned_label (array): patient aligned label
     Returns:
-        values (list), start times (list) and stop times (list) of label segments
-    """
-
-    tmp = patient_aligned_label[0]
-    values = [tmp]
-    start_times = [neural_rec_time[0]]
-    stop_times = []
-    for i in range(1, len(patient_aligned_label)):
-        if not patient_aligned_label[i] == tmp:
-            values.append(patient_aligned_label[i])
-            start_times.append(neural_rec_time[i])
-            stop_times.append(neural_rec_time[i-1])
-            tmp = patient_aligned_label[i]
-    stop_times.append(neural_rec_time[-1])
-    
-    return values, start_times, stop_times
-
+        values (np.ndarray), start times (np.ndarray) and stop times (np.ndarray) of label segments
+    """
+    return create_vectors_from_time_points.get_start_stop_times_from_label(neural_rec_time, patient_aligned_label)
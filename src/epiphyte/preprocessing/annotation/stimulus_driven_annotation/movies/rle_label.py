@@ -0,0 +1,275 @@
+"""Run-length encoded labels.
+
+:class:`RLELabel` keeps a label as the values, start times and stop times of
+its segments (the representation stored in ``MovieAnnotation`` and
+``PatientAlignedMovieAnnotation``) and answers queries on it directly, without
+expanding the label to one entry per frame.
+
+Segments are expected to be sorted by start time. They need not be
+contiguous: labels encoded with
+:func:`epiphyte.preprocessing.data_preprocessing.create_vectors_from_time_points.run_length_encode`
+are, but ``MovieAnnotation`` segments (e.g. Advene imports, which only store
+the segments where a label is present) can have gaps, which take the default
+value. Stop times are inclusive, as everywhere else in the package, i.e. a
+segment covers its stop frame too: its duration is ``stop - start`` plus one
+frame duration. Time points are compared with a tolerance of half a frame.
+
+Example:
+    ```python
+    label = RLELabel.from_dense(indicator_function, PTS_MOVIE_new, time_base="pts")
+    both = label & other_label
+    both.duration_per_value()
+    # {0: 4710.24, 1: 318.8}
+    ```
+"""
+
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+
+import epiphyte.preprocessing.data_preprocessing.create_vectors_from_time_points as create_vectors_from_time_points
+
+# duration of one movie frame in the supported time bases
+FRAME_DURATIONS = {"pts": 0.04, "neural": 40.}
+
+
+class RLELabel(object):
+    """Array-backed, run-length encoded label.
+
+    Attributes:
+        values (np.ndarray): Value of each segment.
+        start_times (np.ndarray): Start time of each segment.
+        stop_times (np.ndarray): Stop time (inclusive) of each segment.
+        time_base (str): Time scale of the segments, e.g. ``"pts"`` (movie seconds)
+            or ``"neural"`` (neural recording time, ms).
+        default_value (int): Value outside of the labelled time range.
+        frame_duration (float): Duration of one time point, i.e. how long a segment
+            lasts beyond its (inclusive) stop time.
+    """
+
+    def __init__(self, values: np.ndarray, start_times: np.ndarray, stop_times: np.ndarray,
+                 time_base: str = "pts", default_value: int = 0, frame_duration: Optional[float] = None) -> None:
+        if not (len(values) == len(start_times) == len(stop_times)):
+            raise ValueError("values, start_times and stop_times have to be the same length")
+
+        self.values = np.asarray(values)
+        self.start_times = np.asarray(start_times)
+        self.stop_times = np.asarray(stop_times)
+        self.time_base = time_base
+        self.default_value = default_value
+        self.frame_duration = FRAME_DURATIONS.get(time_base, 0.) if frame_duration is None else frame_duration
+
+    @classmethod
+    def from_dense(cls, label: np.ndarray, time_points: np.ndarray, time_base: str = "pts",
+                   default_value: int = 0) -> "RLELabel":
+        """Encode a full label vector (e.g. an indicator function).
+
+        Args:
+            label (np.ndarray): One label value per time point.
+            time_points (np.ndarray): Time points of the label entries.
+            time_base (str): Time scale of ``time_points``.
+            default_value (int): Value outside of the labelled time range.
+
+        Returns:
+            RLELabel: Encoded label, with the median spacing of ``time_points`` as frame duration.
+        """
+        values, start_times, stop_times = create_vectors_from_time_points.run_length_encode(label, time_points)
+        return cls(values, start_times, stop_times, time_base, default_value, _spacing(time_points))
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __repr__(self) -> str:
+        return "RLELabel({} segments, time_base='{}')".format(len(self), self.time_base)
+
+    def segments(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return ``(values, start_times, stop_times)``, the format used by the database tables."""
+        return self.values, self.start_times, self.stop_times
+
+    def durations(self) -> np.ndarray:
+        """Duration of each segment, including its (inclusive) stop frame."""
+        return self.stop_times - self.start_times + self.frame_duration
+
+    def value_at(self, time_points: np.ndarray) -> np.ndarray:
+        """Look up the label value at arbitrary time points.
+
+        Args:
+            time_points (np.ndarray): Time points in the time base of the label.
+
+        Returns:
+            np.ndarray: Label value per time point (``default_value`` outside the segments).
+        """
+        time_points = np.asarray(time_points)
+        if len(self) == 0:
+            return np.full(time_points.shape, self.default_value)
+
+        tolerance = self.frame_duration / 2
+        index = np.clip(np.searchsorted(self.start_times, time_points + tolerance, side="right") - 1, 0, None)
+        inside = (time_points >= self.start_times[index] - tolerance) & \
+            (time_points <= self.stop_times[index] + tolerance)
+        return np.where(inside, self.values[index], self.default_value)
+
+    def to_dense(self, grid: np.ndarray) -> np.ndarray:
+        """Expand the label onto a grid of time points.
+
+        Args:
+            grid (np.ndarray): Time points, e.g. movie frame times or bin edges.
+
+        Returns:
+            np.ndarray: Label value per grid point.
+        """
+        return self.value_at(grid)
+
+    def resample(self, grid: np.ndarray) -> "RLELabel":
+        """Snap the segments onto a (coarser or finer) sorted grid of time points.
+
+        Equivalent to ``RLELabel.from_dense(self.to_dense(grid), grid)``, but only
+        the grid points at which the value can change are evaluated.
+
+        Args:
+            grid (np.ndarray): Sorted time points of the new resolution.
+
+        Returns:
+            RLELabel: Label on the new grid, same time base.
+        """
+        grid = np.asarray(grid)
+        tolerance = self.frame_duration / 2
+        change_points = np.concatenate(([0],
+                                        np.searchsorted(grid, self.start_times - tolerance, side="left"),
+                                        np.searchsorted(grid, self.stop_times + tolerance, side="right")))
+        change_points = np.unique(change_points[change_points < len(grid)])
+
+        values = self.value_at(grid[change_points])
+        keep = np.concatenate(([True], values[1:] != values[:-1]))
+        change_points, values = change_points[keep], values[keep]
+        stop_points = np.append(change_points[1:] - 1, len(grid) - 1)
+
+        return RLELabel(values, grid[change_points], grid[stop_points], self.time_base, self.default_value,
+                        _spacing(grid))
+
+    def align_to_pts(self, patient_pts: np.ndarray, neural_rec_time: np.ndarray,
+                     frame_duration: float = 0.04) -> "RLELabel":
+        """Align a movie label to the frames a patient watched.
+
+        Counterpart of ``helpers.match_label_to_patient_pts_time`` followed by
+        ``get_start_stop_times_from_label``: the label is looked up at the
+        canonical frame of each watched PTS and re-encoded in neural recording time.
+
+        Args:
+            patient_pts (np.ndarray): Watched frame times (s) of the patient.
+            neural_rec_time (np.ndarray): Neural recording time of each watched frame.
+            frame_duration (float): Duration of one movie frame (s).
+
+        Returns:
+            RLELabel: Label in the ``"neural"`` time base.
+        """
+        frames = np.round(np.asarray(patient_pts) / frame_duration) * frame_duration
+        return RLELabel.from_dense(self.value_at(np.round(frames, 2)), neural_rec_time, "neural",
+                                   self.default_value)
+
+    def duration_per_value(self) -> Dict[int, float]:
+        """Total duration per label value.
+
+        Returns:
+            Dict[int, float]: Mapping ``{value: duration}`` in the units of the time base.
+        """
+        unique_values, inverse = np.unique(self.values, return_inverse=True)
+        totals = np.bincount(inverse, weights=self.durations(), minlength=len(unique_values))
+        return {value.item(): float(total) for value, total in zip(unique_values, totals)}
+
+    def overlap(self, other: "RLELabel", value: Optional[int] = None, other_value: Optional[int] = None) -> float:
+        """Total time during which both labels take the given values.
+
+        Args:
+            other (RLELabel): Label on the same time base.
+            value (Optional[int]): Value of this label; any non-default value if ``None``.
+            other_value (Optional[int]): Value of ``other``; any non-default value if ``None``.
+
+        Returns:
+            float: Overlap duration in the units of the time base.
+        """
+        start_times, stop_times, own, others = self._combine(other)
+
+        own_match = own != self.default_value if value is None else own == value
+        other_match = others != other.default_value if other_value is None else others == other_value
+        return float(np.sum((stop_times - start_times + self.frame_duration)[own_match & other_match]))
+
+    def __and__(self, other: "RLELabel") -> "RLELabel":
+        return self._logical(other, np.logical_and)
+
+    def __or__(self, other: "RLELabel") -> "RLELabel":
+        return self._logical(other, np.logical_or)
+
+    def __invert__(self) -> "RLELabel":
+        # gaps between segments become present, too
+        return self._logical(self, lambda own, _: ~own)
+
+    def _combine(self, other: "RLELabel") -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Split the time range of two labels into pieces on which both are constant.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+            ``(start_times, stop_times, own_values, other_values)`` of the pieces.
+        """
+        if self.time_base != other.time_base:
+            raise ValueError("Cannot combine labels in time bases '{}' and '{}'.".format(self.time_base,
+                                                                                      other.time_base))
+
+        frame_duration = self.frame_duration
+        tolerance = frame_duration / 2
+        time_points = np.union1d(np.union1d(self.start_times, other.start_times),
+                                 np.union1d(self.stop_times, other.stop_times))
+        if len(time_points) == 0:
+            return time_points, time_points, time_points.astype(int), time_points.astype(int)
+
+        # pieces start at every segment start and one frame after every segment stop; such an
+        # end is snapped onto a known time point within half a frame (0.2 + 0.04 != 0.24)
+        ends = np.concatenate((self.stop_times, other.stop_times)) + frame_duration
+        following = time_points[np.clip(np.searchsorted(time_points, ends - tolerance), 0, len(time_points) - 1)]
+        ends = np.where(np.abs(following - ends) <= tolerance, following, ends)
+        bounds = np.union1d(np.union1d(self.start_times, other.start_times), ends)
+        bounds = bounds[np.concatenate(([True], np.diff(bounds) > tolerance))]
+
+        # each piece stops at the known time point right before the next piece, or one frame
+        # before it if that time point is not known (e.g. in a gap between segments)
+        start_times, next_starts = bounds[:-1], bounds[1:]
+        before = time_points[np.searchsorted(time_points, next_starts - tolerance, side="left") - 1]
+        known = (before >= start_times) & ((frame_duration == 0) | (next_starts - before < 1.5 * frame_duration))
+        stop_times = np.where(known, before, next_starts - frame_duration)
+
+        return start_times, stop_times, self.value_at(start_times), other.value_at(start_times)
+
+    def _logical(self, other: "RLELabel", operator) -> "RLELabel":
+        start_times, stop_times, own, others = self._combine(other)
+        values = operator(own != self.default_value, others != other.default_value).astype(int)
+
+        keep = np.concatenate(([True], values[1:] != values[:-1]))
+        stop_index = np.append(np.flatnonzero(keep)[1:] - 1, len(values) - 1)
+        return RLELabel(values[keep], start_times[keep], stop_times[stop_index], self.time_base, 0,
+                        self.frame_duration)
+
+
+def _spacing(time_points: np.ndarray) -> Optional[float]:
+    # median spacing of a grid, None (time base default) if it has less than two points
+    time_points = np.asarray(time_points)
+    return float(np.median(np.diff(time_points))) if len(time_points) > 1 else None
+
+
+def unpack_label(
+    values: Union[RLELabel, np.ndarray],
+    start_times: Optional[np.ndarray] = None,
+    stop_times: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Accept either an :class:`RLELabel` or separate ``values, start_times, stop_times``.
+
+    Args:
+        values (Union[RLELabel, np.ndarray]): Label, or the values of its segments.
+        start_times (Optional[np.ndarray]): Start times, if ``values`` is not an ``RLELabel``.
+        stop_times (Optional[np.ndarray]): Stop times, if ``values`` is not an ``RLELabel``.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: ``(values, start_times, stop_times)``.
+    """
+    if isinstance(values, RLELabel):
+        return values.segments()
+    return values, start_times, stop_times
@@ -7,71 +7,103 @@ timestamps (PTS) and real (CPU) times. It also includes helpers to trim the
 recorded time series to a maximum movie duration.
 
 Constants:
-    MAX_MOVIE_TIME (int): Maximum allowable movie time (in the same units as PTS)
-        used to filter out timestamps beyond the movie length.
+    MAX_MOVIE_TIME (int): Default maximum movie time (in the same units as PTS)
+        used to filter out timestamps beyond the movie length. Other stimuli
+        pass their own length as ``max_movie_time``.
 
 Example:
-    >>> wl = WatchLog("/path/to/watch.log")
+    >>> wl = WatchLog("/path/to/watch.log", max_movie_time=MAX_MOVIE_TIME)
     >>> wl.get_start_time(), wl.get_end_time()
     (12, 5012)
     >>> wl.df_pts_cpu.head()
     #    pts  cpu_time
     # 0  0.00      1234
     # 1  0.04      1270
+
+Logs of sessions that are still running can be monitored with
+:class:`WatchLogFollower`, which only parses the lines appended since the last
+poll and emits pause, resume, skip and end events:
+
+    >>> for event in WatchLogFollower("/path/to/watch.log").follow(idle_timeout=60):
+    ...     print(event)
 """
+import asyncio
+import os
+import time
+from typing import AsyncIterator, Iterator, Optional
+
 import numpy as np
 import pandas as pd
 
+from epiphyte.preprocessing.data_preprocessing import data_utils
+
 MAX_MOVIE_TIME = 5029
+FOLLOW_MAX_FRAMES = 1 << 16
+FOLLOW_CHUNK_BYTES = 1 << 22
 
 class WatchLog:
     """
     Parse a watch log file and process the concurrent presentation time stamps (PTS) and the local PC (CPU) time series.
 
     On initialization, this class:
-      1) Reads the provided watch log file.
-      2) Extracts the start and end CPU timestamps.
-      3) Loads all PTS/CPU rows, trims them to the maximum movie length, and
+      1) Parses the provided watch log file once.
+      2) Takes the start and end CPU timestamps from the first and last frame lines.
+      3) Trims all PTS/CPU rows to the maximum movie length with a boolean mask, and
          converts CPU timestamps to seconds (integer, via floor division by 1000).
-      4) Builds a pandas DataFrame (:attr:`df_pts_cpu`) with `pts` and `cpu_time`.
+
+    The pandas DataFrame (:attr:`df_pts_cpu`) with `pts` and `cpu_time` is only
+    built when it is first accessed.
 
     Attributes:
         watch_log_file (str): Absolute or relative path to the watch log file.
+        max_movie_time (float): Maximum movie time (PTS); later frames are excluded.
         start_time (int): Start time in seconds (CPU time derived from the file).
         end_time (int): End time in seconds (CPU time derived from the file).
         duration (int): Duration in seconds, computed as `end_time - start_time`.
         pts_time_stamps (np.ndarray): Array of PTS values (floats), possibly trimmed.
         dts_time_stamps (np.ndarray): Array of CPU times in seconds (ints), possibly trimmed.
-        excluded_indices (list[int]): Indices removed when trimming to `MAX_MOVIE_TIME`.
-        df_pts_cpu (pd.DataFrame): Two-column DataFrame with `pts` and `cpu_time`.
+        excluded_indices (list[int]): Indices removed when trimming to `max_movie_time`.
+        df_pts_cpu (pd.DataFrame): Two-column DataFrame with `pts` and `cpu_time`, built on first access.
 
     Notes:
         - The method :meth:`getlines` reads the log file in **binary** mode and
           returns a list of byte strings. Downstream parsing assumes whitespace-
           separated fields and converts to numeric types as needed.
-        - CPU timestamps are divided by 1000 and cast to `int`, so any sub-second
+        - CPU timestamps are floor-divided by 1000, so any sub-second
           resolution is truncated rather than rounded.
     """
-    def __init__(self, path_watch_log: str):
+    def __init__(self, path_watch_log: str, max_movie_time: float = MAX_MOVIE_TIME):
         """
         Initialize the WatchLog and populate derived fields.
 
         Args:
             path_watch_log (str): Path to the watch log file to load.
+            max_movie_time (float): Length of the stimulus (PTS); frames beyond it are excluded.
 
         Side Effects:
             - Reads the file at `path_watch_log`.
             - Populates attributes documented in the class docstring.
         """
         self.watch_log_file = path_watch_log
+        self.max_movie_time = max_movie_time
         self.start_time, self.end_time = self.extract_start_and_end_time()
         self.duration = self.end_time - self.start_time
         self.pts_time_stamps, self.dts_time_stamps, self.excluded_indices = self.get_times_from_watch_log(path_watch_log)
         # optionally divide time stamp by 1000 to get time in seconds
-        self.dts_time_stamps = np.array([int(x / 1000) for x in self.dts_time_stamps])
-        self.df_pts_cpu = pd.DataFrame({"pts": self.pts_time_stamps, "cpu_time": self.dts_time_stamps})
+        self.dts_time_stamps = np.floor_divide(self.dts_time_stamps, 1000)
+        self._df_pts_cpu = None
 
-        self.df_pts_cpu.sort_values(['cpu_time'])
+    @property
+    def df_pts_cpu(self) -> pd.DataFrame:
+        """
+        Two-column DataFrame with `pts` and `cpu_time` (seconds), built on first access.
+
+        Returns:
+            pd.DataFrame: One row per retained frame, in playback order.
+        """
+        if self._df_pts_cpu is None:
+            self._df_pts_cpu = pd.DataFrame({"pts": self.pts_time_stamps, "cpu_time": self.dts_time_stamps})
+        return self._df_pts_cpu
 
     def get_start_time(self) -> int:
         """
@@ -113,10 +145,10 @@ class WatchLog:
         """
         Extract the start and end CPU timestamps from the watch log.
 
-        The function reads the file in text mode, takes the second line as the
-        "first" data line, and scans backward from the end to find the last line
-        beginning with ``"pts"``. It returns the CPU timestamps from those two
-        lines, converted to seconds by dividing by 1000 and casting to `int`.
+        The watch log is parsed with :func:`data_utils.parse_watchlog` (shared
+        with :meth:`get_times_from_watch_log`), and the CPU timestamps of the
+        first and last frame lines are returned, converted to seconds by
+        floor division by 1000.
 
         Returns:
             tuple[int, int]: A `(start_time_s, end_time_s)` tuple in seconds.
@@ -125,28 +157,22 @@ class WatchLog:
             FileNotFoundError: If the watch log file cannot be opened.
             ValueError: If the file does not contain expected fields/format.
         """
-        with open(self.watch_log_file, 'r') as f:
-            lines = f.read().splitlines()
-            first_line = lines[1]
-            i = len(lines)-1
-            while not lines[i].startswith("pts"):
-                i -= 1
-            last_line = lines[i]  # TODO change this to make it generally applicable
+        watchlog = data_utils.parse_watchlog(self.watch_log_file)
 
-        # return cpu time stamp of first and last line in watch log
+        # return cpu time stamp of first and last frame line in watch log
         # divide by 1000 to get seconds
-        return int(int(first_line.split()[-1]) / 1000), int(int(last_line.split()[-1]) / 1000)
+        return int(watchlog.cpu_time[0] // 1000), int(watchlog.cpu_time[-1] // 1000)
 
     def get_times_from_watch_log(self, path_watch_log: str) -> tuple[np.ndarray, np.ndarray, list[int]]:
         """
         Extract PTS and CPU (real) times from the watch log.
 
-        The function reads raw lines via :meth:`getlines`, parses the whitespace-
-        separated fields, and collects two arrays:
+        The watch log is parsed with :func:`data_utils.parse_watchlog`, which
+        yields two arrays:
         - PTS values as floats rounded to 2 decimals.
         - CPU timestamps as integers (original units, **not** yet divided by 1000).
 
-        It then trims both arrays to the maximum movie duration via
+        It then trims both arrays to :attr:`max_movie_time` via
         :meth:`cut_time_to_movie_pts`.
 
         Args:
@@ -157,44 +183,37 @@ class WatchLog:
             ``(pts_time_stamps, cpu_time_stamps, excluded_indices)`` where
             - `pts_time_stamps` is a float array,
             - `cpu_time_stamps` is an int array (original unit),
-            - `excluded_indices` lists indices removed due to `MAX_MOVIE_TIME`.
+            - `excluded_indices` lists indices removed due to `max_movie_time`.
 
         Raises:
             FileNotFoundError: If the watch log file cannot be opened.
             ValueError: If the log lines do not match the expected 4-field format.
         """
-        lines = self.getlines(path_watch_log)
-        pts = []
-        time = []
-
-        for line in lines[1:]:
-            fields = line.split()
-            if len(fields) == 4:
-                pts.append(round(float(fields[1]), 2))
-                time.append(int(fields[3]))
+        watchlog = data_utils.parse_watchlog(path_watch_log)
+        pts = np.round(watchlog.pts, 2)
+        time = watchlog.cpu_time
 
-        pts = np.array(pts)
-        time = np.array(time)
-
-        return self.cut_time_to_movie_pts(pts, time)
+        return self.cut_time_to_movie_pts(pts, time, self.max_movie_time)
 
     @staticmethod
-    def cut_time_to_movie_pts(pts_time_stamps: np.ndarray, cpu_time_stamps: np.ndarray) -> tuple[np.ndarray, np.ndarray, list[int]]:
+    def cut_time_to_movie_pts(pts_time_stamps: np.ndarray, cpu_time_stamps: np.ndarray,
+                              max_movie_time: float = MAX_MOVIE_TIME) -> tuple[np.ndarray, np.ndarray, list[int]]:
         """
         Trim PTS and CPU arrays to the maximum movie length.
 
-        Any PTS value strictly greater than :data:`MAX_MOVIE_TIME` is excluded.
+        Any PTS value strictly greater than `max_movie_time` is excluded.
         The function returns aligned arrays of the retained elements and the
         list of excluded indices.
 
         Args:
             pts_time_stamps (np.ndarray): Array of PTS values (floats).
             cpu_time_stamps (np.ndarray): Array of CPU times (ints), aligned with PTS.
+            max_movie_time (float): Maximum movie time (PTS).
 
         Returns:
             tuple[np.ndarray, np.ndarray, list[int]]: A tuple
             ``(cut_down_pts, cut_down_dts, excluded_indices)``:
-            - `cut_down_pts` (np.ndarray): PTS values ≤ `MAX_MOVIE_TIME`.
+            - `cut_down_pts` (np.ndarray): PTS values ≤ `max_movie_time`.
             - `cut_down_dts` (np.ndarray): Corresponding CPU times.
             - `excluded_indices` (list[int]): Indices removed from the original arrays.
 
@@ -202,19 +221,11 @@ class WatchLog:
             - This function assumes `pts_time_stamps` and `cpu_time_stamps` are the
               same length and aligned 1:1.
         """
-        excluded_time_points_based_on_max_movie_time = [0 if x > MAX_MOVIE_TIME else 1 for x in pts_time_stamps]
-
-        cut_down_pts = []
-        cut_down_dts = []
-        excluded_indices = []
-        for i in range(0, len(pts_time_stamps)):
-            if excluded_time_points_based_on_max_movie_time[i] == 1:
-                cut_down_pts.append(pts_time_stamps[i])
-                cut_down_dts.append(cpu_time_stamps[i])
-            else:
-                excluded_indices.append(i)
+        pts_time_stamps = np.asarray(pts_time_stamps)
+        cpu_time_stamps = np.asarray(cpu_time_stamps)
+        within_movie = pts_time_stamps <= max_movie_time
 
-        return np.array(cut_down_pts), np.array(cut_down_dts), excluded_indices
+        return pts_time_stamps[within_movie], cpu_time_stamps[within_movie], np.flatnonzero(~within_movie).tolist()
 
     @staticmethod
     def getlines(filename: str) -> list[bytes]:
@@ -234,3 +245,297 @@ class WatchLog:
             data = logfile.read()
         lines = data.splitlines()
         return lines
+
+
+class FrameBuffer:
+    """
+    Growable buffer of the most recent frames of a watch log, with bounded memory.
+
+    Frames are appended at the end of arrays of twice the capacity; once those
+    are full, the last `max_frames` frames are moved to the front. The retained
+    frames are therefore always available as contiguous views.
+
+    Attributes:
+        max_frames (int): Number of most recent frames that are retained.
+        n_frames (int): Number of frames appended in total.
+    """
+    def __init__(self, max_frames: int = FOLLOW_MAX_FRAMES):
+        self.max_frames = max_frames
+        self.n_frames = 0
+        self._pts = np.zeros(2 * max_frames)
+        self._cpu_time = np.zeros(2 * max_frames, dtype=np.int64)
+        self._line_numbers = np.zeros(2 * max_frames, dtype=np.int64)
+        self._start = 0
+        self._stop = 0
+
+    def __len__(self) -> int:
+        return self._stop - self._start
+
+    def append(self, pts: np.ndarray, cpu_time: np.ndarray, line_numbers: np.ndarray):
+        """
+        Append frames, dropping the oldest ones beyond `max_frames`.
+
+        Args:
+            pts (np.ndarray): PTS of the new frames (s).
+            cpu_time (np.ndarray): CPU times of the new frames (µs).
+            line_numbers (np.ndarray): Line numbers of the new frames in the log.
+        """
+        self.n_frames += len(pts)
+        if len(pts) > self.max_frames:
+            pts, cpu_time, line_numbers = pts[-self.max_frames:], cpu_time[-self.max_frames:], line_numbers[-self.max_frames:]
+
+        if self._stop + len(pts) > len(self._pts):
+            keep = min(len(self), self.max_frames - len(pts))
+            for array in (self._pts, self._cpu_time, self._line_numbers):
+                array[:keep] = array[self._stop - keep:self._stop]
+            self._start, self._stop = 0, keep
+
+        new = slice(self._stop, self._stop + len(pts))
+        self._pts[new], self._cpu_time[new], self._line_numbers[new] = pts, cpu_time, line_numbers
+        self._stop = new.stop
+        self._start = max(self._start, self._stop - self.max_frames)
+
+    @property
+    def pts(self) -> np.ndarray:
+        return self._pts[self._start:self._stop]
+
+    @property
+    def cpu_time(self) -> np.ndarray:
+        return self._cpu_time[self._start:self._stop]
+
+    @property
+    def line_numbers(self) -> np.ndarray:
+        return self._line_numbers[self._start:self._stop]
+
+
+class WatchLogEvent:
+    """
+    Playback event detected while following a watch log.
+
+    Attributes:
+        kind (str): One of ``"pause"``, ``"resume"``, ``"skip"`` and ``"end"``.
+        line_number (int): Line of the log the event was detected at.
+        cpu_time (int): CPU time of the frame the event refers to (µs).
+        pts (float): PTS of that frame (s).
+        jump (float): PTS jump in frames (``"skip"`` events only, otherwise 0).
+    """
+    def __init__(self, kind: str, line_number: int, cpu_time: int, pts: float, jump: float = 0.):
+        self.kind = kind
+        self.line_number = line_number
+        self.cpu_time = cpu_time
+        self.pts = pts
+        self.jump = jump
+
+    def __repr__(self) -> str:
+        jump = f", jump={self.jump:.0f}" if self.kind == "skip" else ""
+        return f"WatchLogEvent({self.kind}, line={self.line_number}, pts={self.pts:.2f}, cpu_time={self.cpu_time}{jump})"
+
+
+class WatchLogFollower:
+    """
+    Follow a watch log that is still being written, e.g. during a live session.
+
+    The follower keeps the file offset of the last complete line it has read.
+    Every :meth:`poll` only reads and parses the lines appended since, adds
+    their frames to a :class:`FrameBuffer` and returns the playback events
+    found in them. Markers follow the rules of :func:`data_utils.parse_watchlog_buffer`:
+    a pause starts at the frame before ``Pausing``, it ends at the frame after
+    ``Continuing``, and ``Properly`` terminates the log at the frame three lines before it.
+
+    Attributes:
+        watch_log_file (str): Path to the watch log file.
+        offset (int): File offset up to which the log has been parsed.
+        frames (FrameBuffer): Most recent frames.
+        chunk_bytes (int): Maximal number of bytes read and parsed at once.
+        threshold_frames (float): Minimal PTS jump, in frames, that is reported as a skip.
+        frame_duration (float): Duration of one movie frame (s).
+        ended (bool): Whether the ``Properly`` termination marker has been seen.
+    """
+    def __init__(self, path_watch_log: str, threshold_frames: float = data_utils.SKIP_THRESHOLD_FRAMES,
+                 frame_duration: float = 0.04, max_frames: int = FOLLOW_MAX_FRAMES,
+                 chunk_bytes: int = FOLLOW_CHUNK_BYTES):
+        """
+        Initialize the follower at the beginning of the log.
+
+        Args:
+            path_watch_log (str): Path to the watch log file to follow.
+            threshold_frames (float): Minimal PTS jump, in frames, that is reported as a skip.
+            frame_duration (float): Duration of one movie frame (s).
+            max_frames (int): Number of most recent frames kept in memory.
+            chunk_bytes (int): Maximal number of bytes read and parsed at once.
+        """
+        self.watch_log_file = path_watch_log
+        self.threshold_frames = threshold_frames
+        self.frame_duration = frame_duration
+        self.chunk_bytes = chunk_bytes
+        self.frames = FrameBuffer(max_frames)
+        self.reset()
+
+    def frame_rate(self, n_frames: int = 250) -> float:
+        """
+        Playback frame rate over the most recent frames.
+
+        Args:
+            n_frames (int): Number of most recent frames to average over.
+
+        Returns:
+            float: Frames per second of CPU time, ``nan`` if fewer than two frames were read.
+        """
+        cpu_time = self.frames.cpu_time[-n_frames:]
+        if len(cpu_time) < 2 or cpu_time[-1] == cpu_time[0]:
+            return np.nan
+        return (len(cpu_time) - 1) / (cpu_time[-1] - cpu_time[0]) * 1e6
+
+    def reset(self):
+        """
+        Forget everything read so far and start again at the beginning of the log.
+        """
+        self.frames = FrameBuffer(self.frames.max_frames)
+        self.offset = 0
+        self.ended = False
+        self._lines_read = 0
+        self._pending_resumes = []
+
+    def _read_chunk(self, logfile, size: int) -> bytes:
+        # at most chunk_bytes, cut after the last complete line; the rest is read again later
+        logfile.seek(self.offset)
+        data = logfile.read(min(size - self.offset, self.chunk_bytes))
+        if len(data) == self.chunk_bytes and b"\n" not in data:
+            raise ValueError(f"Line at offset {self.offset} of {self.watch_log_file} is longer than "
+                             f"chunk_bytes={self.chunk_bytes}.")
+        return data[:data.rfind(b"\n") + 1]
+
+    def _parse_chunk(self, data: bytes) -> tuple[list[WatchLogEvent], tuple, list[int], bool]:
+        """
+        Parse complete lines following the current offset, without changing the follower's state.
+
+        Returns:
+            tuple: ``(events, new_frames, pending_resumes, ended)``, where ``new_frames`` holds
+            the ``(pts, cpu_time, line_numbers)`` arrays of the frames in ``data``.
+        """
+        if self._lines_read == 0:
+            parsed, first_line = data_utils.parse_watchlog_buffer(data), 0
+        else:
+            # an empty first line keeps the first new line from being taken as the header
+            parsed, first_line = data_utils.parse_watchlog_buffer(b"\n" + data), self._lines_read - 1
+
+        # markers refer to neighbouring frames, so the new frames and the last known one suffice
+        n_previous = min(len(self.frames), 1)
+        pts = np.concatenate((self.frames.pts[len(self.frames) - n_previous:], parsed.pts))
+        cpu_time = np.concatenate((self.frames.cpu_time[len(self.frames) - n_previous:], parsed.cpu_time))
+        line_numbers = np.concatenate((self.frames.line_numbers[len(self.frames) - n_previous:],
+                                       parsed.line_numbers + first_line))
+
+        def event(kind, row, line, jump=0.):
+            return WatchLogEvent(kind, int(line), int(cpu_time[row]), float(pts[row]), jump)
+
+        jumps = np.diff(pts) / self.frame_duration
+        events = [event("skip", row + 1, line_numbers[row + 1], float(jumps[row]))
+                  for row in np.flatnonzero(np.abs(jumps) > self.threshold_frames)]
+
+        for line in parsed.marker_lines["Pausing"] + first_line:
+            row = np.searchsorted(line_numbers, line, side="left") - 1
+            if row >= 0:
+                events.append(event("pause", row, line))
+        for line in parsed.marker_lines["Properly"] + first_line:
+            row = np.searchsorted(line_numbers, line - 3, side="right") - 1
+            if row >= 0:
+                events.append(event("end", row, line))
+
+        # a resume refers to the frame after the marker, which may only arrive with a later poll
+        pending = []
+        for line in self._pending_resumes + (parsed.marker_lines["Continuing"] + first_line).tolist():
+            row = np.searchsorted(line_numbers, line, side="right")
+            if row < len(line_numbers):
+                events.append(event("resume", row, line))
+            else:
+                pending.append(line)
+
+        new_frames = (pts[n_previous:], cpu_time[n_previous:], line_numbers[n_previous:])
+        ended = self.ended or len(parsed.marker_lines["Properly"]) > 0
+        return sorted(events, key=lambda watch_event: watch_event.line_number), new_frames, pending, ended
+
+    def poll(self) -> list[WatchLogEvent]:
+        """
+        Parse the lines appended since the last poll.
+
+        The new lines are read in chunks of at most :attr:`chunk_bytes`. The
+        offset only advances once a chunk has been parsed, so a failing poll
+        can simply be repeated.
+
+        Returns:
+            list[WatchLogEvent]: New events, ordered by their line in the log.
+        """
+        size = os.path.getsize(self.watch_log_file)
+        if size < self.offset:
+            # the log was truncated or replaced, start over
+            self.reset()
+
+        events = []
+        with open(self.watch_log_file, 'rb') as logfile:
+            while self.offset < size:
+                data = self._read_chunk(logfile, size)
+                if not data:
+                    break
+
+                chunk_events, new_frames, pending, ended = self._parse_chunk(data)
+
+                self.frames.append(*new_frames)
+                self.offset += len(data)
+                self._lines_read += data.count(b"\n")
+                self._pending_resumes = pending
+                self.ended = ended
+                events += chunk_events
+
+        return events
+
+    def follow(self, poll_interval: float = 0.5, idle_timeout: Optional[float] = None,
+               stop_at_end: bool = True) -> Iterator[WatchLogEvent]:
+        """
+        Generator of events while the log grows.
+
+        Args:
+            poll_interval (float): Seconds to wait between polls when no new lines arrived.
+            idle_timeout (Optional[float]): Stop after this many seconds without new lines;
+                follow forever if ``None``.
+            stop_at_end (bool): Stop once the log is properly terminated.
+
+        Yields:
+            WatchLogEvent: Events in the order they appear in the log.
+        """
+        last_growth = time.monotonic()
+        while not (stop_at_end and self.ended):
+            offset = self.offset
+            yield from self.poll()
+            if self.offset != offset:
+                last_growth = time.monotonic()
+                continue
+            if idle_timeout is not None and time.monotonic() - last_growth > idle_timeout:
+                return
+            time.sleep(poll_interval)
+
+    async def afollow(self, poll_interval: float = 0.5, idle_timeout: Optional[float] = None,
+                      stop_at_end: bool = True) -> AsyncIterator[WatchLogEvent]:
+        """
+        Asynchronous variant of :meth:`follow`, for use in an asyncio task.
+
+        Args:
+            poll_interval (float): Seconds to wait between polls when no new lines arrived.
+            idle_timeout (Optional[float]): Stop after this many seconds without new lines;
+                follow forever if ``None``.
+            stop_at_end (bool): Stop once the log is properly terminated.
+
+        Yields:
+            WatchLogEvent: Events in the order they appear in the log.
+        """
+        last_growth = time.monotonic()
+        while not (stop_at_end and self.ended):
+            offset = self.offset
+            for event in self.poll():
+                yield event
+            if self.offset != offset:
+                last_growth = time.monotonic()
+                continue
+            if idle_timeout is not None and time.monotonic() - last_growth > idle_timeout:
+                return
+            await asyncio.sleep(poll_interval)
@@ -2,18 +2,28 @@
 Binning functions for spike times and labels. 
 Pulls data from the database using pre-defined query functions.
 
-
+For very long recordings, :class:`BinGrid` describes the bin edges without
+materializing them, and the ``iter_*`` generators walk the recording in chunks
+of bins with bounded memory.
 """
 
 import os.path
-from typing import List, Tuple, Union
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
 
 import numpy as np
 
+from epiphyte.database import config
 from epiphyte.database.db_setup import *
-from epiphyte.database.query_functions import get_patient_neural_rectime, get_start_stop_times_pauses
+from epiphyte.database.query_functions import get_lfp_data, get_patient_neural_rectime, get_start_stop_times_pauses
 import epiphyte.preprocessing.annotation.stimulus_driven_annotation.movies.pause_handling as pause_handling
 import epiphyte.preprocessing.data_preprocessing.create_vectors_from_time_points as create_vectors_from_time_points
+import epiphyte.preprocessing.data_preprocessing.data_utils as data_utils
+
+# number of bins handled per chunk by the streaming functions
+CHUNK_BINS = 1000000
+
+LFP_STATS = ("mean", "rms", "power")
 
 
 def bin_label(
@@ -115,3 +125,478 @@ def bin_spikes(
         ret = binned_spikes
     
     return ret
+
+
+class BinGrid(object):
+    """Lazily evaluated bin edges over a neural recording.
+
+    Reproduces the edges used by :func:`bin_spikes` and :func:`bin_label`
+    (``np.linspace`` from the first to the last neural recording time stamp,
+    optionally without the edges removed by ``pause_handling.rm_pauses_bins``),
+    but only computes the edges of the index range that is asked for.
+
+    Attributes:
+        rec_on (float): First time stamp of the recording (ms).
+        rec_off (float): Last time stamp of the recording (ms).
+        bin_size (int): Nominal bin size (ms).
+        n_edges (int): Number of edges before pause removal.
+        step (float): Exact spacing of the edges (ms).
+        pause_starts (np.ndarray): Pause starts (ms), empty if pauses are kept.
+        pause_stops (np.ndarray): Pause stops (ms), empty if pauses are kept.
+    """
+
+    def __init__(self, rec_on: float, rec_off: float, bin_size: int,
+                 pause_starts: Optional[np.ndarray] = None,
+                 pause_stops: Optional[np.ndarray] = None) -> None:
+        self.rec_on = rec_on
+        self.rec_off = rec_off
+        self.bin_size = bin_size
+        self.n_edges = int((rec_off - rec_on) / bin_size)
+
+        if self.n_edges < 2:
+            raise ValueError("Recording is shorter than two bins of {} ms.".format(bin_size))
+
+        self.step = np.subtract(rec_off, rec_on, dtype=float) / (self.n_edges - 1)
+
+        self.pause_starts = np.asarray([] if pause_starts is None else pause_starts, dtype=float)
+        self.pause_stops = np.asarray([] if pause_stops is None else pause_stops, dtype=float)
+        self._removed_lo, self._removed_hi = self._removed_edge_ranges()
+
+    @classmethod
+    def from_session(cls, patient_id: int, session_nr: int, bin_size: int,
+                     exclude_pauses: bool) -> "BinGrid":
+        """Build the grid of a session as used by :func:`bin_spikes`.
+
+        Args:
+            patient_id (int): ID of the patient.
+            session_nr (int): Session number of the experiment.
+            bin_size (int): Bin size in milliseconds.
+            exclude_pauses (bool): If ``True``, drop the edges within paused playback.
+
+        Returns:
+            BinGrid: Grid over the neural recording time of the session.
+        """
+        rectime = get_patient_neural_rectime(patient_id, session_nr)
+
+        if exclude_pauses:
+            start_times_pauses, stop_times_pauses = get_start_stop_times_pauses(patient_id, session_nr)
+        else:
+            start_times_pauses, stop_times_pauses = None, None
+
+        return cls(rectime[0], rectime[-1], bin_size, start_times_pauses, stop_times_pauses)
+
+    @property
+    def n_kept_edges(self) -> int:
+        """Number of edges left after pause removal."""
+        return self.n_edges - int(np.sum(self._removed_hi - self._removed_lo + 1))
+
+    @property
+    def n_bins(self) -> int:
+        """Number of bins, i.e. the length of the output of :func:`bin_spikes`."""
+        return self.n_kept_edges - 1
+
+    def edge_values(self, indices: np.ndarray) -> np.ndarray:
+        """Evaluate edges by their index in the full ``np.linspace`` grid.
+
+        Args:
+            indices (np.ndarray): Edge indices in ``[0, n_edges)``.
+
+        Returns:
+            np.ndarray: Edge times (ms), identical to the ``np.linspace`` values.
+        """
+        indices = np.asarray(indices)
+        edges = indices * self.step + self.rec_on
+        edges[indices == self.n_edges - 1] = self.rec_off
+        return edges
+
+    def kept(self, indices: np.ndarray) -> np.ndarray:
+        """Flag the edge indices that survive pause removal.
+
+        Args:
+            indices (np.ndarray): Edge indices in ``[0, n_edges)``.
+
+        Returns:
+            np.ndarray: Boolean mask, ``False`` for edges within a pause.
+        """
+        indices = np.asarray(indices)
+        if self._removed_lo.size == 0:
+            return np.ones(indices.shape, dtype=bool)
+
+        k = np.searchsorted(self._removed_lo, indices, side="right") - 1
+        removed = (k >= 0) & (indices <= self._removed_hi[np.clip(k, 0, None)])
+        return ~removed
+
+    def edges(self) -> np.ndarray:
+        """Materialize all kept edges (same as the edges of :func:`bin_spikes`).
+
+        Returns:
+            np.ndarray: Bin edges (ms).
+        """
+        indices = np.arange(self.n_edges)
+        return self.edge_values(indices[self.kept(indices)])
+
+    def iter_edge_indices(self, chunk_bins: int = CHUNK_BINS) -> Iterator[np.ndarray]:
+        """Walk the kept edge indices in chunks.
+
+        Consecutive chunks share their boundary edge, so the bins of all chunks
+        concatenate to the bins of the full grid. A gap between two consecutive
+        indices marks a bin that spans a pause.
+
+        Args:
+            chunk_bins (int): Number of grid positions covered per chunk.
+
+        Yields:
+            np.ndarray: Kept edge indices of one chunk (at least two).
+        """
+        last = None
+
+        for first in range(0, self.n_edges, chunk_bins):
+            indices = np.arange(first, min(first + chunk_bins, self.n_edges))
+            indices = indices[self.kept(indices)]
+
+            if last is not None:
+                indices = np.concatenate(([last], indices))
+
+            if len(indices) == 0:
+                continue
+
+            last = indices[-1]
+            if len(indices) >= 2:
+                yield indices
+
+    def iter_edges(self, chunk_bins: int = CHUNK_BINS) -> Iterator[np.ndarray]:
+        """Walk the kept edges in chunks, see :meth:`iter_edge_indices`.
+
+        Args:
+            chunk_bins (int): Number of grid positions covered per chunk.
+
+        Yields:
+            np.ndarray: Bin edges (ms) of one chunk.
+        """
+        for indices in self.iter_edge_indices(chunk_bins):
+            yield self.edge_values(indices)
+
+    def _removed_edge_ranges(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Merged, inclusive index ranges of the edges removed by the pauses.
+
+        Mirrors ``pause_start_bin``/``pause_stop_bin``: a pause removes the
+        edges from the last edge at or before its start up to the first edge
+        at or after its stop.
+        """
+        if self.pause_starts.size == 0:
+            return np.array([], dtype=int), np.array([], dtype=int)
+
+        last = self.n_edges - 1
+
+        lo = np.floor((self.pause_starts - self.rec_on) / self.step).astype(int)
+        lo = np.clip(lo, 0, last)
+        lo = np.where(self.edge_values(np.clip(lo + 1, 0, last)) <= self.pause_starts,
+                      np.clip(lo + 1, 0, last), lo)
+        lo = np.where(self.edge_values(lo) > self.pause_starts, np.clip(lo - 1, 0, last), lo)
+
+        hi = np.ceil((self.pause_stops - self.rec_on) / self.step).astype(int)
+        hi = np.clip(hi, 0, last)
+        hi = np.where(self.edge_values(np.clip(hi - 1, 0, last)) >= self.pause_stops,
+                      np.clip(hi - 1, 0, last), hi)
+        hi = np.where(self.edge_values(hi) < self.pause_stops, np.clip(hi + 1, 0, last), hi)
+
+        order = np.argsort(lo, kind="stable")
+        lo = lo[order]
+        hi = np.maximum.accumulate(hi[order])
+
+        # merge overlapping or touching ranges
+        new_range = np.concatenate(([True], lo[1:] > hi[:-1] + 1))
+        group_ends = np.concatenate((np.flatnonzero(new_range)[1:] - 1, [len(lo) - 1]))
+        return lo[new_range], hi[group_ends]
+
+
+def iter_spike_counts(
+    grid: BinGrid,
+    spike_times: np.ndarray,
+    chunk_bins: int = CHUNK_BINS,
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Count spikes per bin of a grid, one chunk of bins at a time.
+
+    Counting follows ``np.histogram``: bins are half-open except the very last
+    one. Spikes within the pauses of the grid are dropped.
+
+    Args:
+        grid (BinGrid): Bin edges to count into.
+        spike_times (np.ndarray): Spike timestamps (ms) as a vector.
+        chunk_bins (int): Number of grid positions covered per chunk.
+
+    Yields:
+        Tuple[np.ndarray, np.ndarray]: ``(bin_edges, binned_spikes)`` of one chunk.
+    """
+    spike_times = np.sort(np.asarray(spike_times))
+    if grid.pause_starts.size:
+        spike_times = spike_times[~pause_handling.in_pauses(spike_times, grid.pause_starts,
+                                                            grid.pause_stops)]
+
+    last_edge = grid.n_edges - 1
+    for indices in grid.iter_edge_indices(chunk_bins):
+        edges = grid.edge_values(indices)
+        positions = np.searchsorted(spike_times, edges, side="left")
+        if indices[-1] == last_edge:
+            positions[-1] = np.searchsorted(spike_times, edges[-1], side="right")
+        yield edges, np.diff(positions)
+
+
+def iter_bin_spikes(
+    patient_id: int,
+    session_nr: int,
+    spike_times: np.ndarray,
+    bin_size: int,
+    exclude_pauses: bool,
+    chunk_bins: int = CHUNK_BINS,
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Streaming version of :func:`bin_spikes`.
+
+    Concatenating the yielded counts gives the output of :func:`bin_spikes`;
+    consecutive edge blocks share their boundary edge.
+
+    Args:
+        patient_id (int): ID of the patient.
+        session_nr (int): Session number of the experiment.
+        spike_times (np.ndarray): Spike timestamps (ms) as a vector.
+        bin_size (int): Bin size in milliseconds.
+        exclude_pauses (bool): If ``True``, exclude paused playback intervals.
+        chunk_bins (int): Number of bins handled per chunk.
+
+    Yields:
+        Tuple[np.ndarray, np.ndarray]: ``(bin_edges, binned_spikes)`` of one chunk.
+    """
+    grid = BinGrid.from_session(patient_id, session_nr, bin_size, exclude_pauses)
+    yield from iter_spike_counts(grid, spike_times, chunk_bins)
+
+
+def iter_bin_label(
+    patient_id: int,
+    session_nr: int,
+    values: np.ndarray,
+    start_times: np.ndarray,
+    stop_times: np.ndarray,
+    bin_size: int,
+    exclude_pauses: bool,
+    chunk_bins: int = CHUNK_BINS,
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Streaming version of :func:`bin_label`.
+
+    Args:
+        patient_id (int): ID of patient.
+        session_nr (int): Session number for the movie watching.
+        values (np.ndarray): Values of the label per segment.
+        start_times (np.ndarray): Start times (ms) per segment.
+        stop_times (np.ndarray): Stop times (ms) per segment.
+        bin_size (int): Size of one bin in milliseconds.
+        exclude_pauses (bool): If ``True``, exclude paused playback intervals.
+        chunk_bins (int): Number of bins handled per chunk.
+
+    Yields:
+        Tuple[np.ndarray, np.ndarray]: ``(bin_edges, binned_label)`` of one chunk.
+    """
+    grid = BinGrid.from_session(patient_id, session_nr, bin_size, exclude_pauses)
+
+    for edges in grid.iter_edges(chunk_bins):
+        binned = create_vectors_from_time_points.create_vector_from_start_stop_times_reference(
+            edges, np.array(values), np.array(start_times), np.array(stop_times))
+        yield edges, np.array(binned)
+
+
+def bin_spikes_to_memmap(
+    patient_id: int,
+    session_nr: int,
+    spike_times: np.ndarray,
+    bin_size: int,
+    exclude_pauses: bool,
+    filename: Union[str, Path],
+    chunk_bins: int = CHUNK_BINS,
+) -> np.memmap:
+    """Bin spike times straight into a ``.npy`` file on disk.
+
+    The file is preallocated with :func:`np.lib.format.open_memmap` and filled
+    chunk by chunk, so it can be reopened with ``np.load(filename, mmap_mode='r')``.
+
+    Args:
+        patient_id (int): ID of the patient.
+        session_nr (int): Session number of the experiment.
+        spike_times (np.ndarray): Spike timestamps (ms) as a vector.
+        bin_size (int): Bin size in milliseconds.
+        exclude_pauses (bool): If ``True``, exclude paused playback intervals.
+        filename (Union[str, Path]): Output ``.npy`` file.
+        chunk_bins (int): Number of bins handled per chunk.
+
+    Returns:
+        np.memmap: Binned spikes, backed by ``filename``.
+    """
+    grid = BinGrid.from_session(patient_id, session_nr, bin_size, exclude_pauses)
+    binned_spikes = np.lib.format.open_memmap(filename, mode="w+", dtype=np.int64, shape=(grid.n_bins,))
+
+    position = 0
+    for _, counts in iter_spike_counts(grid, spike_times, chunk_bins):
+        binned_spikes[position:position + len(counts)] = counts
+        position += len(counts)
+
+    binned_spikes.flush()
+    return binned_spikes
+
+
+def iter_lfp_bins(
+    grid: BinGrid,
+    samples: np.ndarray,
+    timestamps: np.ndarray,
+    stat: str = "mean",
+    chunk_bins: int = CHUNK_BINS,
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Reduce continuous samples into the bins of a grid, one chunk at a time.
+
+    Only the samples of the current chunk are read, so ``samples`` and
+    ``timestamps`` may be memory-mapped arrays. Bins follow ``np.histogram``
+    (half-open except the last one); bins without samples and bins spanning a
+    pause are ``NaN``.
+
+    Args:
+        grid (BinGrid): Bin edges to reduce into.
+        samples (np.ndarray): Samples (e.g. microvolts).
+        timestamps (np.ndarray): Sorted sample timestamps (ms).
+        stat (str): ``'mean'``, ``'rms'`` or ``'power'`` (mean squared amplitude).
+        chunk_bins (int): Number of grid positions covered per chunk.
+
+    Yields:
+        Tuple[np.ndarray, np.ndarray]: ``(bin_edges, binned_lfp)`` of one chunk.
+    """
+    if stat not in LFP_STATS:
+        raise ValueError("Unknown statistic '{}', expected one of {}.".format(stat, LFP_STATS))
+
+    last_edge = grid.n_edges - 1
+    for indices in grid.iter_edge_indices(chunk_bins):
+        edges = grid.edge_values(indices)
+        positions = np.searchsorted(timestamps, edges, side="left")
+        if indices[-1] == last_edge:
+            positions[-1] = np.searchsorted(timestamps, edges[-1], side="right")
+
+        chunk = np.asarray(samples[positions[0]:positions[-1]], dtype=float)
+        if stat != "mean":
+            chunk = chunk ** 2
+
+        n_samples = np.diff(positions)
+        binned = np.full(len(n_samples), np.nan)
+        filled = (n_samples > 0) & (np.diff(indices) == 1)
+
+        # reduceat only over bins with samples: the next one starts where the previous one ends
+        non_empty = n_samples > 0
+        if np.any(non_empty):
+            sums = np.add.reduceat(chunk, positions[:-1][non_empty] - positions[0])
+            binned[filled] = sums[filled[non_empty]] / n_samples[filled]
+
+        if stat == "rms":
+            binned = np.sqrt(binned)
+
+        yield edges, binned
+
+
+def lfp_bins_from_chunks(
+    grid: BinGrid,
+    chunks: Iterable[Tuple[np.ndarray, np.ndarray]],
+    stat: str = "mean",
+) -> np.ndarray:
+    """Reduce continuous samples, delivered in chunks, into the bins of a grid.
+
+    Sums and sample counts are accumulated per bin, so only one chunk of
+    samples is held in memory at a time. Bins follow ``np.histogram`` (half-open
+    except the last one); bins without samples and bins spanning a pause are ``NaN``.
+
+    Args:
+        grid (BinGrid): Bin edges to reduce into.
+        chunks (Iterable[Tuple[np.ndarray, np.ndarray]]): ``(timestamps_ms, samples)`` pieces in
+            time order, e.g. from :meth:`~.data_utils.NcsChannel.iter_chunks`.
+        stat (str): ``'mean'``, ``'rms'`` or ``'power'`` (mean squared amplitude).
+
+    Returns:
+        np.ndarray: Binned LFP, one value per bin of the grid.
+    """
+    if stat not in LFP_STATS:
+        raise ValueError("Unknown statistic '{}', expected one of {}.".format(stat, LFP_STATS))
+
+    indices = np.arange(grid.n_edges)
+    indices = indices[grid.kept(indices)]
+    edges = grid.edge_values(indices)
+
+    sums = np.zeros(grid.n_bins)
+    n_samples = np.zeros(grid.n_bins)
+    for timestamps, samples in chunks:
+        samples = np.asarray(samples, dtype=float)
+        if stat != "mean":
+            samples = samples ** 2
+
+        bins = np.searchsorted(edges, timestamps, side="right") - 1
+        # the last edge closes the last bin
+        bins[np.asarray(timestamps) == edges[-1]] = grid.n_bins - 1
+        inside = (bins >= 0) & (bins < grid.n_bins)
+
+        sums += np.bincount(bins[inside], weights=samples[inside], minlength=grid.n_bins)
+        n_samples += np.bincount(bins[inside], minlength=grid.n_bins)
+
+    binned = np.full(grid.n_bins, np.nan)
+    filled = (n_samples > 0) & (np.diff(indices) == 1)
+    binned[filled] = sums[filled] / n_samples[filled]
+
+    if stat == "rms":
+        binned = np.sqrt(binned)
+
+    return binned
+
+
+def bin_lfp(
+    patient_id: int,
+    session_nr: int,
+    csc_nr: int,
+    bin_size: int,
+    stat: str = "mean",
+    exclude_pauses: bool = False,
+    output_edges: bool = False,
+    chunk_bins: int = CHUNK_BINS,
+    path_to_ncs: Optional[Union[str, Path]] = None,
+) -> Union[np.ndarray, List[np.ndarray]]:
+    """Bin an LFP channel into the same bins as :func:`bin_spikes`.
+
+    If the raw ``.ncs`` file of the channel is available (``path_to_ncs``, or
+    ``lfp_data/CSC<csc_nr>.ncs`` in the session directory), its records are
+    streamed chunk by chunk; otherwise the channel is fetched from ``LFPData``.
+
+    Args:
+        patient_id (int): ID of the patient.
+        session_nr (int): Session number of the experiment.
+        csc_nr (int): Channel number in ``LFPData``.
+        bin_size (int): Bin size in milliseconds.
+        stat (str): ``'mean'``, ``'rms'`` or ``'power'`` (mean squared amplitude).
+        exclude_pauses (bool): If ``True``, exclude paused playback intervals.
+        output_edges (bool): If ``True``, also return the bin edges used.
+        chunk_bins (int): Number of bins reduced per chunk.
+        path_to_ncs (Optional[Union[str, Path]]): Raw ``.ncs`` file of the channel.
+
+    Returns:
+        Union[np.ndarray, List[np.ndarray]]: Binned LFP or ``[binned_lfp, bin_edges]`` if requested.
+    """
+    grid = BinGrid.from_session(patient_id, session_nr, bin_size, exclude_pauses)
+
+    if path_to_ncs is None:
+        path_to_ncs = Path(config.PATH_TO_PATIENT_DATA, str(patient_id), f"session_{session_nr}", "lfp_data",
+                           f"CSC{csc_nr}.ncs")
+
+    if os.path.exists(path_to_ncs):
+        binned_lfp = lfp_bins_from_chunks(grid, data_utils.NcsChannel(path_to_ncs).iter_chunks(), stat)
+    else:
+        samples, timestamps, _ = get_lfp_data(patient_id, session_nr, csc_nr)
+        binned_lfp = np.empty(grid.n_bins)
+        position = 0
+        for _, binned in iter_lfp_bins(grid, samples, timestamps, stat, chunk_bins):
+            binned_lfp[position:position + len(binned)] = binned
+            position += len(binned)
+
+    if output_edges:
+        ret = [binned_lfp, grid.edges()]
+    else:
+        ret = binned_lfp
+
+    return ret
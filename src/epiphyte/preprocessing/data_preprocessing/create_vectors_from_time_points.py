@@ -2,11 +2,61 @@
 Functions related to processing the db stored time points (start/stop/values) into vectors for use in analysis. 
 """
 
+from typing import List, Optional, Tuple, Union
+
 import pandas as pd
 import numpy as np
 
 from epiphyte.database.query_functions import *
 import epiphyte.preprocessing.annotation.stimulus_driven_annotation.movies.pause_handling as pause_handling
+import epiphyte.preprocessing.annotation.stimulus_driven_annotation.movies.rle_label as rle_label
+
+def nearest_indices(sorted_vector: np.ndarray, queries: np.ndarray) -> np.ndarray:
+    """Finds, for many time points at once, the index of the nearest value in a vector.
+
+    Uses binary search instead of a full scan per query. Ties are broken like
+    ``np.abs(vector - query).argmin()``, i.e. the lowest index wins. Unsorted
+    vectors are supported through a stable argsort.
+
+    Args:
+        sorted_vector (np.ndarray): The array of timestamps to search, ideally sorted ascending.
+        queries (np.ndarray): Target timestamp(s).
+    Returns:
+        np.ndarray: Index of the nearest value per query (a scalar for a scalar query).
+
+    Example:
+        ```python
+        vector = np.array([1.0, 2.5, 3.8, 5.0])
+        nearest_indices(vector, [3.0, 4.4, 9.0])
+        # array([1, 2, 3])
+        ```
+    """
+    vector = np.asarray(sorted_vector)
+    queries = np.asarray(queries)
+
+    if len(vector) > 1 and np.any(vector[1:] < vector[:-1]):
+        order = np.argsort(vector, kind="stable")
+        vector = vector[order]
+    else:
+        order = None
+
+    last = len(vector) - 1
+    right = np.clip(np.searchsorted(vector, queries, side="left"), 0, last)
+    left = np.clip(right - 1, 0, last)
+
+    # first occurrence of each candidate value, as argmin would report it
+    right = np.searchsorted(vector, vector[right], side="left")
+    left = np.searchsorted(vector, vector[left], side="left")
+
+    distance_left = np.abs(vector[left] - queries)
+    distance_right = np.abs(vector[right] - queries)
+
+    if order is not None:
+        left, right = order[left], order[right]
+
+    nearest = np.where(distance_right < distance_left, right, left)
+    return np.where(distance_right == distance_left, np.minimum(left, right), nearest)[()]
+
 
 def get_index_nearest_timestamp_in_vector(vector: np.ndarray, timestamp: float) -> int:
     """Finds the index of the value in a vector that is nearest to a given timestamp.
@@ -24,7 +74,7 @@ def get_index_nearest_timestamp_in_vector(vector: np.ndarray, timestamp: float)
         # idx == 1
         ```
     """
-    return (np.abs(np.array(vector) - timestamp)).argmin()
+    return nearest_indices(vector, timestamp)
 
 
 def get_nearest_value_from_vector(vector: np.ndarray, timestamp: float) -> float:
@@ -45,14 +95,31 @@ def get_nearest_value_from_vector(vector: np.ndarray, timestamp: float) -> float
         3.8
         ```
     """
-    return vector[(np.abs(np.array(vector) - (timestamp))).argmin()]  # row number with matching pts
+    return vector[nearest_indices(vector, timestamp)]  # row number with matching pts
+
+
+def create_vector_from_segment_lengths(values: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    Creates a vector in which each segment value is repeated as often as its length, in a single allocation.
+    Shared builder of the ``create_vector_from_start_stop_times*`` functions.
+
+    Args:
+        values (np.ndarray): Array of values, one per segment.
+        lengths (np.ndarray): Number of entries per segment; negative lengths count as zero.
+
+    Returns:
+        np.ndarray: Vector of length ``sum(lengths)`` with the dtype of ``values``.
+    """
+    values = np.asarray(values)
+    lengths = np.maximum(np.asarray(lengths, dtype=np.int64), 0)
+    return np.repeat(values, lengths)
 
 
 def create_vector_from_start_stop_times_reference_cont_watch(
     reference_vector: np.ndarray,
-    values: np.ndarray,
-    starts: np.ndarray,
-    stops: np.ndarray,
+    values: Union[np.ndarray, "rle_label.RLELabel"],
+    starts: Optional[np.ndarray] = None,
+    stops: Optional[np.ndarray] = None,
 ) -> np.ndarray:
     """
     Creates a vector aligned to a reference vector using provided start and stop times and corresponding values.
@@ -62,8 +129,8 @@ def create_vector_from_start_stop_times_reference_cont_watch(
     Args:
         reference_vector (np.ndarray): 
             Array of timestamps or bin edges to which the output vector will be aligned.
-        values (np.ndarray): 
-            Array of values to assign to each segment.
+        values (np.ndarray | RLELabel): 
+            Array of values to assign to each segment, or an ``RLELabel`` providing values, starts and stops.
         starts (np.ndarray): 
             Array of start times for each segment.
         stops (np.ndarray): 
@@ -76,31 +143,28 @@ def create_vector_from_start_stop_times_reference_cont_watch(
     Notes:
         Prints an error and returns -1 if the lengths of `values`, `starts`, and `stops` do not match.
     """
+    values, starts, stops = rle_label.unpack_label(values, starts, stops)
+
     # check if input has the correct format
     if not (len(values) == len(starts) == len(stops)):
         print("vectors values, starts and stops have to be the same length")
         return -1
 
-    nr_intervals = len(values)
-    ret = []
-    for i in range(0, nr_intervals):
-        index_dts_start = get_index_nearest_timestamp_in_vector(reference_vector, starts[i])
-        index_dts_stop = get_index_nearest_timestamp_in_vector(reference_vector, stops[i])
-        length_interval = index_dts_stop - index_dts_start
-        if length_interval == 0:
-            ret = np.append(ret, [values[i]])
-        else:
-            ret = np.append(ret, [values[i]] * (length_interval))
+    indices_dts_start = nearest_indices(reference_vector, starts)
+    indices_dts_stop = nearest_indices(reference_vector, stops)
+    lengths_interval = indices_dts_stop - indices_dts_start
+    # a segment that collapses onto a single reference point still contributes one entry
+    lengths_interval[lengths_interval == 0] = 1
 
-    return ret
+    return create_vector_from_segment_lengths(values, lengths_interval)
 
 
 def create_vector_from_start_stop_times(
     patient_id: int,
     session_nr: int,
-    values: np.ndarray,
-    starts: np.ndarray,
-    stops: np.ndarray,
+    values: Union[np.ndarray, "rle_label.RLELabel"],
+    starts: Optional[np.ndarray] = None,
+    stops: Optional[np.ndarray] = None,
 ) -> np.ndarray:
     """
     Less powerful version of the function create_vector_from_start_stop_times_reference_cont_watch
@@ -108,7 +172,7 @@ def create_vector_from_start_stop_times(
     Args:
         patient_id (int): ID of patient
         session_nr (int): unique number of session of patient
-        values (np.ndarray): array indicating all values in the right order
+        values (np.ndarray | RLELabel): array indicating all values in the right order, or an ``RLELabel``
         starts (np.ndarray): array indicating all start times of all segments in the right order
         stops (np.ndarray): array indicating all stop times of all segments as a vector in the right order
         
@@ -118,25 +182,71 @@ def create_vector_from_start_stop_times(
     """
     neural_rec_time = get_patient_neural_rectime(patient_id, session_nr)
 
+    values, starts, stops = rle_label.unpack_label(values, starts, stops)
+
     # check if input has the correct format
     if not (len(values) == len(starts) == len(stops)):
         print("vectors values, starts and stops have to be the same length")
         return -1
 
-    nr_intervals = len(values)
-    ret = []
-    for i in range(0, nr_intervals):
-        index_dts_start = get_index_nearest_timestamp_in_vector(neural_rec_time, starts[i])
-        index_dts_stop = get_index_nearest_timestamp_in_vector(neural_rec_time, stops[i])
-        length_interval = len(neural_rec_time[index_dts_start:index_dts_stop + 1])
-        ret = np.append(ret, [values[i]] * length_interval)
+    indices_dts_start = nearest_indices(neural_rec_time, starts)
+    indices_dts_stop = nearest_indices(neural_rec_time, stops)
+    lengths_interval = indices_dts_stop - indices_dts_start + 1
 
-    return ret
+    return create_vector_from_segment_lengths(values, lengths_interval)
+
+
+def run_length_encode(
+    label: np.ndarray, time_points: Optional[np.ndarray] = None
+) -> Tuple[Union[np.ndarray, List[np.ndarray]], ...]:
+    """
+    Run-length encodes a label into the values, start times and stop times of its segments.
+    A 2D stack of labels (one label per row, all aligned to the same time points) is encoded in one call.
+
+    Args:
+        label (np.ndarray): label vector, or matrix of shape ``(n_labels, n_time_points)``
+        time_points (np.ndarray): time point of each label entry; defaults to the entry index
+
+    Returns:
+        tuple: ``(values, start_times, stop_times)`` arrays, or lists with one array per row for a 2D input.
+
+    Example:
+        ```python
+        run_length_encode(np.array([0, 0, 1, 1, 1, 0]))
+        # (array([0, 1, 0]), array([0, 2, 5]), array([1, 4, 5]))
+        ```
+    """
+    label = np.asarray(label)
+    stacked = label.ndim == 2
+    label = np.atleast_2d(label)
+    n_labels, n_time_points = label.shape
+    time_points = np.arange(n_time_points) if time_points is None else np.asarray(time_points)
+
+    # a segment starts at the first entry and wherever the value changes
+    is_start = np.ones(label.shape, dtype=bool)
+    is_start[:, 1:] = label[:, 1:] != label[:, :-1]
+    rows, start_indices = np.nonzero(is_start)
+
+    stop_indices = np.empty_like(start_indices)
+    stop_indices[:-1] = start_indices[1:] - 1
+    stop_indices[:-1][rows[1:] != rows[:-1]] = n_time_points - 1
+    stop_indices[-1:] = n_time_points - 1
+
+    values = label[rows, start_indices]
+    start_times = time_points[start_indices]
+    stop_times = time_points[stop_indices]
+
+    if not stacked:
+        return values, start_times, stop_times
+
+    row_bounds = np.searchsorted(rows, np.arange(1, n_labels))
+    return (np.split(values, row_bounds), np.split(start_times, row_bounds),
+            np.split(stop_times, row_bounds))
 
 
 def get_start_stop_times_from_label(
     neural_rec_time: np.ndarray, patient_aligned_label: np.ndarray
-) -> tuple[list, list, list]:
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
     """
     This function extracts the start and stop times from a label.
     `patient_aligned_label` has to have the same length as `neural_rec_time`
@@ -144,24 +254,13 @@ def get_start_stop_times_from_label(
 
     Args:
         neural_rec_time (np.ndarray): array indicating neural recording time
-        patient_aligned_label (np.ndarray): array indicating label aligned to patient time
+        patient_aligned_label (np.ndarray): array indicating label aligned to patient time,
+            or a 2D stack of such labels (see :func:`run_length_encode`)
 
     Returns:
         tuple: ``(values, start_times, stop_times)`` arrays.
     """
-    tmp = patient_aligned_label[0]
-    values = [tmp]
-    start_times = [neural_rec_time[0]]
-    stop_times = []
-    for i in range(1, len(patient_aligned_label)):
-        if not patient_aligned_label[i] == tmp:
-            values.append(patient_aligned_label[i])
-            start_times.append(neural_rec_time[i])
-            stop_times.append(neural_rec_time[i - 1])
-            tmp = patient_aligned_label[i]
-    stop_times.append(neural_rec_time[-1])
-
-    return values, start_times, stop_times
+    return run_length_encode(patient_aligned_label, neural_rec_time)
 
 
 def get_bins_excl_pauses(
@@ -192,9 +291,9 @@ def get_bins_excl_pauses(
 
 def create_vector_from_start_stop_times_reference(
     reference_vector: np.ndarray,
-    values: np.ndarray,
-    starts: np.ndarray,
-    stops: np.ndarray,
+    values: Union[np.ndarray, "rle_label.RLELabel"],
+    starts: Optional[np.ndarray] = None,
+    stops: Optional[np.ndarray] = None,
 ) -> np.ndarray:
     """
     Create an indicator function from values, start and stop times of a label aligned to a reference vector of time points. 
@@ -202,24 +301,31 @@ def create_vector_from_start_stop_times_reference(
 
     Args:
         reference_vector (np.ndarray): vector of linearly spaced time points (e.g. bin edges)
-        values (np.ndarray): values indicating presence or absence of a labeled feature
+        values (np.ndarray | RLELabel): values indicating presence or absence of a labeled feature, or an ``RLELabel``
         starts (np.ndarray): start times of the corresponding values 
         stops (np.ndarray): stop times of the corresponding values
 
     Returns:
         np.ndarray: indicator function vector.
     """
+    values, starts, stops = rle_label.unpack_label(values, starts, stops)
+
     # check if input has the correct format
     if not (len(values) == len(starts) == len(stops)):
         print("vectors values, starts and stops have to be the same length")
         return -1
 
-    ret = []
+    reference_vector = np.asarray(reference_vector)
+    values = np.asarray(values)
 
-    for i in range(0, len(reference_vector) - 1):
-        value = get_value_in_time_frame(time_point1=reference_vector[i], time_point2=reference_vector[i + 1],
-                                        values=values, start_times=starts, end_times=stops)
-        ret.append(value)
+    # look up the segments of all bins at once; only bins covering several segments need weighing
+    indices_1 = get_index_matching_start_point(reference_vector[:-1], values, starts, stops)
+    indices_2 = get_index_matching_stop_point(reference_vector[1:], values, starts, stops)
+    ret = list(values[indices_1])
+
+    for i in np.flatnonzero(indices_1 != indices_2):
+        ret[i] = get_most_represented_value(reference_vector[i], reference_vector[i + 1], indices_1[i], indices_2[i],
+                                            values, starts, stops)
 
     return ret
 
@@ -277,22 +383,21 @@ def get_index_matching_start_point(
 ) -> int:
     """
     Finds the index of the start point that is the closest start point smaller than 'time_point'.
+    Accepts an array of time points, in which case all indices are looked up at once.
 
     Args:
-        time_point (float): the time point for which the value shall be searched
+        time_point (float | np.ndarray): the time point(s) for which the value shall be searched
         values (np.ndarray): vector with all values
         start_times (np.ndarray): vector with all start times
         end_times (np.ndarray): vector with all stop times
 
     Returns:
-        float: Value corresponding to the time point.
+        int | np.ndarray: Index (or indices) of the matching start point.
     """
-    index = get_index_nearest_timestamp_in_vector(start_times, time_point)
-    if time_point < start_times[index]:
-        if time_point < start_times[0]:
-            return index
-        index -= 1
-    return index
+    start_times = np.asarray(start_times)
+    index = nearest_indices(start_times, time_point)
+    step_back = (time_point < start_times[index]) & ~(time_point < start_times[0])
+    return index - step_back
 
 
 def get_index_matching_stop_point(
@@ -300,22 +405,21 @@ def get_index_matching_stop_point(
 ) -> int:
     """
     Finds the index of the stop point that is the closest stop point greater than 'time_point'.
+    Accepts an array of time points, in which case all indices are looked up at once.
     
     Args:
-        time_point (float): the time point for which the value shall be searched
+        time_point (float | np.ndarray): the time point(s) for which the value shall be searched
         values (np.ndarray): vector with all values
         start_times (np.ndarray): vector with all start times
         end_times (np.ndarray): vector with all stop times
 
     Returns:
-        float: Value corresponding to the time point.
+        int | np.ndarray: Index (or indices) of the matching stop point.
     """
-    index = get_index_nearest_timestamp_in_vector(end_times, time_point)
-    if time_point >= end_times[index]:
-        if time_point >= end_times[-1]:
-            return index
-        index += 1
-    return index
+    end_times = np.asarray(end_times)
+    index = nearest_indices(end_times, time_point)
+    step_forward = (time_point >= end_times[index]) & ~(time_point >= end_times[-1])
+    return index + step_forward
 
 
 def get_value_in_time_frame(
@@ -343,43 +447,70 @@ def get_value_in_time_frame(
     index_2 = get_index_matching_stop_point(time_point2, values, start_times, end_times)
     if index_1 == index_2:
         return values[index_1]
-    else:
+
+    return get_most_represented_value(time_point1, time_point2, index_1, index_2, values, start_times, end_times)
+
+
+def get_most_represented_value(
+    time_point1: float,
+    time_point2: float,
+    index_1: int,
+    index_2: int,
+    values: np.ndarray,
+    start_times: np.ndarray,
+    end_times: np.ndarray,
+) -> float:
+    """
+    Weighs the segments ``index_1`` to ``index_2`` by their overlap with a time frame and returns the heaviest value.
+    Used by :func:`get_value_in_time_frame` once the first and last segment of the time frame are known.
+
+    Args:
+        time_point1 (float): lower bound of time frame
+        time_point2 (float): upper bound of time frame that is regarded
+        index_1 (int): index of the segment containing ``time_point1``
+        index_2 (int): index of the segment containing ``time_point2``
+        values (np.ndarray): vector with all values
+        start_times (np.ndarray): vector with all start time points
+        end_times (np.ndarray): vector with all stop time points
+
+    Returns:
+        float: value most represented within the time frame.
+    """
+    # first interval: add weighing of end_point of this segment - timepoint1
+    df = pd.DataFrame([{
+        "value": values[index_1],
+        "weighing": end_times[index_1] - time_point1
+    }])
+    # all in between intervals: add weighing of length of segment
+    for i in range(1, index_2 - index_1):
+        if values[index_1 + i] in df.values:
+            df.loc[df["value"] == values[index_1 + i], "weighing"] += end_times[index_1 + i] - start_times[
+                index_1 + i]
         
-        # first interval: add weighing of end_point of this segment - timepoint1
-        df = pd.DataFrame([{
-            "value": values[index_1],
-            "weighing": end_times[index_1] - time_point1
-        }])
-        # all in between intervals: add weighing of length of segment
-        for i in range(1, index_2 - index_1):
-            if values[index_1 + i] in df.values:
-                df.loc[df["value"] == values[index_1 + i], "weighing"] += end_times[index_1 + i] - start_times[
-                    index_1 + i]
-            
-            df = pd.concat(
-                [
-                    df,
-                    pd.DataFrame(
-                        [{
-                            "value": values[index_1 + i],
-                            "weighing": end_times[index_1 + i] - start_times[index_1 + i]
-                        }]
-                    )
-                ],
-                ignore_index=True
-            )
-        # last interval: add weighing of timepoint2 - start_point of this segment
         df = pd.concat(
-                [
-                    df,
-                    pd.DataFrame(
-                        [{
-                            "value": values[index_2],
-                            "weighing": time_point2 - start_times[index_2]
-                        }]
-                    )
-                ],
-                ignore_index=True
-            )
+            [
+                df,
+                pd.DataFrame(
+                    [{
+                        "value": values[index_1 + i],
+                        "weighing": end_times[index_1 + i] - start_times[index_1 + i]
+                    }]
+                )
+            ],
+            ignore_index=True
+        )
+    # last interval: add weighing of timepoint2 - start_point of this segment
+    df = pd.concat(
+            [
+                df,
+                pd.DataFrame(
+                    [{
+                        "value": values[index_2],
+                        "weighing": time_point2 - start_times[index_2]
+                    }]
+                )
+            ],
+            ignore_index=True
+        )
 
     return list(df[df['weighing'] == df['weighing'].max()]["value"])[0]
@@ -4,8 +4,11 @@ Provides helpers to read ``.nev`` (and mock ``.npy``) event files, parse
 watchlogs/DAQ logs, and linearly align between local computer time and neural
 recording system time.
 """
+import bisect
+import os
+import warnings
 from pathlib import Path
-from typing import List, Tuple, Union
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
 import numpy as np
 
@@ -19,9 +22,93 @@ nev_type = np.dtype([('', 'V6'),
                      ('ev_string', 'S128')])
 
 
+NEV_CHUNK_RECORDS = 1 << 20
+
+
+def nev_events(filename: Union[str, Path]) -> np.ndarray:
+    """Event records of a ``.nev`` file as a zero-copy, read-only structured view.
+
+    Fields keep their on-disk dtypes (``timestamp`` as ``u8`` µs, ``nttl`` as
+    ``i2``, ``ev_string`` as ``S128``); nothing is read until it is accessed.
+    Mock ``.npy`` event arrays ``(timestamp, nttl)`` are converted to the same
+    record layout.
+
+    Args:
+        filename (Union[str, Path]): Path to ``.nev`` or mock ``.npy`` array.
+
+    Returns:
+        np.ndarray: Records of dtype :data:`nev_type` (a ``np.memmap`` for ``.nev`` files).
+    """
+    filename = Path(filename)
+
+    if filename.suffix.lower() == ".npy":
+        ev_array = np.load(filename)
+        events = np.zeros(len(ev_array), dtype=nev_type)
+        events['timestamp'] = ev_array[:, 0]
+        events['nttl'] = ev_array[:, 1]
+        return events
+
+    return np.memmap(filename, dtype=nev_type, mode='r', offset=NLX_OFFSET)
+
+
+def iter_nev_chunks(filename: Union[str, Path], chunk_size: int = NEV_CHUNK_RECORDS) -> Iterator[np.ndarray]:
+    """Iterate over the event records of a ``.nev`` file in chunks of views.
+
+    Args:
+        filename (Union[str, Path]): Path to ``.nev`` or mock ``.npy`` array.
+        chunk_size (int): Number of records per chunk.
+
+    Yields:
+        np.ndarray: Consecutive slices of :func:`nev_events` (no copies).
+    """
+    events = nev_events(filename)
+    for first in range(0, len(events), chunk_size):
+        yield events[first:first + chunk_size]
+
+
+def nev_select(
+    filename: Union[str, Path],
+    codes: Optional[List[int]] = None,
+    start: Optional[int] = None,
+    stop: Optional[int] = None,
+    chunk_size: int = NEV_CHUNK_RECORDS,
+) -> np.ndarray:
+    """Select event records by TTL code and/or time range.
+
+    The time range is located by binary search on the (sorted) timestamps of
+    the memory map, so only the records inside it are read; these are then
+    filtered by code chunk by chunk. Only the matching records are copied.
+
+    Args:
+        filename (Union[str, Path]): Path to ``.nev`` or mock ``.npy`` array.
+        codes (Optional[List[int]]): TTL codes to keep; all codes if ``None``.
+        start (Optional[int]): First timestamp to keep (µs, inclusive).
+        stop (Optional[int]): Last timestamp to keep (µs, inclusive).
+        chunk_size (int): Number of records filtered at once.
+
+    Returns:
+        np.ndarray: Matching records of dtype :data:`nev_type`.
+    """
+    events = nev_events(filename)
+    timestamps = events['timestamp']
+
+    first = 0 if start is None else bisect.bisect_left(timestamps, start)
+    last = len(events) if stop is None else bisect.bisect_right(timestamps, stop)
+
+    selected = []
+    for chunk_start in range(first, last, chunk_size):
+        chunk = events[chunk_start:min(chunk_start + chunk_size, last)]
+        selected.append(np.array(chunk if codes is None else chunk[np.isin(chunk['nttl'], codes)]))
+
+    return np.concatenate(selected) if selected else np.zeros(0, dtype=nev_type)
+
+
 def nev_read(filename: Union[str, Path]) -> np.ndarray:
     """Read event timestamps and codes from ``.nev`` or mock ``.npy`` file.
 
+    Kept for the ``(N, 2)`` float layout expected by :func:`process_events`; see
+    :func:`nev_events` and :func:`nev_select` for typed, zero-copy access.
+
     Args:
         filename (Union[str, Path]): Path to ``.nev`` or mock ``.npy`` array.
 
@@ -31,7 +118,7 @@ def nev_read(filename: Union[str, Path]) -> np.ndarray:
     filename = Path(filename)
 
     if filename.suffix.lower() == ".nev":
-        eventmap = np.memmap(filename, dtype=nev_type, mode='r', offset=NLX_OFFSET)
+        eventmap = nev_events(filename)
         ret = np.array([eventmap['timestamp'], eventmap['nttl']]).T
     elif filename.suffix.lower() == ".npy":
         ret = np.load(filename)
@@ -47,43 +134,192 @@ def nev_string_read(filename: Union[str, Path]) -> np.ndarray:
     Returns:
         np.ndarray: ``(timestamp, ev_string)`` array of shape ``(N, 2)``.
     """
-    eventmap = np.memmap(filename, dtype=nev_type, mode='r', offset=NLX_OFFSET)
+    eventmap = nev_events(filename)
     return np.array([eventmap['timestamp'], eventmap['ev_string']]).T
 
 
-def process_movie_events(ev_array: np.ndarray) -> np.ndarray:
-    """Filter raw event rows to the movie-event sequence.
+NCS_SAMPLES_PER_RECORD = 512
+NCS_CHUNK_RECORDS = 1 << 14
+
+ncs_type = np.dtype([('timestamp', 'u8'),
+                     ('channel', 'u4'),
+                     ('sample_rate', 'u4'),
+                     ('n_valid', 'u4'),
+                     ('samples', 'i2', (NCS_SAMPLES_PER_RECORD,))])
+
+
+def nlx_header(filename: Union[str, Path]) -> Dict[str, str]:
+    """Parse the 16 kB text header of a Neuralynx file.
 
     Args:
-        ev_array (np.ndarray): ``(timestamp, code)`` array.
+        filename (Union[str, Path]): Path to ``.ncs`` or ``.nev`` file.
+
     Returns:
-        np.ndarray: Filtered movie event rows.
+        Dict[str, str]: Header entries, e.g. ``{"SamplingFrequency": "32000", "ADBitVolts": "3.05e-08"}``.
+    """
+    with open(filename, 'rb') as nlxfile:
+        text = nlxfile.read(NLX_OFFSET).rstrip(b"\x00").decode("latin-1")
+
+    header = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("-"):
+            key, _, value = line[1:].partition(" ")
+            header[key] = value.strip()
+    return header
+
+
+class NcsChannel(object):
+    """Zero-copy reader for a Neuralynx ``.ncs`` continuous channel.
+
+    The 512-sample records are memory-mapped; sample timestamps are only
+    reconstructed for the records that are requested.
+
+    Attributes:
+        filename (Path): Path to the ``.ncs`` file.
+        header (Dict[str, str]): Parsed text header.
+        records (np.memmap): Records of dtype :data:`ncs_type`.
+        sample_rate (float): Sampling frequency (Hz).
+        bit_volts (float): Volts per AD bit, used to convert samples to microvolts.
     """
 
-    wait_for = [1]
-    last = 0
-    keep = []
+    def __init__(self, filename: Union[str, Path]) -> None:
+        self.filename = Path(filename)
+        self.header = nlx_header(filename)
+        self.records = np.memmap(filename, dtype=ncs_type, mode='r', offset=NLX_OFFSET)
+
+        if "SamplingFrequency" in self.header:
+            self.sample_rate = float(self.header["SamplingFrequency"])
+        else:
+            self.sample_rate = float(self.records['sample_rate'][0]) if len(self.records) else 0.
+        self.bit_volts = float(self.header.get("ADBitVolts", 1e-6))
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def _n_valid(self, records: np.ndarray, warn: bool = True) -> np.ndarray:
+        # corrupt records may claim more samples than a record holds
+        n_valid = records['n_valid']
+        too_many = n_valid > NCS_SAMPLES_PER_RECORD
+        if warn and np.any(too_many):
+            warnings.warn("{}: {} records with n_valid > {}, clipped.".format(
+                self.filename, int(np.sum(too_many)), NCS_SAMPLES_PER_RECORD))
+        return np.minimum(n_valid, NCS_SAMPLES_PER_RECORD)
+
+    def _valid(self, records: np.ndarray) -> np.ndarray:
+        return np.arange(NCS_SAMPLES_PER_RECORD) < self._n_valid(records)[:, None]
+
+    def samples(self, first: int = 0, stop: Optional[int] = None, microvolts: bool = True) -> np.ndarray:
+        """Valid samples of a range of records.
+
+        Args:
+            first (int): First record.
+            stop (Optional[int]): Record to stop before; all remaining records if ``None``.
+            microvolts (bool): If ``True``, scale the raw AD values to microvolts.
+
+        Returns:
+            np.ndarray: Samples of the records, concatenated.
+        """
+        records = self.records[first:stop]
+        samples = records['samples'][self._valid(records)]
+        return samples * (self.bit_volts * 1e6) if microvolts else samples
+
+    def timestamps(self, first: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """Timestamps (ms) of the valid samples of a range of records.
+
+        Each record stores the timestamp (µs) of its first sample; the others
+        follow at the sampling rate.
+        """
+        records = self.records[first:stop]
+        offsets = np.arange(NCS_SAMPLES_PER_RECORD) * (1e6 / self.sample_rate)
+        timestamps = records['timestamp'][:, None] + offsets
+        return timestamps[self._valid(records)] / 1000
+
+    def iter_chunks(self, chunk_records: int = NCS_CHUNK_RECORDS) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Iterate over the channel in chunks of records.
 
-    for row in ev_array:
-        code = row[1].astype(int)
+        Yields:
+            Tuple[np.ndarray, np.ndarray]: ``(timestamps_ms, samples_uv)`` of each chunk.
+        """
+        for first in range(0, len(self), chunk_records):
+            yield self.timestamps(first, first + chunk_records), self.samples(first, first + chunk_records)
+
+    def read(self, chunk_records: int = NCS_CHUNK_RECORDS) -> Tuple[np.ndarray, np.ndarray]:
+        """Read the whole channel chunk by chunk into preallocated arrays.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: ``(timestamps_ms, samples_uv)``.
+        """
+        n_samples = int(np.sum(self._n_valid(self.records, warn=False), dtype=np.int64))
+        timestamps = np.empty(n_samples)
+        samples = np.empty(n_samples)
+
+        position = 0
+        for chunk_timestamps, chunk_samples in self.iter_chunks(chunk_records):
+            timestamps[position:position + len(chunk_samples)] = chunk_timestamps
+            samples[position:position + len(chunk_samples)] = chunk_samples
+            position += len(chunk_samples)
+
+        return timestamps, samples
 
-        if code not in wait_for:
-            continue
 
-        elif code in [1, 2, 4, 8, 16, 32, 64, 128]:
-            wait_for = [0]
-            keep.append(row)
+MOVIE_EVENT_CODES = np.array([1, 2, 4, 8, 16, 32, 64, 128])
 
-        elif code == 0:
 
-            if last == 128:
-                wait_for = [1]
-            elif last in [1, 2, 4, 8, 16, 32, 64]:
-                wait_for = [last * 2]
+def process_movie_events(ev_array: np.ndarray, return_broken: bool = False) -> Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+    """Filter raw event rows to the movie-event sequence.
 
-        last = code
+    The movie pings cycle through ``1, 2, 4, ..., 128``, each followed by a
+    ``0``. Starting at the first ``1``, the sequence is followed greedily: after
+    a ping, the next ``0`` is awaited, then the next occurrence of the
+    successor code, and all other rows are skipped.
 
-    return np.array(keep)
+    Instead of stepping through the rows, the successor of every ping (the
+    next successor code after the next ``0``) is looked up with
+    ``searchsorted``, and the chain starting at the first ``1`` is followed
+    by pointer doubling.
+
+    Args:
+        ev_array (np.ndarray): ``(timestamp, code)`` array.
+        return_broken (bool): If ``True``, also return the row indices of pings
+            that are not part of the sequence.
+    Returns:
+        np.ndarray: Filtered movie event rows (and, optionally, the indices of the skipped pings).
+    """
+    codes = np.asarray(ev_array)[:, 1].astype(int) if len(ev_array) else np.zeros(0, dtype=int)
+
+    ping_rows = np.flatnonzero(np.isin(codes, MOVIE_EVENT_CODES))
+    ping_levels = np.searchsorted(MOVIE_EVENT_CODES, codes[ping_rows])
+    zero_rows = np.flatnonzero(codes == 0)
+    n_pings = len(ping_rows)
+
+    # successor of every ping, as index into ping_rows (n_pings if there is none)
+    next_zero = np.searchsorted(zero_rows, ping_rows, side="right")
+    after_zero = np.append(zero_rows, len(codes))[next_zero]
+    successor = np.full(n_pings + 1, n_pings)
+    for level in range(len(MOVIE_EVENT_CODES)):
+        candidates = np.flatnonzero(ping_levels == level)
+        waiting = np.flatnonzero(ping_levels == (level - 1) % len(MOVIE_EVENT_CODES))
+        position = np.searchsorted(ping_rows[candidates], after_zero[waiting], side="right")
+        successor[waiting] = np.append(candidates, n_pings)[position]
+
+    # follow the chain from the first 1, doubling the jump length every round
+    first = np.flatnonzero(ping_levels == 0)[:1]
+    chain = first
+    jump = successor
+    while len(chain):
+        reached = jump[chain]
+        if np.all(reached == n_pings):
+            break
+        chain = np.concatenate((chain, reached))
+        jump = jump[jump]
+
+    chain = np.unique(chain[chain < n_pings])
+    keep = np.array(ev_array)[ping_rows[chain]] if len(chain) else np.array([])
+
+    if return_broken:
+        return keep, np.setdiff1d(ping_rows, ping_rows[chain])
+    return keep
 
 
 def process_events(ev_array: np.ndarray) -> np.ndarray:
@@ -133,6 +369,192 @@ def getlines(filename: Union[str, Path]) -> list[bytes]:
     return lines
 
 
+WATCHLOG_DATA_FIELDS = 4
+_watchlog_cache = {}
+_WHITESPACE = np.zeros(256, dtype=bool)
+_WHITESPACE[[ord(" "), ord("\t"), ord("\r"), ord("\n"), ord("\v"), ord("\f")]] = True
+
+
+def _tokenize(data: bytes) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Split a text buffer into whitespace separated tokens without a per-line Python loop.
+
+    Args:
+        data (bytes): File content.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: ``(buffer, token_starts, token_stops, line_tokens)``:
+        the buffer as ``uint8`` array, start and (exclusive) stop offset of every token, and
+        the index of the first token of every line (plus the total number of tokens at the end).
+    """
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    is_space = np.concatenate(([True], _WHITESPACE[buffer], [True]))
+
+    token_starts = np.flatnonzero(~is_space[1:-1] & is_space[:-2])
+    token_stops = np.flatnonzero(~is_space[1:-1] & is_space[2:]) + 1
+
+    line_starts = np.concatenate(([0], np.flatnonzero(buffer == ord("\n")) + 1))
+    line_tokens = np.append(np.searchsorted(token_starts, line_starts), len(token_starts))
+
+    return buffer, token_starts, token_stops, line_tokens
+
+
+def _token_strings(buffer: np.ndarray, starts: np.ndarray, stops: np.ndarray, width: Optional[int] = None) -> np.ndarray:
+    """Gather tokens into a fixed-width bytes array (truncated to ``width``), ready for ``astype``."""
+    lengths = stops - starts
+    if width is None:
+        width = int(lengths.max()) if len(lengths) else 1
+
+    windows = np.lib.stride_tricks.sliding_window_view(np.append(buffer, np.zeros(width, dtype=np.uint8)), width)
+    chars = windows[starts] * (np.arange(width) < lengths[:, None])
+    return chars.view("S{}".format(width)).ravel()
+
+
+def _integer_digits(buffer: np.ndarray, starts: np.ndarray, stops: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Right-aligned digit matrix of tokens, and whether each token is an integer (digits with an optional sign)."""
+    lengths = stops - starts
+    width = int(lengths.max()) if len(lengths) else 1
+
+    # right-aligned windows over the buffer, padded in front
+    windows = np.lib.stride_tricks.sliding_window_view(np.append(np.zeros(width, dtype=np.uint8), buffer), width)
+    digits = windows[stops] - np.uint8(ord("0"))
+    columns = np.arange(width)
+    outside = columns < width - lengths[:, None]
+    leading_sign = (columns == width - lengths[:, None]) & (lengths[:, None] > 1) & \
+        ((windows[stops] == ord("-")) | (windows[stops] == ord("+")))
+
+    valid = np.all(outside | leading_sign | (digits <= 9), axis=1)
+    # signs, and characters in front of the token, do not contribute
+    digits[outside | leading_sign] = 0
+    return digits, valid
+
+
+def _token_integers(buffer: np.ndarray, starts: np.ndarray, stops: np.ndarray) -> np.ndarray:
+    """Convert integer tokens (digits with an optional sign) with digit arithmetic instead of string parsing.
+
+    Raises:
+        ValueError: If a token is not an integer, e.g. ``16000.5``.
+    """
+    if not len(starts):
+        return np.zeros(0, dtype=np.int64)
+    digits, valid = _integer_digits(buffer, starts, stops)
+    if not valid.all():
+        bad = np.flatnonzero(~valid)[0]
+        raise ValueError("invalid literal for int(): {!r}".format(buffer[starts[bad]:stops[bad]].tobytes().decode(
+            errors="replace")))
+    width = digits.shape[1]
+
+    values = np.zeros(len(starts), dtype=np.int64)
+    for column in range(width):
+        values *= 10
+        values += digits[:, column]
+    values[buffer[starts] == ord("-")] *= -1
+    return values
+
+
+class ParsedWatchlog(object):
+    """Content of an ffplay watchlog, parsed in a single pass.
+
+    Attributes:
+        pts (np.ndarray): PTS of every frame line (s).
+        cpu_time (np.ndarray): CPU time of every frame line (µs).
+        line_numbers (np.ndarray): Line number of every frame line in the file.
+        pause_start_times (np.ndarray): CPU time of the frame before each ``Pausing`` marker (µs).
+        pause_stop_times (np.ndarray): CPU time of the frame after each ``Continuing`` marker and,
+            for a ``Properly`` terminated log, of the frame three lines before that marker (µs).
+        properly_terminated (bool): Whether the log contains a ``Properly`` termination marker.
+        marker_lines (Dict[str, np.ndarray]): Line numbers of the ``Pausing``, ``Continuing`` and
+            ``Properly`` markers.
+    """
+
+    def __init__(self, pts: np.ndarray, cpu_time: np.ndarray, line_numbers: np.ndarray,
+                 pause_start_times: np.ndarray, pause_stop_times: np.ndarray, properly_terminated: bool,
+                 marker_lines: Optional[Dict[str, np.ndarray]] = None) -> None:
+        self.pts = pts
+        self.cpu_time = cpu_time
+        self.line_numbers = line_numbers
+        self.pause_start_times = pause_start_times
+        self.pause_stop_times = pause_stop_times
+        self.properly_terminated = properly_terminated
+        self.marker_lines = {} if marker_lines is None else marker_lines
+
+
+def parse_watchlog_buffer(data: bytes) -> ParsedWatchlog:
+    """Parse the content of an ffplay watchlog.
+
+    Frame lines are all lines after the first one with exactly four fields
+    (``pts <pts> time <cpu_time>``). The buffer is tokenized as a whole, and the
+    numeric fields are converted in bulk.
+
+    Args:
+        data (bytes): Content of the watchlog.
+
+    Returns:
+        ParsedWatchlog: Frame times and pause/termination markers.
+    """
+    buffer, token_starts, token_stops, line_tokens = _tokenize(data)
+    fields_per_line = np.diff(line_tokens)
+    first_token = line_tokens[:-1]
+
+    line_numbers = np.flatnonzero(fields_per_line == WATCHLOG_DATA_FIELDS)
+    line_numbers = line_numbers[line_numbers > 0]
+    pts_tokens = first_token[line_numbers] + 1
+    time_tokens = first_token[line_numbers] + 3
+
+    pts = _token_strings(buffer, token_starts[pts_tokens], token_stops[pts_tokens]).astype(float)
+    cpu_time = _token_integers(buffer, token_starts[time_tokens], token_stops[time_tokens])
+
+    # markers are recognised by the first token of a line that is not a frame line
+    marker_lines = np.flatnonzero((fields_per_line > 0) & (fields_per_line != WATCHLOG_DATA_FIELDS))
+    marker_tokens = first_token[marker_lines]
+    first_words = _token_strings(buffer, token_starts[marker_tokens], token_stops[marker_tokens], width=10)
+    pausing = marker_lines[np.char.startswith(first_words, b"Pausing")]
+    continuing = marker_lines[np.char.startswith(first_words, b"Continuing")]
+    properly = marker_lines[np.char.startswith(first_words, b"Properly")]
+
+    # frame line at/before (pausing, properly) or at/after (continuing) the line of reference
+    start_rows = np.searchsorted(line_numbers, pausing - 1, side="right") - 1
+    continue_rows = np.searchsorted(line_numbers, continuing + 1, side="left")
+    properly_rows = np.searchsorted(line_numbers, properly - 3, side="right") - 1
+
+    stop_lines = np.concatenate((continuing, properly))
+    stop_rows = np.concatenate((continue_rows, properly_rows))[np.argsort(stop_lines, kind="stable")]
+
+    # markers without a frame before (pausing, properly) or after (continuing) them, e.g. at the
+    # end of a log that is still being written, have no time yet
+    start_rows = start_rows[start_rows >= 0]
+    stop_rows = stop_rows[(stop_rows >= 0) & (stop_rows < len(cpu_time))]
+
+    return ParsedWatchlog(pts, cpu_time, line_numbers, cpu_time[start_rows], cpu_time[stop_rows], len(properly) > 0,
+                          {"Pausing": pausing, "Continuing": continuing, "Properly": properly})
+
+
+def parse_watchlog(watchlogfile: Union[str, Path]) -> ParsedWatchlog:
+    """Read and parse an ffplay watchlog in a single pass.
+
+    The result of the last parsed file is kept until the file changes, so
+    ``read_watchlog``, ``read_watchlog_pauses`` and ``WatchLog`` share one pass.
+    Its arrays are read-only, as every caller gets the same cached objects.
+
+    Args:
+        watchlogfile (Union[str, Path]): Path to watchlog created by ffmpeg wrapper.
+
+    Returns:
+        ParsedWatchlog: Frame times and pause/termination markers.
+    """
+    stat = os.stat(watchlogfile)
+    cache_key = (os.path.abspath(watchlogfile), stat.st_mtime_ns, stat.st_size)
+    if cache_key not in _watchlog_cache:
+        with open(watchlogfile, 'rb') as logfile:
+            data = logfile.read()
+        watchlog = parse_watchlog_buffer(data)
+        for array in [watchlog.pts, watchlog.cpu_time, watchlog.line_numbers, watchlog.pause_start_times,
+                      watchlog.pause_stop_times] + list(watchlog.marker_lines.values()):
+            array.setflags(write=False)
+        _watchlog_cache.clear()
+        _watchlog_cache[cache_key] = watchlog
+    return _watchlog_cache[cache_key]
+
+
 def read_watchlog(watchlogfile: Union[str, Path]) -> Tuple[np.ndarray, np.ndarray]:
     """Extract PTS (s) and CPU times (µs) from a watchlog.
 
@@ -142,19 +564,8 @@ def read_watchlog(watchlogfile: Union[str, Path]) -> Tuple[np.ndarray, np.ndarra
     Returns:
         Tuple[np.ndarray, np.ndarray]: Tuple ``(pts_seconds, cpu_time_us)``.
     """
-    lines = getlines(watchlogfile)
-    pts = []
-    time = []
-
-    for line in lines[1:]:
-        fields  = line.split()
-        if len(fields) == 4:
-            pts.append(float(fields[1]))
-            time.append(int(fields[3]))
-
-    pts = np.array(pts)
-    time = np.array(time)
-    return pts, time
+    watchlog = parse_watchlog(watchlogfile)
+    return watchlog.pts, watchlog.cpu_time
 
 
 def read_watchlog_pauses(watchlogfile: Union[str, Path]) -> Tuple[List[int], List[int]]:
@@ -165,80 +576,96 @@ def read_watchlog_pauses(watchlogfile: Union[str, Path]) -> Tuple[List[int], Lis
     Returns:
         Tuple[List[int], List[int]]: ``(start_times_us, stop_times_us)`` lists.
     """
-    lines = getlines(watchlogfile)
-    start_time = []
-    stop_time = []
-
-    for i, line in enumerate(lines):
-        fields = line.split()
-        first = str(fields[0])
-        # print(first)
-        if "Pausing" in first:
-            # print(line)
-            start = i - 1
-            start_line = lines[start]
-            # print(start_line)
-            start_fields = start_line.split()
-            start_time.append(int(start_fields[3]))
-
-        if "Continuing" in first:
-            # print(line)
-            stop = i + 1
-            stop_line = lines[stop]
-            stop_fields = stop_line.split()
-            stop_time.append(int(stop_fields[3]))
-
-        if "Properly" in first:
-            start = i - 3
-            start_line = lines[start]
-            # print(start_line)
-            start_fields = start_line.split()
-            stop_time.append(int(start_fields[3]))
-
-    return start_time, stop_time
+    watchlog = parse_watchlog(watchlogfile)
+    return watchlog.pause_start_times.tolist(), watchlog.pause_stop_times.tolist()
 
 
-def read_daqlog(daqlogfile: Union[str, Path]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
-    """Extract DAQ values and pre/post times.
+DAQLOG_HEADER_LINES = 3
+
+daq_type = np.dtype([('value', 'i8'),
+                     ('stamp', 'i8'),
+                     ('pretime', 'i8'),
+                     ('posttime', 'i8')])
+
+
+def load_daqlog(daqlogfile: Union[str, Path], header_lines: int = DAQLOG_HEADER_LINES) -> Tuple[np.ndarray, np.ndarray]:
+    """Load the numeric body of a timedDAQ log into a structured array.
+
+    The signature header is skipped and the body is loaded with a single
+    ``np.loadtxt`` call. If that fails, the log is tokenized as a whole and
+    rows that do not consist of four integer fields are reported and left out.
 
     Args:
         daqlogfile (Union[str, Path]): Path to DAQ log file.
+        header_lines (int): Number of header lines before the body.
 
     Returns:
-        Tuple[np.ndarray, np.ndarray, np.ndarray]: ``(values, pretime_us, posttime_us)`` arrays.
+        Tuple[np.ndarray, np.ndarray]: ``(records, malformed_lines)``: records of dtype
+        :data:`daq_type` (``value``, ``stamp``, ``pretime``, ``posttime``) and the
+        line numbers of malformed, non-empty body lines.
     """
-    lines = getlines(daqlogfile)
-    values = []
-    pretime = []
-    posttime = []
+    try:
+        records = np.loadtxt(daqlogfile, dtype=daq_type, skiprows=header_lines, ndmin=1)
+        return records, np.zeros(0, dtype=np.int64)
+    except ValueError:
+        pass
 
-    for line in lines[3:]:
-        fields = line.split()
-        if len(fields) == 4:
-            values.append(int(fields[0]))
-            pretime.append(int(fields[2]))
-            posttime.append(int(fields[3]))
+    with open(daqlogfile, 'rb') as logfile:
+        data = logfile.read()
 
-    values = np.array(values)
-    pretime = np.array(pretime)
-    posttime = np.array(posttime)
+    buffer, token_starts, token_stops, line_tokens = _tokenize(data)
+    fields_per_line = np.diff(line_tokens)
+    line_numbers = np.arange(len(fields_per_line))
 
-    return values, pretime, posttime
+    n_fields = len(daq_type.names)
+    body = line_numbers >= header_lines
 
+    # body lines of four integer fields
+    valid = body & (fields_per_line == n_fields)
+    candidate_tokens = (line_tokens[:-1][valid][:, None] + np.arange(n_fields)).ravel()
+    _, integer = _integer_digits(buffer, token_starts[candidate_tokens], token_stops[candidate_tokens])
+    valid[valid] = integer.reshape(-1, n_fields).all(axis=1)
 
-def get_coeff(event_mat: np.ndarray, daqlogfile: Union[str, Path]) -> np.ndarray:
-    """Fit a linear mapping from DAQ post times to event timestamps.
+    malformed_lines = line_numbers[body & ~valid & (fields_per_line > 0)]
+    if len(malformed_lines):
+        print("DAQ log {}: skipping {} malformed lines, e.g. line {}.".format(daqlogfile, len(malformed_lines),
+                                                                              malformed_lines[0] + 1))
+
+    row_tokens = (line_tokens[:-1][valid][:, None] + np.arange(n_fields)).ravel()
+    fields = _token_integers(buffer, token_starts[row_tokens], token_stops[row_tokens])
+
+    records = np.empty(len(row_tokens) // n_fields, dtype=daq_type)
+    for column, name in enumerate(daq_type.names):
+        records[name] = fields[column::n_fields]
+
+    return records, malformed_lines
+
+
+def read_daqlog(daqlogfile: Union[str, Path]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Extract DAQ values and pre/post times.
+
+    Args:
+        daqlogfile (Union[str, Path]): Path to DAQ log file.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: ``(values, pretime_us, posttime_us)`` arrays.
+    """
+    records, _ = load_daqlog(daqlogfile)
+    return records['value'], records['pretime'], records['posttime']
+
+
+def match_daq_events(event_mat: np.ndarray, daqlogfile: Union[str, Path]) -> Tuple[np.ndarray, np.ndarray]:
+    """Pair the DAQ post times with the event timestamps they produced.
 
-    Loads logs, validates events, and returns slope/intercept.
-    
     Args:
         event_mat (np.ndarray): ``(timestamp, code)`` event array.
         daqlogfile (Union[str, Path]): Path to DAQ log file.
     Returns:
-        np.ndarray: ``[m, b]`` array such that ``timestamp = m*post + b``.
+        Tuple[np.ndarray, np.ndarray]: ``(daq_posttimes, event_times)`` arrays of equal length.
     """
     eventTimes, eventValues = event_mat[:,0],event_mat[:,1]
-    daqValues, daqPretimes, daqPosttimes = read_daqlog(daqlogfile)
+    daq_records, _ = load_daqlog(daqlogfile)
+    daqValues, daqPretimes, daqPosttimes = daq_records['value'], daq_records['pretime'], daq_records['posttime']
 
     # check events:
     EventErrors = (eventValues != daqValues).sum()
@@ -251,6 +678,22 @@ def get_coeff(event_mat: np.ndarray, daqlogfile: Union[str, Path]) -> np.ndarray
     print("Min Daq Diff: {:.1f} ms, Max Daq Diff: {:.1f} ms".
           format(diffs.min(), diffs.max()))
 
+    return daqPosttimes, eventTimes
+
+
+def get_coeff(event_mat: np.ndarray, daqlogfile: Union[str, Path]) -> np.ndarray:
+    """Fit a linear mapping from DAQ post times to event timestamps.
+
+    Loads logs, validates events, and returns slope/intercept.
+    
+    Args:
+        event_mat (np.ndarray): ``(timestamp, code)`` event array.
+        daqlogfile (Union[str, Path]): Path to DAQ log file.
+    Returns:
+        np.ndarray: ``[m, b]`` array such that ``timestamp = m*post + b``.
+    """
+    daqPosttimes, eventTimes = match_daq_events(event_mat, daqlogfile)
+
     # convert daqPosttimes to eventTimes by polyfit, check error
     m, b = np.polyfit(daqPosttimes, eventTimes, 1)
     fitdaq = m*daqPosttimes + b
@@ -261,6 +704,59 @@ def get_coeff(event_mat: np.ndarray, daqlogfile: Union[str, Path]) -> np.ndarray
     return np.array([m, b])
 
 
+def fit_drift(cpu_times: np.ndarray, neural_times: np.ndarray, n_segments: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Fit a continuous piecewise-linear mapping from CPU time to neural time.
+
+    The knots are spread evenly over the CPU time range; the values at the knots
+    are the least-squares solution over hat (linear B-spline) basis functions.
+
+    Args:
+        cpu_times (np.ndarray): CPU times of the synchronization events.
+        neural_times (np.ndarray): Neural recording times of the same events.
+        n_segments (int): Number of linear segments.
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: ``(knots, knot_values)`` such that
+        ``neural = np.interp(cpu, knots, knot_values)`` inside the fitted range.
+    Raises:
+        ValueError: If there are fewer events than knots, a segment without events
+            leaves the fit underdetermined, or the fitted mapping is not increasing.
+    """
+    cpu_times = np.asarray(cpu_times, dtype=float)
+    neural_times = np.asarray(neural_times, dtype=float)
+    if n_segments + 1 > len(cpu_times):
+        raise ValueError("Drift fit with {} segments needs at least {} events, got {}.".format(
+            n_segments, n_segments + 1, len(cpu_times)))
+
+    knots = np.linspace(cpu_times.min(), cpu_times.max(), n_segments + 1)
+
+    # each time lies between two knots and is weighted linearly towards both
+    segment = np.clip(np.searchsorted(knots, cpu_times, side='right') - 1, 0, n_segments - 1)
+    weight = (cpu_times - knots[segment]) / (knots[segment + 1] - knots[segment])
+    basis = np.zeros((len(cpu_times), n_segments + 1))
+    rows = np.arange(len(cpu_times))
+    basis[rows, segment] = 1 - weight
+    basis[rows, segment + 1] = weight
+
+    knot_values, _, rank, _ = np.linalg.lstsq(basis, neural_times, rcond=None)
+    if rank < n_segments + 1:
+        raise ValueError("Drift fit with {} segments is underdetermined: some segments contain no events. "
+                         "Use fewer segments.".format(n_segments))
+    if np.any(np.diff(knot_values) <= 0):
+        raise ValueError("Fitted drift model is not monotonic increasing. Use fewer segments.")
+    print("Maximum Error after drift fit: {:.1f} ms".format(np.abs(basis @ knot_values - neural_times).max()))
+
+    return knots, knot_values
+
+
+def _interp_extrapolate(x: np.ndarray, xp: np.ndarray, fp: np.ndarray) -> np.ndarray:
+    # np.interp, continued linearly beyond both ends
+    y = np.interp(x, xp, fp)
+    left, right = x < xp[0], x > xp[-1]
+    y[left] = fp[0] + (x[left] - xp[0]) * (fp[1] - fp[0]) / (xp[1] - xp[0])
+    y[right] = fp[-1] + (x[right] - xp[-1]) * (fp[-1] - fp[-2]) / (xp[-1] - xp[-2])
+    return y
+
+
 def make_msec(list_usec: list[int]) -> list[float]:
     """Convert a list from microseconds to milliseconds.
 
@@ -274,18 +770,175 @@ def make_msec(list_usec: list[int]) -> list[float]:
     return list_msec
 
 
+SKIP_THRESHOLD_FRAMES = 25
+
+
+class SkipSegments(object):
+    """Continuously played segments of a movie session, separated by skips.
+
+    Attributes:
+        start_times (np.ndarray): Neural recording time of the first frame of each segment (ms).
+        stop_times (np.ndarray): Neural recording time of the last frame of each segment (ms).
+        values (np.ndarray): Segment index, ``0 .. n_segments - 1``.
+        frame_starts (np.ndarray): Index of the first frame of each segment.
+        frame_stops (np.ndarray): Index after the last frame of each segment.
+        jumps (np.ndarray): PTS jump (in frames) into each segment, ``0`` for the first one.
+    """
+
+    def __init__(self, start_times: np.ndarray, stop_times: np.ndarray, values: np.ndarray,
+                 frame_starts: np.ndarray, frame_stops: np.ndarray, jumps: np.ndarray) -> None:
+        self.start_times = start_times
+        self.stop_times = stop_times
+        self.values = values
+        self.frame_starts = frame_starts
+        self.frame_stops = frame_stops
+        self.jumps = jumps
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+def detect_skips(pts: np.ndarray, daq_time: np.ndarray, threshold_frames: float = SKIP_THRESHOLD_FRAMES,
+                 frame_duration: float = 0.04) -> SkipSegments:
+    """Split an aligned session into segments at the jumps in the movie PTS.
+
+    Args:
+        pts (np.ndarray): PTS of the played frames (s).
+        daq_time (np.ndarray): Neural recording time of the played frames (ms).
+        threshold_frames (float): A PTS jump (forward or backward) of more than this many
+            frames is a skip.
+        frame_duration (float): Duration of one movie frame (s).
+
+    Returns:
+        SkipSegments: One segment per continuously played stretch; a single segment
+        spanning the whole session if there are no skips.
+    """
+    pts = np.asarray(pts, dtype=float)
+    daq_time = np.asarray(daq_time, dtype=float)
+
+    jumps = np.diff(pts) / frame_duration
+    skips = np.flatnonzero(np.abs(jumps) > threshold_frames)
+
+    frame_starts = np.concatenate(([0], skips + 1))
+    frame_stops = np.concatenate((skips + 1, [len(pts)]))
+
+    return SkipSegments(start_times=daq_time[frame_starts],
+                        stop_times=daq_time[frame_stops - 1],
+                        values=np.arange(len(frame_starts)),
+                        frame_starts=frame_starts,
+                        frame_stops=frame_stops,
+                        jumps=np.concatenate(([0.], jumps[skips])))
+
+
 class TimeConversion(object):
     """Linear mapping between CPU time and neural recording time.
 
     Enables conversion of stimulus timestamps (e.g., movie frames) to the spike
-    time scale.
+    time scale. The mapping is fitted once, on first use, and cached. For long
+    sessions, a piecewise-linear drift model can be fitted instead of a single
+    line (``n_segments > 1``). A fitted model can be stored with
+    :meth:`to_dict` and restored with :meth:`from_dict`, e.g. to ship it to
+    worker processes without re-reading the logs.
+
+    Attributes:
+        m (float): Slope of the linear mapping.
+        b (float): Intercept of the linear mapping.
+        knots (Optional[np.ndarray]): CPU times of the drift model knots, ``None`` for the linear model.
+        knot_values (Optional[np.ndarray]): Neural times at the knots.
     """
     
-    def __init__(self, path_to_wl: Union[str, Path], path_to_dl: Union[str, Path],
-                 path_to_events: Union[str, Path]) -> None:
+    def __init__(self, path_to_wl: Union[str, Path, None], path_to_dl: Union[str, Path, None],
+                 path_to_events: Union[str, Path, None], n_segments: int = 1) -> None:
         self.path_watchlog = path_to_wl
         self.path_daqlog = path_to_dl
         self.path_evts = path_to_events
+        self.n_segments = n_segments
+
+        self.m = None
+        self.b = None
+        self.knots = None
+        self.knot_values = None
+
+    @property
+    def is_fitted(self) -> bool:
+        return self.m is not None
+
+    def fit(self) -> "TimeConversion":
+        """Fit the mapping from the event file and DAQ log (only once).
+
+        Returns:
+            TimeConversion: The fitted model itself.
+        """
+        if self.is_fitted:
+            return self
+
+        event_mat = process_events(nev_read(self.path_evts))
+        if self.n_segments > 1:
+            daq_posttimes, event_times = match_daq_events(event_mat, self.path_daqlog)
+            self.m, self.b = np.polyfit(daq_posttimes, event_times, 1)
+            self.knots, self.knot_values = fit_drift(daq_posttimes, event_times, self.n_segments)
+        else:
+            self.m, self.b = get_coeff(event_mat, self.path_daqlog)
+
+        return self
+
+    def to_neural(self, cpu_times: Union[float, np.ndarray]) -> np.ndarray:
+        """Convert CPU times to neural recording time.
+
+        Args:
+            cpu_times (Union[float, np.ndarray]): CPU times (µs), any shape.
+        Returns:
+            np.ndarray: Neural recording times (ms), same shape.
+        """
+        self.fit()
+        cpu_times = np.asarray(cpu_times, dtype=float)
+        if self.knots is None:
+            return cpu_times * self.m + self.b
+        return _interp_extrapolate(cpu_times.ravel(), self.knots, self.knot_values).reshape(cpu_times.shape)
+
+    def to_cpu(self, neural_times: Union[float, np.ndarray]) -> np.ndarray:
+        """Convert neural recording times back to CPU time.
+
+        Args:
+            neural_times (Union[float, np.ndarray]): Neural recording times (ms), any shape.
+        Returns:
+            np.ndarray: CPU times (µs), same shape.
+        Raises:
+            ValueError: If the knot values of the drift model are not strictly increasing.
+        """
+        self.fit()
+        neural_times = np.asarray(neural_times, dtype=float)
+        if self.knots is None:
+            return (neural_times - self.b) / self.m
+        if np.any(np.diff(self.knot_values) <= 0):
+            raise ValueError("Drift model knot values are not strictly increasing, it cannot be inverted.")
+        # the drift model is monotonic, so it is inverted by swapping the axes
+        return _interp_extrapolate(neural_times.ravel(), self.knot_values, self.knots).reshape(neural_times.shape)
+
+    def to_dict(self) -> dict:
+        """Serialize the fitted model to a small, json-compatible dict."""
+        self.fit()
+        return {
+            "path_to_wl": None if self.path_watchlog is None else str(self.path_watchlog),
+            "path_to_dl": None if self.path_daqlog is None else str(self.path_daqlog),
+            "path_to_events": None if self.path_evts is None else str(self.path_evts),
+            "n_segments": self.n_segments,
+            "m": float(self.m),
+            "b": float(self.b),
+            "knots": None if self.knots is None else self.knots.tolist(),
+            "knot_values": None if self.knot_values is None else self.knot_values.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, model: dict) -> "TimeConversion":
+        """Restore a fitted model from :meth:`to_dict` without re-reading the logs."""
+        conversion = cls(model.get("path_to_wl"), model.get("path_to_dl"), model.get("path_to_events"),
+                         n_segments=model.get("n_segments", 1))
+        conversion.m, conversion.b = model["m"], model["b"]
+        if model.get("knots") is not None:
+            conversion.knots = np.asarray(model["knots"])
+            conversion.knot_values = np.asarray(model["knot_values"])
+        return conversion
 
     def convert(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """Compute mapping and convert watchlog times to DAQ times.
@@ -293,13 +946,10 @@ class TimeConversion(object):
         Returns:
             Tuple[np.ndarray, np.ndarray, np.ndarray]: ``(pts_seconds, dts_ms, cpu_time_us)`` arrays.
         """
-    
-        event_mat = process_events(nev_read(self.path_evts))
-        m, b = get_coeff(event_mat, self.path_daqlog)
         pts, cpu_time = read_watchlog(self.path_watchlog)
         
         # first convert cpu time to recording system time
-        daq_time = cpu_time * m + b
+        daq_time = self.to_neural(cpu_time)
         
         return pts, daq_time, cpu_time
 
@@ -310,11 +960,9 @@ class TimeConversion(object):
             Tuple[List[float], List[float]]: ``(starts_ms, stops_ms)`` lists in neural recording time.
         """
         start, stop = read_watchlog_pauses(self.path_watchlog)
-        event_mat = process_events(nev_read(self.path_evts))
-        m, b = get_coeff(event_mat, self.path_daqlog)
 
-        convert_start = [time * m + b for i, time in enumerate(start)]
-        convert_stop = [time * m + b for i, time in enumerate(stop)]
+        convert_start = self.to_neural(start).tolist()
+        convert_stop = self.to_neural(stop).tolist()
         
         #### NOTE: depending on the output set-up, comment/uncomment. 
         ##### Generally, can use the highlights options on the interactive plot
@@ -326,50 +974,31 @@ class TimeConversion(object):
         return convert_start, convert_stop
 
 
-    def convert_skips(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    def convert_skips(self, pts: Optional[np.ndarray] = None, daq_time: Optional[np.ndarray] = None,
+                      threshold_frames: float = SKIP_THRESHOLD_FRAMES) -> Tuple[Union[List[float], float],
+                                                                                Union[List[float], float], np.ndarray]:
         """Detect skips and return start/stop/value segments in DAQ time.
 
+        Use :func:`detect_skips` for the segments as arrays.
+
+        Args:
+            pts (Optional[np.ndarray]): Aligned PTS (s); computed with :meth:`convert` if not given.
+            daq_time (Optional[np.ndarray]): Aligned neural recording times (ms) of the frames.
+            threshold_frames (float): Minimal PTS jump, in frames, that counts as a skip.
+
         Returns:
-            Tuple[np.ndarray, np.ndarray, np.ndarray]: ``(start_values_ms, stop_values_ms, values_idx)`` arrays.
+            Tuple: ``(start_values_ms, stop_values_ms, values_idx)``: lists of the segment starts
+            and stops if there are skips, otherwise the first and last neural recording time;
+            ``values_idx`` is an array of the segment indices.
         """
-        pts, daq_time, cpu_time = self.convert()
-        
-        threshold = 1
-        max_jump = np.max(np.abs(np.diff(pts)))
-        
-        
-        if max_jump >= threshold:
-            print("There is a skip in the movie frame playback that is bigger than {} frames.\nThe biggest skip is {} frames.".format((threshold / 0.04), (max_jump / 0.04)))
-            
-            # list of indices where the pts jumped by 25+ frames
-            beyond_threshold = np.where(np.abs(np.diff(pts)) > threshold)[0]
-            print("Timepoints of skips, in neural_rec_time: {}".format(daq_time[beyond_threshold]))
-            
-            ## setting up start/stop values
-            timepoints_of_skips = []
-            timepoints_of_skips.append(daq_time[0]) # set first start point to the start of the rec_log
-
-            for index in beyond_threshold:
-                timepoints_of_skips.append(daq_time[index])
-                timepoints_of_skips.append(daq_time[index + 1])
-
-            timepoints_of_skips.append(daq_time[-1])
-            
-            ## specifying starts and stops from timepoint collection 
-            start_values = timepoints_of_skips[0:-1:2]
-            stop_values = timepoints_of_skips[1::2]
-            values = np.array(range(0, len(start_values)))
-            print("Start timepoints: {}".format(start_values))
-            print("Stop timepoints: {}".format(stop_values))
-            print("")
-            
-        else:
-            print("There's not any skips in the movie frame playback that are bigger than {} frames.\nThe biggest skip is {} frames.".format((threshold / 0.04), (max_jump / 0.04)))
-            print(" ")
-            start_values = daq_time[0]
-            stop_values = daq_time[-1]
-            values = np.array([0])
-        
-        
-        return start_values, stop_values, values
-        
+        if pts is None or daq_time is None:
+            pts, daq_time, _ = self.convert()
+
+        skips = detect_skips(pts, daq_time, threshold_frames)
+        if len(skips) > 1:
+            print("There are {} skips in the movie frame playback bigger than {} frames.\nThe biggest skip is {} frames.".format(
+                len(skips) - 1, threshold_frames, np.max(np.abs(skips.jumps))))
+            return skips.start_times.tolist(), skips.stop_times.tolist(), skips.values
+
+        print("There's not any skips in the movie frame playback that are bigger than {} frames.".format(threshold_frames))
+        return skips.start_times[0], skips.stop_times[0], skips.values
@@ -0,0 +1,222 @@
+"""
+Align spike trains of many units to label events.
+
+Functions here take the start/stop times stored in ``PatientAlignedMovieAnnotation``
+(neural recording time, ms) and gather the spikes of all units around them
+with one ``np.searchsorted`` call per unit instead of per-event masks.
+Spikes per label segment are returned as :class:`RaggedSpikes`, a flat array
+of relative spike times plus offsets.
+"""
+
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from epiphyte.database.query_functions import (get_patient_aligned_label_info, get_session_spike_times,
+                                               get_start_stop_times_pauses)
+import epiphyte.preprocessing.annotation.stimulus_driven_annotation.movies.pause_handling as pause_handling
+import epiphyte.preprocessing.annotation.stimulus_driven_annotation.movies.rle_label as rle_label
+
+
+def psth_counts(
+    spike_trains: List[np.ndarray],
+    event_times: np.ndarray,
+    window: Tuple[float, float],
+    bin_size: float,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Count spikes of all units in bins around all events.
+
+    Bins are half-open, ``[edge_i, edge_i+1)``, relative to each event time.
+
+    Args:
+        spike_trains (List[np.ndarray]): Spike timestamps (ms), one vector per unit.
+        event_times (np.ndarray): Event times (ms).
+        window (Tuple[float, float]): Window ``(before, after)`` relative to the event (ms), e.g. ``(-500, 1000)``.
+        bin_size (float): Bin size (ms).
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: ``(counts, bin_edges)`` where ``counts`` has
+        shape ``(n_events, n_units, n_bins)`` and ``bin_edges`` are relative to the event.
+    """
+    n_bins = int(round((window[1] - window[0]) / bin_size))
+    bin_edges = window[0] + np.arange(n_bins + 1) * bin_size
+
+    event_times = np.asarray(event_times, dtype=float)
+    edges = (event_times[:, None] + bin_edges[None, :]).ravel()
+
+    counts = np.empty((len(event_times), len(spike_trains), n_bins), dtype=np.int64)
+    for unit, train in enumerate(spike_trains):
+        positions = np.searchsorted(np.sort(train), edges, side="left")
+        counts[:, unit, :] = np.diff(positions.reshape(len(event_times), n_bins + 1), axis=1)
+
+    return counts, bin_edges
+
+
+def psth(
+    patient_id: int,
+    session_nr: int,
+    label_name: str,
+    window: Tuple[float, float],
+    bin_size: float,
+    units: Optional[List[int]] = None,
+    exclude_pauses: bool = False,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Peri-event time histograms of all units around the onsets of a label.
+
+    Onsets are the start times of all label segments with a non-zero value.
+
+    Args:
+        patient_id (int): ID of the patient.
+        session_nr (int): Session number of the experiment.
+        label_name (str): Name of the label in ``PatientAlignedMovieAnnotation``.
+        window (Tuple[float, float]): Window ``(before, after)`` relative to the onset (ms).
+        bin_size (float): Bin size (ms).
+        units (Optional[List[int]]): If provided, only these unit IDs are used.
+        exclude_pauses (bool): If ``True``, drop onsets whose window overlaps a pause from ``MoviePauses``.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        ``(counts, mean, sem, bin_edges, event_times)`` where ``counts`` has shape
+        ``(n_events, n_units, n_bins)`` and ``mean``/``sem`` are taken over events.
+    """
+    values, start_times, _ = get_patient_aligned_label_info(patient_id, session_nr, label_name)
+    event_times = np.asarray(start_times, dtype=float)[np.asarray(values) != 0]
+
+    if exclude_pauses:
+        start_times_pauses, stop_times_pauses = get_start_stop_times_pauses(patient_id, session_nr)
+        paused = pause_handling.overlaps_pauses(event_times + window[0], event_times + window[1],
+                                                start_times_pauses, stop_times_pauses)
+        event_times = event_times[~paused]
+
+    unit_ids, spike_trains = get_session_spike_times(patient_id, session_nr)
+    if units is not None:
+        spike_trains = spike_trains[np.isin(unit_ids, units)]
+
+    counts, bin_edges = psth_counts(list(spike_trains), event_times, window, bin_size)
+
+    n_events = len(event_times)
+    mean = counts.mean(axis=0) if n_events > 0 else np.full(counts.shape[1:], np.nan)
+    sem = counts.std(axis=0, ddof=1) / np.sqrt(n_events) if n_events > 1 else np.full(counts.shape[1:], np.nan)
+
+    return counts, mean, sem, bin_edges, event_times
+
+
+class RaggedSpikes(object):
+    """Spike times of all (segment, unit) pairs stored in one flat array.
+
+    The spikes of segment ``s`` and unit ``u`` are
+    ``times[offsets[s * n_units + u]:offsets[s * n_units + u + 1]]``,
+    relative to the start of the segment.
+
+    Attributes:
+        times (np.ndarray): Flat spike times (ms) relative to the segment start.
+        offsets (np.ndarray): Start of each (segment, unit) block in ``times``, length ``n_segments * n_units + 1``.
+        shape (Tuple[int, int]): ``(n_segments, n_units)``.
+        durations (np.ndarray): Segment durations (ms), including the (inclusive) stop frame.
+    """
+
+    def __init__(self, times: np.ndarray, offsets: np.ndarray, shape: Tuple[int, int],
+                 durations: np.ndarray) -> None:
+        self.times = times
+        self.offsets = offsets
+        self.shape = shape
+        self.durations = durations
+
+    def __getitem__(self, key: Tuple[int, int]) -> np.ndarray:
+        segment, unit = key
+        block = segment * self.shape[1] + unit
+        return self.times[self.offsets[block]:self.offsets[block + 1]]
+
+    @property
+    def counts(self) -> np.ndarray:
+        """Spike counts of shape ``(n_segments, n_units)``."""
+        return np.diff(self.offsets).reshape(self.shape)
+
+    def rates(self) -> np.ndarray:
+        """Firing rates (Hz) of shape ``(n_segments, n_units)``."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.counts / (self.durations[:, None] / 1000)
+
+
+def epoch_spikes(
+    spike_trains: List[np.ndarray],
+    start_times: np.ndarray,
+    stop_times: np.ndarray,
+    frame_duration: float = rle_label.FRAME_DURATIONS["neural"],
+) -> RaggedSpikes:
+    """Cut the spike trains of all units into segments.
+
+    Segments include both bounds, ``[start, stop]``, and may overlap. As the
+    stop is the time of the last frame of a segment, the segment lasts
+    ``stop - start + frame_duration`` (see :class:`~.rle_label.RLELabel`).
+
+    Args:
+        spike_trains (List[np.ndarray]): Spike timestamps (ms), one vector per unit.
+        start_times (np.ndarray): Segment starts (ms).
+        stop_times (np.ndarray): Segment stops (ms).
+        frame_duration (float): Duration of one movie frame in neural recording time (ms).
+
+    Returns:
+        RaggedSpikes: Spike times relative to the segment start, per segment and unit.
+    """
+    start_times = np.asarray(start_times, dtype=float)
+    stop_times = np.asarray(stop_times, dtype=float)
+    n_segments, n_units = len(start_times), len(spike_trains)
+
+    # the smallest float above each stop turns the inclusive stop into a "left" search
+    queries = np.concatenate((start_times, np.nextafter(stop_times, np.inf)))
+
+    trains = [np.sort(train) for train in spike_trains]
+    first = np.empty((n_segments, n_units), dtype=np.int64)
+    counts = np.empty((n_segments, n_units), dtype=np.int64)
+    for unit, train in enumerate(trains):
+        bounds = np.searchsorted(train, queries, side="left")
+        first[:, unit] = bounds[:n_segments]
+        counts[:, unit] = np.maximum(bounds[n_segments:] - bounds[:n_segments], 0)
+
+    offsets = np.concatenate(([0], np.cumsum(counts.ravel())))
+    block_offsets = offsets[:-1].reshape(n_segments, n_units)
+    times = np.empty(offsets[-1], dtype=float)
+
+    for unit, train in enumerate(trains):
+        unit_counts = counts[:, unit]
+        within = np.arange(unit_counts.sum()) - np.repeat(np.cumsum(unit_counts) - unit_counts, unit_counts)
+        source = np.repeat(first[:, unit], unit_counts) + within
+        target = np.repeat(block_offsets[:, unit], unit_counts) + within
+        times[target] = train[source] - np.repeat(start_times, unit_counts)
+
+    return RaggedSpikes(times, offsets, (n_segments, n_units), stop_times - start_times + frame_duration)
+
+
+def epoch_label_segments(
+    patient_id: int,
+    session_nr: int,
+    label_name: str,
+    units: Optional[List[int]] = None,
+    value: Optional[int] = None,
+) -> Tuple[RaggedSpikes, np.ndarray, np.ndarray]:
+    """Spikes of all units within every segment of a patient-aligned label.
+
+    Args:
+        patient_id (int): ID of the patient.
+        session_nr (int): Session number of the experiment.
+        label_name (str): Name of the label in ``PatientAlignedMovieAnnotation``.
+        units (Optional[List[int]]): If provided, only these unit IDs are used.
+        value (Optional[int]): If provided, only segments with this label value are used.
+
+    Returns:
+        Tuple[RaggedSpikes, np.ndarray, np.ndarray]: ``(spikes, segment_values, unit_ids)``.
+    """
+    values, start_times, stop_times = get_patient_aligned_label_info(patient_id, session_nr, label_name)
+    values, start_times, stop_times = np.asarray(values), np.asarray(start_times), np.asarray(stop_times)
+
+    if value is not None:
+        selected = values == value
+        values, start_times, stop_times = values[selected], start_times[selected], stop_times[selected]
+
+    unit_ids, spike_trains = get_session_spike_times(patient_id, session_nr)
+    if units is not None:
+        selected = np.isin(unit_ids, units)
+        unit_ids, spike_trains = unit_ids[selected], spike_trains[selected]
+
+    return epoch_spikes(list(spike_trains), start_times, stop_times), values, unit_ids
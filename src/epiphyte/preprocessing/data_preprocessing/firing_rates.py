@@ -0,0 +1,187 @@
+"""
+Smoothed firing-rate estimation for all units of a session.
+
+Spike trains of all units are counted onto the same :class:`~epiphyte.preprocessing.data_preprocessing.binning.BinGrid`
+used by ``bin_spikes`` and the resulting units x bins matrix is smoothed with a
+single FFT convolution per continuous stretch of playback, so kernels never
+leak across paused segments.
+"""
+
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from epiphyte.database.query_functions import get_session_spike_times
+import epiphyte.preprocessing.annotation.stimulus_driven_annotation.movies.pause_handling as pause_handling
+from epiphyte.preprocessing.data_preprocessing.binning import BinGrid
+
+KERNELS = ("gaussian", "boxcar")
+
+
+def make_kernel(kernel: str, sigma_ms: float, step_ms: float) -> np.ndarray:
+    """Build a normalized, centered smoothing kernel sampled at the bin step.
+
+    Args:
+        kernel (str): ``'gaussian'`` (truncated at 4 sigma) or ``'boxcar'``.
+        sigma_ms (float): Standard deviation of the gaussian, or full width of the boxcar (ms).
+        step_ms (float): Bin step (ms).
+
+    Returns:
+        np.ndarray: Odd-length kernel weights summing to one.
+    """
+    if kernel == "gaussian":
+        half_width = int(np.ceil(4 * sigma_ms / step_ms))
+        x = np.arange(-half_width, half_width + 1) * step_ms
+        weights = np.exp(-0.5 * (x / sigma_ms) ** 2)
+    elif kernel == "boxcar":
+        half_width = int(round(sigma_ms / step_ms / 2))
+        weights = np.ones(2 * half_width + 1)
+    else:
+        raise ValueError("Unknown kernel '{}', expected one of {}.".format(kernel, KERNELS))
+
+    return weights / weights.sum()
+
+
+def count_spikes_per_unit(grid: BinGrid, spike_trains: List[np.ndarray]) -> np.ndarray:
+    """Count the spikes of all units onto a grid in one pass.
+
+    Counting follows :func:`~epiphyte.preprocessing.data_preprocessing.binning.bin_spikes`:
+    bins are half-open except the last one, and spikes within the pauses of
+    the grid are dropped.
+
+    Args:
+        grid (BinGrid): Bin edges to count into.
+        spike_trains (List[np.ndarray]): Spike timestamps (ms), one vector per unit.
+
+    Returns:
+        np.ndarray: Spike counts of shape ``(n_units, n_bins)``.
+    """
+    edges = grid.edges()
+    n_bins = len(edges) - 1
+
+    if len(spike_trains) == 0:
+        return np.zeros((0, n_bins), dtype=np.intp)
+
+    spikes = np.concatenate([np.asarray(train, dtype=float) for train in spike_trains])
+    units = np.repeat(np.arange(len(spike_trains)), [len(train) for train in spike_trains])
+
+    if grid.pause_starts.size:
+        keep = ~pause_handling.in_pauses(spikes, grid.pause_starts, grid.pause_stops)
+        spikes, units = spikes[keep], units[keep]
+
+    bin_index = np.searchsorted(edges, spikes, side="right") - 1
+    bin_index[spikes == edges[-1]] = n_bins - 1
+    valid = (bin_index >= 0) & (bin_index < n_bins)
+
+    counts = np.bincount(units[valid] * n_bins + bin_index[valid], minlength=len(spike_trains) * n_bins)
+    return counts.reshape(len(spike_trains), n_bins)
+
+
+def pause_gap_bins(grid: BinGrid) -> np.ndarray:
+    """Flag the bins of a grid that span a removed pause.
+
+    Args:
+        grid (BinGrid): Bin grid, usually built with ``exclude_pauses=True``.
+
+    Returns:
+        np.ndarray: Boolean mask of length ``grid.n_bins``.
+    """
+    indices = np.arange(grid.n_edges)
+    return np.diff(indices[grid.kept(indices)]) > 1
+
+
+def smooth_rows(counts: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Convolve every row with a centered kernel via FFT ("same" output length).
+
+    Rows are renormalized by the kernel mass that falls inside the row, so the
+    estimate is not biased towards zero at the borders.
+
+    Args:
+        counts (np.ndarray): Matrix of shape ``(n_rows, n_bins)``.
+        weights (np.ndarray): Odd-length kernel weights.
+
+    Returns:
+        np.ndarray: Smoothed matrix of the same shape as ``counts``.
+    """
+    n_bins = counts.shape[1]
+    half_width = (len(weights) - 1) // 2
+    n_fft = 1 << int(n_bins + len(weights) - 2).bit_length()  # power of two for a fast FFT
+
+    kernel_ft = np.fft.rfft(weights, n_fft)
+    smoothed = np.fft.irfft(np.fft.rfft(counts, n_fft, axis=1) * kernel_ft, n_fft, axis=1)
+    coverage = np.fft.irfft(np.fft.rfft(np.ones(n_bins), n_fft) * kernel_ft, n_fft)
+
+    window = slice(half_width, half_width + n_bins)
+    return smoothed[:, window] / coverage[window]
+
+
+def smoothed_firing_rates(
+    grid: BinGrid,
+    spike_trains: List[np.ndarray],
+    kernel: str = "gaussian",
+    sigma_ms: float = 50,
+) -> np.ndarray:
+    """Estimate smoothed firing rates of many units on a common grid.
+
+    Each continuous stretch of bins between two pauses is smoothed on its own;
+    bins that span a pause are set to ``NaN``.
+
+    Args:
+        grid (BinGrid): Bin grid shared by all units.
+        spike_trains (List[np.ndarray]): Spike timestamps (ms), one vector per unit.
+        kernel (str): ``'gaussian'`` or ``'boxcar'``, see :func:`make_kernel`.
+        sigma_ms (float): Kernel width (ms).
+
+    Returns:
+        np.ndarray: Firing rates (Hz) of shape ``(n_units, n_bins)``.
+    """
+    weights = make_kernel(kernel, sigma_ms, grid.step)
+    counts = count_spikes_per_unit(grid, spike_trains)
+    gaps = pause_gap_bins(grid)
+
+    rates = np.full(counts.shape, np.nan)
+    gap_index = np.flatnonzero(gaps)
+    segment_starts = np.concatenate(([0], gap_index + 1))
+    segment_stops = np.concatenate((gap_index, [len(gaps)]))
+
+    for first, stop in zip(segment_starts, segment_stops):
+        if stop > first:
+            rates[:, first:stop] = smooth_rows(counts[:, first:stop], weights)
+
+    return rates / (grid.step / 1000)
+
+
+def firing_rates(
+    patient_id: int,
+    session_nr: int,
+    kernel: str = "gaussian",
+    sigma_ms: float = 50,
+    step_ms: int = 10,
+    exclude_pauses: bool = True,
+    unit_ids: Optional[List[int]] = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Smoothed firing rates of all units of a session.
+
+    Args:
+        patient_id (int): ID of the patient.
+        session_nr (int): Session number of the experiment.
+        kernel (str): ``'gaussian'`` or ``'boxcar'``, see :func:`make_kernel`.
+        sigma_ms (float): Kernel width (ms).
+        step_ms (int): Bin size (ms), as in ``bin_spikes``.
+        exclude_pauses (bool): If ``True``, exclude paused playback intervals.
+        unit_ids (Optional[List[int]]): If provided, only these units are used.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: ``(rates_hz, bin_edges, unit_ids)``
+        with rates of shape ``(n_units, n_bins)``.
+    """
+    session_unit_ids, spike_trains = get_session_spike_times(patient_id, session_nr)
+
+    if unit_ids is not None:
+        selected = np.isin(session_unit_ids, unit_ids)
+        session_unit_ids, spike_trains = session_unit_ids[selected], spike_trains[selected]
+
+    grid = BinGrid.from_session(patient_id, session_nr, step_ms, exclude_pauses)
+    rates = smoothed_firing_rates(grid, list(spike_trains), kernel, sigma_ms)
+
+    return rates, grid.edges(), session_unit_ids
@@ -0,0 +1,244 @@
+"""Parallel preprocessing of raw recording sessions.
+
+Discovers every session under ``PATH_TO_PATIENT_DATA`` (laid out as
+``<patient_id>/session_<nr>/``) and, per session, parses the watchlog and DAQ
+log, aligns movie frames to neural recording time, detects skips and pauses,
+and reads the channel names. Sessions are independent, so they are processed
+in a process pool; results are written to ``movie_info/`` of each session with
+atomic replaces, so an interrupted run never leaves half-written files.
+
+Example:
+    ```python
+    results = run_pipeline(max_workers=8)
+    print(format_report(results))
+    ```
+"""
+
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+from epiphyte.database import config, helpers
+from epiphyte.preprocessing.data_preprocessing import data_utils
+
+OUTPUT_DIRNAME = "movie_info"
+
+
+class SessionFiles(object):
+    """Raw input files of one recording session.
+
+    Attributes:
+        patient_id (int): ID of the patient.
+        session_nr (int): Session number of the experiment.
+        directory (Path): Session directory.
+        watchlog (Optional[Path]): ``ffplay*`` watchlog.
+        daqlog (Optional[Path]): ``timedDAQ*`` log.
+        events (Optional[Path]): Event file (``.nev`` or mock ``Events.npy``).
+        channel_names (Optional[Path]): ``ChannelNames.txt``.
+    """
+
+    def __init__(self, patient_id: int, session_nr: int, directory: Union[str, Path]) -> None:
+        self.patient_id = patient_id
+        self.session_nr = session_nr
+        self.directory = Path(directory)
+
+        self.watchlog = next((self.directory / "watchlogs").glob("ffplay*"), None)
+        self.daqlog = next((self.directory / "daq_files").glob("timedDAQ*"), None)
+        self.events = next((self.directory / "event_file").glob("Events.*"), None)
+        channel_names = self.directory / "ChannelNames.txt"
+        self.channel_names = channel_names if channel_names.exists() else None
+
+    def __repr__(self) -> str:
+        return f"SessionFiles(patient_id={self.patient_id}, session_nr={self.session_nr})"
+
+    def missing(self) -> List[str]:
+        """Names of the required input files that were not found."""
+        return [name for name in ("watchlog", "daqlog", "events", "channel_names") if getattr(self, name) is None]
+
+
+class SessionResult(object):
+    """Outcome of preprocessing one session.
+
+    Attributes:
+        patient_id (int): ID of the patient.
+        session_nr (int): Session number of the experiment.
+        seconds (float): Wall time spent on the session.
+        summary (Dict[str, int]): Counts of frames, skips, pauses and channels, if successful.
+        error (Optional[str]): Traceback of the failure, ``None`` if successful.
+    """
+
+    def __init__(self, patient_id: int, session_nr: int, seconds: float, summary: Optional[Dict[str, int]] = None,
+                 error: Optional[str] = None) -> None:
+        self.patient_id = patient_id
+        self.session_nr = session_nr
+        self.seconds = seconds
+        self.summary = {} if summary is None else summary
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def discover_sessions(root: Optional[Union[str, Path]] = None) -> List[SessionFiles]:
+    """Find all session directories below the patient data folder.
+
+    Args:
+        root (Optional[Union[str, Path]]): Patient data folder, defaults to ``config.PATH_TO_PATIENT_DATA``.
+
+    Returns:
+        List[SessionFiles]: Sessions sorted by patient ID and session number.
+    """
+    root = Path(config.PATH_TO_PATIENT_DATA if root is None else root)
+
+    sessions = []
+    for patient_dir in root.iterdir():
+        if not (patient_dir.is_dir() and patient_dir.name.isdigit()):
+            continue
+        for session_dir in patient_dir.glob("session_*"):
+            session_nr = session_dir.name[len("session_"):]
+            if session_dir.is_dir() and session_nr.isdigit():
+                sessions.append(SessionFiles(int(patient_dir.name), int(session_nr), session_dir))
+
+    return sorted(sessions, key=lambda session: (session.patient_id, session.session_nr))
+
+
+def _save_atomic(path: Path, save, data) -> None:
+    # write next to the target, then swap it in
+    tmp_path = path.with_name(path.stem + ".tmp" + path.suffix)
+    save(tmp_path, data)
+    os.replace(tmp_path, path)
+
+
+def _save_json(path: Path, data) -> None:
+    with open(path, "w") as handle:
+        json.dump(data, handle)
+
+
+def _save_arrays(path: Path, arrays: Dict[str, np.ndarray]) -> None:
+    np.savez(path, **arrays)
+
+
+def preprocess_session(session: SessionFiles, n_segments: int = 1,
+                       threshold_frames: float = data_utils.SKIP_THRESHOLD_FRAMES) -> Dict[str, int]:
+    """Align, detect skips and pauses, and write the results of one session.
+
+    Writes ``pts.npy``, ``dts.npy`` and ``neural_rec_time.npy`` (as read by
+    ``MovieSession``), ``skips.npz`` (the fields of :class:`~.data_utils.SkipSegments`),
+    ``pauses.npz``, ``channel_names.json`` and the fitted ``time_conversion.json``
+    to the session's ``movie_info`` folder.
+
+    Args:
+        session (SessionFiles): Input files of the session.
+        n_segments (int): Segments of the drift model, see :class:`~.data_utils.TimeConversion`.
+        threshold_frames (float): Minimal PTS jump, in frames, that counts as a skip.
+
+    Returns:
+        Dict[str, int]: Number of frames, skips, pauses and channels.
+    """
+    missing = session.missing()
+    if missing:
+        raise FileNotFoundError(f"{session}: missing {', '.join(missing)}")
+
+    time_conversion = data_utils.TimeConversion(path_to_wl=session.watchlog, path_to_dl=session.daqlog,
+                                                path_to_events=session.events, n_segments=n_segments)
+    pts, rectime, dts = time_conversion.convert()
+    skips = data_utils.detect_skips(pts, rectime, threshold_frames)
+    pause_starts, pause_stops = time_conversion.convert_pauses()
+    channel_names = helpers.get_channel_names(session.channel_names)
+
+    save_dir = session.directory / OUTPUT_DIRNAME
+    save_dir.mkdir(exist_ok=True)
+    _save_atomic(save_dir / "pts.npy", np.save, pts)
+    _save_atomic(save_dir / "dts.npy", np.save, dts)
+    _save_atomic(save_dir / "neural_rec_time.npy", np.save, rectime)
+    _save_atomic(save_dir / "skips.npz", _save_arrays, vars(skips))
+    _save_atomic(save_dir / "pauses.npz", _save_arrays, {"start_times": np.array(pause_starts),
+                                                        "stop_times": np.array(pause_stops)})
+    _save_atomic(save_dir / "channel_names.json", _save_json, channel_names)
+    _save_atomic(save_dir / "time_conversion.json", _save_json, time_conversion.to_dict())
+
+    return {"frames": len(pts), "skips": len(skips) - 1, "pauses": len(pause_starts),
+            "channels": len(channel_names)}
+
+
+def _run_session(session: SessionFiles, n_segments: int, threshold_frames: float) -> SessionResult:
+    start = time.perf_counter()
+    try:
+        summary = preprocess_session(session, n_segments, threshold_frames)
+    except Exception:
+        return SessionResult(session.patient_id, session.session_nr, time.perf_counter() - start,
+                             error=traceback.format_exc())
+    return SessionResult(session.patient_id, session.session_nr, time.perf_counter() - start, summary)
+
+
+def run_pipeline(
+    sessions: Optional[Sequence[SessionFiles]] = None,
+    root: Optional[Union[str, Path]] = None,
+    max_workers: Optional[int] = None,
+    n_segments: int = 1,
+    threshold_frames: float = data_utils.SKIP_THRESHOLD_FRAMES,
+) -> List[SessionResult]:
+    """Preprocess sessions in parallel, one process per session.
+
+    A failing session does not stop the others; its traceback is kept in the
+    returned :class:`SessionResult`.
+
+    Args:
+        sessions (Optional[Sequence[SessionFiles]]): Sessions to process, defaults to all discovered ones.
+        root (Optional[Union[str, Path]]): Patient data folder used for discovery.
+        max_workers (Optional[int]): Number of processes, defaults to the number of CPUs.
+            ``1`` processes the sessions in the current process.
+        n_segments (int): Segments of the drift model, see :class:`~.data_utils.TimeConversion`.
+        threshold_frames (float): Minimal PTS jump, in frames, that counts as a skip.
+
+    Returns:
+        List[SessionResult]: One result per session, sorted by patient ID and session number.
+    """
+    sessions = discover_sessions(root) if sessions is None else list(sessions)
+    print(f"Preprocessing {len(sessions)} sessions...")
+
+    if max_workers == 1:
+        results = [_run_session(session, n_segments, threshold_frames) for session in sessions]
+    else:
+        results = []
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_run_session, session, n_segments, threshold_frames) for session in sessions]
+            for future in as_completed(futures):
+                result = future.result()
+                status = "done" if result.ok else "FAILED"
+                print(f"  .. patient {result.patient_id} session {result.session_nr} {status} "
+                      f"({result.seconds:.1f} s)")
+                results.append(result)
+
+    return sorted(results, key=lambda result: (result.patient_id, result.session_nr))
+
+
+def format_report(results: Sequence[SessionResult]) -> str:
+    """Per-session timing and failure report of :func:`run_pipeline`.
+
+    Args:
+        results (Sequence[SessionResult]): Results of :func:`run_pipeline`.
+
+    Returns:
+        str: Table with one line per session, followed by the tracebacks of failed sessions.
+    """
+    lines = [f"{'patient':>8} {'session':>8} {'status':>7} {'seconds':>8}  summary"]
+    for result in results:
+        summary = ", ".join(f"{name}={count}" for name, count in result.summary.items())
+        lines.append(f"{result.patient_id:>8} {result.session_nr:>8} {'ok' if result.ok else 'FAILED':>7} "
+                     f"{result.seconds:>8.1f}  {summary}")
+
+    failed = [result for result in results if not result.ok]
+    lines.append(f"{len(results) - len(failed)} of {len(results)} sessions succeeded, "
+                 f"{sum(result.seconds for result in results):.1f} s of session time.")
+    for result in failed:
+        lines.append(f"\nPatient {result.patient_id}, session {result.session_nr}:\n{result.error}")
+
+    return "\n".join(lines)
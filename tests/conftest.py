@@ -0,0 +1,36 @@
+import importlib
+
+import numpy as np
+import pytest
+
+
+def import_or_skip(module_name):
+    """Import a module that needs the database layer, skip the test if it cannot be set up."""
+    try:
+        return importlib.import_module(module_name)
+    except Exception as error:
+        pytest.skip(f"{module_name} not importable: {error}")
+
+
+def make_watchlog(seed=0, n_frames=3000, n_pauses=3, n_skips=2, terminated=True):
+    """Mock ffplay watchlog with pauses, skips and (optionally) a proper termination."""
+    rng = np.random.default_rng(seed)
+    pts = np.arange(n_frames) * 0.04
+    for frame in rng.choice(np.arange(10, n_frames), n_skips, replace=False):
+        pts[frame:] += rng.choice([-1, 1]) * rng.integers(30, 500) * 0.04
+    cpu_time = 1600000000000000 + np.cumsum(rng.integers(39000, 41000, n_frames))
+    pauses = set(rng.choice(np.arange(5, n_frames - 5), n_pauses, replace=False).tolist())
+
+    lines = ["movie stimulus.avi a b"]
+    for frame in range(n_frames):
+        lines.append("pts\t{:.2f}\ttime\t{}".format(pts[frame], cpu_time[frame]))
+        if frame in pauses:
+            lines += ["Pausing", "Continuing\tafter\tpause"]
+    if terminated:
+        lines += ["Stopping", "something else", "Properly terminated"]
+    return ("\n".join(lines) + "\n").encode()
+
+
+@pytest.fixture
+def watchlog_bytes():
+    return make_watchlog()
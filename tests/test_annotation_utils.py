@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+import epiphyte.preprocessing.annotation.stimulus_driven_annotation.movies.annotation_utils as annotation_utils
+
+
+def reference_split(binned_activity, binned_label, specific_values=None):
+    """Split per value with a boolean mask, as split_activity_by_value did before LabelGroups (keyed by value)."""
+    values = specific_values if specific_values else np.unique(binned_label)
+    return {value: binned_activity[np.isin(binned_label, value)] for value in values}
+
+
+@pytest.fixture
+def binned():
+    rng = np.random.default_rng(0)
+    activity = rng.poisson(3, size=(2000, 7))
+    labels = rng.integers(0, 4, size=(3, 2000))
+    return activity, labels
+
+
+@pytest.mark.parametrize("specific_values", [None, [2, 0], [1, 7]])
+def test_split_activity_by_value_matches_masks(binned, specific_values):
+    activity, labels = binned
+    split = annotation_utils.split_activity_by_value(activity, labels[0], specific_values, use_names=False)
+    reference = reference_split(activity, labels[0], specific_values)
+
+    assert list(split) == list(reference)
+    for value in reference:
+        np.testing.assert_array_equal(split[value], reference[value])
+
+
+def test_split_activity_by_value_along_bin_axis(binned):
+    activity, labels = binned
+    split = annotation_utils.split_activity_by_value(activity.T, labels[0], axis=1, use_names=False)
+
+    for value, subset in reference_split(activity, labels[0]).items():
+        np.testing.assert_array_equal(split[value], subset.T)
+
+
+def test_split_activity_by_value_names(binned):
+    pytest.importorskip("inflect")
+    activity, labels = binned
+    split = annotation_utils.split_activity_by_value(activity, labels[0])
+
+    assert list(split) == ["zero", "one", "two", "three"]
+    np.testing.assert_array_equal(split["two"], activity[labels[0] == 2])
+
+
+def test_split_activity_by_labels_matches_joint_masks(binned):
+    activity, labels = binned
+    split = annotation_utils.split_activity_by_labels(activity, labels)
+
+    combinations = sorted(set(zip(*labels.tolist())))
+    assert sorted(split) == combinations
+    for combination in combinations:
+        mask = np.all(labels == np.array(combination)[:, None], axis=0)
+        np.testing.assert_array_equal(split[combination], activity[mask])
+
+
+def test_split_activity_by_labels_specific_values(binned):
+    activity, labels = binned
+    split = annotation_utils.split_activity_by_labels(activity.T, labels[:2], [(1, 0), (0, 9)], axis=1)
+
+    assert list(split) == [(1, 0), (0, 9)]
+    np.testing.assert_array_equal(split[(1, 0)], activity[(labels[0] == 1) & (labels[1] == 0)].T)
+    assert split[(0, 9)].shape == (activity.shape[1], 0)
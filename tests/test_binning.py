@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from epiphyte.preprocessing.annotation.stimulus_driven_annotation.movies import pause_handling
+
+from conftest import import_or_skip
+
+
+@pytest.fixture(scope="module")
+def binning():
+    return import_or_skip("epiphyte.preprocessing.data_preprocessing.binning")
+
+
+def reference_edges(rec_on, rec_off, bin_size, pause_starts=(), pause_stops=()):
+    # edges as built by bin_spikes
+    bins = np.linspace(rec_on, rec_off, int((rec_off - rec_on) / bin_size))
+    if len(pause_starts):
+        bins = pause_handling.rm_pauses_bins(bins, pause_starts, pause_stops)
+    return np.asarray(bins)
+
+
+def reference_lfp_means(edges, timestamps, samples):
+    means = np.full(len(edges) - 1, np.nan)
+    for i in range(len(edges) - 1):
+        inside = (timestamps >= edges[i]) & ((timestamps < edges[i + 1]) | ((i == len(edges) - 2) &
+                                                                           (timestamps == edges[-1])))
+        if inside.any():
+            means[i] = samples[inside].mean()
+    return means
+
+
+@pytest.mark.parametrize("pauses", [((), ()), ((2300.5, 7000.), (3100., 7450.2))])
+def test_grid_matches_bin_spikes_edges(binning, pauses):
+    grid = binning.BinGrid(1000., 12345.6, 25, *pauses)
+    np.testing.assert_array_equal(grid.edges(), reference_edges(1000., 12345.6, 25, *pauses))
+
+
+@pytest.mark.parametrize("chunk_bins", [7, 100, 10 ** 6])
+def test_spike_counts_match_histogram(binning, chunk_bins):
+    rng = np.random.default_rng(0)
+    spikes = np.sort(rng.uniform(900., 12400., 5000))
+    grid = binning.BinGrid(1000., 12345.6, 25)
+
+    counts = np.concatenate([c for _, c in binning.iter_spike_counts(grid, spikes, chunk_bins)])
+    np.testing.assert_array_equal(counts, np.histogram(spikes, bins=reference_edges(1000., 12345.6, 25))[0])
+
+
+def test_lfp_last_sample_of_bin_before_empty_bins(binning):
+    grid = binning.BinGrid(0, 100, 10)
+    timestamps = np.array([1., 2., 3., 4., 5.])
+    samples = np.array([1., 1., 1., 1., 100.])
+
+    (_, binned), = binning.iter_lfp_bins(grid, samples, timestamps)
+    assert binned[0] == pytest.approx(20.8)
+    assert np.isnan(binned[1:]).all()
+    np.testing.assert_array_equal(binning.lfp_bins_from_chunks(grid, [(timestamps, samples)]), binned)
+
+
+@pytest.mark.parametrize("chunk_bins", [5, 64, 10 ** 6])
+def test_lfp_bins_with_gaps_match_reference(binning, chunk_bins):
+    rng = np.random.default_rng(1)
+    timestamps = np.arange(1000., 9000., 1.)
+    # a recording gap, and a recording that ends before the grid
+    timestamps = timestamps[(timestamps < 3000) | (timestamps > 3400)]
+    samples = rng.normal(size=len(timestamps))
+    grid = binning.BinGrid(1000., 12345.6, 25)
+
+    expected = reference_lfp_means(grid.edges(), timestamps, samples)
+    binned = np.concatenate([b for _, b in binning.iter_lfp_bins(grid, samples, timestamps,
+                                                                 chunk_bins=chunk_bins)])
+    np.testing.assert_allclose(binned, expected)
+
+    chunks = [(timestamps[i:i + 777], samples[i:i + 777]) for i in range(0, len(samples), 777)]
+    np.testing.assert_allclose(binning.lfp_bins_from_chunks(grid, chunks), expected)
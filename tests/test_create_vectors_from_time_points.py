@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from conftest import import_or_skip
+
+
+@pytest.fixture(scope="module")
+def create_vectors():
+    return import_or_skip("epiphyte.preprocessing.data_preprocessing.create_vectors_from_time_points")
+
+
+def reference_nearest(vector, queries):
+    # the original full scan per query
+    return np.array([np.abs(vector - query).argmin() for query in queries])
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("ordered", [True, False])
+def test_nearest_indices_match_argmin(create_vectors, seed, ordered):
+    rng = np.random.default_rng(seed)
+    # rounded values give duplicates and exact ties between neighbours
+    vector = np.round(rng.uniform(0, 100, 500), 1)
+    if ordered:
+        vector = np.sort(vector)
+    queries = np.concatenate((np.round(rng.uniform(-10, 110, 2000), 2), vector[:50], [-1e9, 1e9]))
+
+    np.testing.assert_array_equal(create_vectors.nearest_indices(vector, queries),
+                                  reference_nearest(vector, queries))
+
+
+def test_nearest_indices_scalar_query(create_vectors):
+    vector = np.array([1.0, 2.5, 3.8, 5.0])
+    assert create_vectors.nearest_indices(vector, 3.0) == 1
+    assert create_vectors.nearest_indices(vector[:1], 9.0) == 0
+
+
+def reference_start_stop_times(neural_rec_time, patient_aligned_label):
+    # the original loop of get_start_stop_times_from_label
+    tmp = patient_aligned_label[0]
+    values = [tmp]
+    start_times = [neural_rec_time[0]]
+    stop_times = []
+    for i in range(1, len(patient_aligned_label)):
+        if not patient_aligned_label[i] == tmp:
+            values.append(patient_aligned_label[i])
+            start_times.append(neural_rec_time[i])
+            stop_times.append(neural_rec_time[i - 1])
+            tmp = patient_aligned_label[i]
+    stop_times.append(neural_rec_time[-1])
+    return values, start_times, stop_times
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_run_length_encode_matches_loop(create_vectors, seed):
+    rng = np.random.default_rng(seed)
+    time_points = np.cumsum(rng.uniform(30, 50, 3000))
+    label = np.repeat(rng.integers(0, 4, 300), rng.integers(1, 20, 300))[:3000]
+    time_points = time_points[:len(label)]
+
+    encoded = create_vectors.get_start_stop_times_from_label(time_points, label)
+    for actual, expected in zip(encoded, reference_start_stop_times(time_points, label)):
+        np.testing.assert_array_equal(actual, expected)
+
+
+def test_run_length_encode_stack_matches_rows(create_vectors):
+    rng = np.random.default_rng(0)
+    labels = (rng.random((4, 500)) < 0.1).astype(int)
+    labels[2] = 1
+    time_points = np.arange(500) * 40.
+
+    stacked = create_vectors.run_length_encode(labels, time_points)
+    for row, label in enumerate(labels):
+        for actual, expected in zip(stacked, reference_start_stop_times(time_points, label)):
+            np.testing.assert_array_equal(actual[row], expected)
@@ -0,0 +1,353 @@
+import numpy as np
+import pytest
+
+from epiphyte.preprocessing.data_preprocessing import data_utils
+
+from conftest import make_watchlog
+
+
+def write_ncs(path, n_valid, bit_volts=3.0517578125e-08, sample_rate=32000):
+    records = np.zeros(len(n_valid), data_utils.ncs_type)
+    records['timestamp'] = 10 ** 12 + np.arange(len(n_valid), dtype=np.uint64) * 16000
+    records['sample_rate'] = sample_rate
+    records['n_valid'] = n_valid
+    records['samples'] = np.random.default_rng(0).integers(-3000, 3000, (len(n_valid), 512))
+    header = "######## Neuralynx Data File Header\r\n-SamplingFrequency {}\r\n-ADBitVolts {}\r\n".format(
+        sample_rate, bit_volts).encode()
+    with open(path, 'wb') as ncsfile:
+        ncsfile.write(header.ljust(data_utils.NLX_OFFSET, b"\x00"))
+        ncsfile.write(records.tobytes())
+    return records
+
+
+def test_ncs_read_matches_records(tmp_path):
+    n_valid = np.full(50, 512)
+    n_valid[7] = 100
+    records = write_ncs(tmp_path / "CSC1.ncs", n_valid)
+    channel = data_utils.NcsChannel(tmp_path / "CSC1.ncs")
+
+    timestamps, samples = channel.read(chunk_records=8)
+
+    valid = np.arange(512) < n_valid[:, None]
+    np.testing.assert_allclose(samples, records['samples'][valid] * 3.0517578125e-08 * 1e6)
+    expected_timestamps = (records['timestamp'][:, None] + np.arange(512) * 1e6 / 32000)[valid] / 1000
+    np.testing.assert_allclose(timestamps, expected_timestamps)
+    assert channel.header["SamplingFrequency"] == "32000"
+
+
+def test_ncs_read_clips_corrupt_n_valid(tmp_path):
+    n_valid = np.full(10, 512)
+    n_valid[3] = 60000
+    records = write_ncs(tmp_path / "CSC1.ncs", n_valid)
+    channel = data_utils.NcsChannel(tmp_path / "CSC1.ncs")
+
+    with pytest.warns(UserWarning, match="n_valid"):
+        timestamps, samples = channel.read(chunk_records=4)
+
+    assert len(samples) == len(timestamps) == 10 * 512
+    np.testing.assert_allclose(samples, records['samples'].ravel() * 3.0517578125e-08 * 1e6)
+
+
+def drift_model(n_segments, knots, knot_values):
+    return data_utils.TimeConversion.from_dict({"m": 1e-3, "b": 0., "n_segments": n_segments,
+                                                "knots": knots, "knot_values": knot_values})
+
+
+def test_fit_drift_round_trip():
+    rng = np.random.default_rng(0)
+    cpu_times = np.sort(rng.uniform(0, 3.6e9, 400))
+    neural_times = cpu_times / 1000 * (1 + 2e-5 * np.sin(cpu_times / 1e9)) + 5000.
+
+    knots, knot_values = data_utils.fit_drift(cpu_times, neural_times, 8)
+    conversion = drift_model(8, knots.tolist(), knot_values.tolist())
+
+    np.testing.assert_allclose(conversion.to_cpu(conversion.to_neural(cpu_times)), cpu_times)
+
+
+def test_fit_drift_rejects_more_segments_than_events():
+    cpu_times = np.array([0., 1e6, 2e6, 3e6])
+    with pytest.raises(ValueError, match="at least"):
+        data_utils.fit_drift(cpu_times, cpu_times / 1000, 4)
+
+
+def test_fit_drift_rejects_segments_without_events():
+    # enough events, but all of them in the first and last segment
+    cpu_times = np.concatenate((np.linspace(0, 1e6, 10), np.linspace(9e6, 1e7, 10)))
+    with pytest.raises(ValueError, match="underdetermined"):
+        data_utils.fit_drift(cpu_times, cpu_times / 1000, 5)
+
+
+def test_to_cpu_rejects_non_monotonic_knot_values():
+    conversion = drift_model(2, [0., 1e6, 2e6], [0., 1000., 900.])
+    with pytest.raises(ValueError, match="increasing"):
+        conversion.to_cpu(950.)
+
+
+def reference_watchlog(data):
+    # the original line loops of read_watchlog and read_watchlog_pauses
+    lines = data.splitlines()
+    pts, time = [], []
+    for line in lines[1:]:
+        fields = line.split()
+        if len(fields) == 4:
+            pts.append(float(fields[1]))
+            time.append(int(fields[3]))
+
+    start_time, stop_time = [], []
+    for i, line in enumerate(lines):
+        first = str(line.split()[0])
+        if "Pausing" in first:
+            start_time.append(int(lines[i - 1].split()[3]))
+        if "Continuing" in first:
+            stop_time.append(int(lines[i + 1].split()[3]))
+        if "Properly" in first:
+            stop_time.append(int(lines[i - 3].split()[3]))
+    return np.array(pts), np.array(time), start_time, stop_time
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("terminated", [True, False])
+def test_watchlog_matches_line_loop(tmp_path, seed, terminated):
+    data = make_watchlog(seed=seed, n_frames=2000, n_pauses=4, terminated=terminated)
+    path = tmp_path / "watchlog.log"
+    path.write_bytes(data)
+
+    pts, time, start_time, stop_time = reference_watchlog(data)
+    np.testing.assert_array_equal(data_utils.read_watchlog(path)[0], pts)
+    np.testing.assert_array_equal(data_utils.read_watchlog(path)[1], time)
+    assert data_utils.read_watchlog_pauses(path) == (start_time, stop_time)
+
+
+def test_cached_watchlog_is_read_only(tmp_path, watchlog_bytes):
+    path = tmp_path / "watchlog.log"
+    path.write_bytes(watchlog_bytes)
+
+    pts, cpu_time = data_utils.read_watchlog(path)
+    with pytest.raises(ValueError):
+        pts[0] = -1.
+    with pytest.raises(ValueError):
+        cpu_time += 1
+
+    watchlog = data_utils.parse_watchlog(path)
+    assert watchlog is data_utils.parse_watchlog(path)
+    assert not watchlog.pause_start_times.flags.writeable
+    assert not watchlog.marker_lines["Pausing"].flags.writeable
+    np.testing.assert_array_equal(watchlog.cpu_time, reference_watchlog(watchlog_bytes)[1])
+
+
+def make_daqlog(seed=0, n_rows=500, malformed=False):
+    rng = np.random.default_rng(seed)
+    lines = ["Initial signature: 255\t255", "255\t255\t", "data\tStamp\tpre\tpost"]
+    pretime = 1600000000000 + np.cumsum(rng.integers(1000, 100000, n_rows))
+    for row in range(n_rows):
+        lines.append("{}\t{}\t{}\t{}".format(2 ** (row % 8), row, pretime[row], pretime[row] + rng.integers(10, 90)))
+        if malformed and row % 97 == 5:
+            lines += ["", "{}\t{}".format(row, pretime[row]), "1\t2\t3\t4\t5"]
+    return ("\n".join(lines) + "\n").encode()
+
+
+def reference_daqlog(data):
+    # the original line loop of read_daqlog
+    values, pretime, posttime = [], [], []
+    for line in data.splitlines()[3:]:
+        fields = line.split()
+        if len(fields) == 4:
+            values.append(int(fields[0]))
+            pretime.append(int(fields[2]))
+            posttime.append(int(fields[3]))
+    return np.array(values), np.array(pretime), np.array(posttime)
+
+
+@pytest.mark.parametrize("malformed", [False, True])
+def test_daqlog_matches_line_loop(tmp_path, malformed):
+    data = make_daqlog(malformed=malformed)
+    path = tmp_path / "daq.log"
+    path.write_bytes(data)
+
+    for actual, expected in zip(data_utils.read_daqlog(path), reference_daqlog(data)):
+        np.testing.assert_array_equal(actual, expected)
+
+
+def test_daqlog_reports_malformed_lines(tmp_path):
+    data = make_daqlog(n_rows=20).replace(b"\n8\t3\t", b"\n8\tx\t", 1)
+    path = tmp_path / "daq.log"
+    path.write_bytes(data)
+
+    records, malformed_lines = data_utils.load_daqlog(path)
+    assert malformed_lines.tolist() == [6]
+    assert len(records) == 19 and 8 not in records['value'][:8]
+
+
+def reference_movie_events(ev_array):
+    # the original state machine of process_movie_events
+    wait_for = [1]
+    last = 0
+    keep = []
+    for row in ev_array:
+        code = row[1].astype(int)
+        if code not in wait_for:
+            continue
+        elif code in [1, 2, 4, 8, 16, 32, 64, 128]:
+            wait_for = [0]
+            keep.append(row)
+        elif code == 0:
+            if last == 128:
+                wait_for = [1]
+            elif last in [1, 2, 4, 8, 16, 32, 64]:
+                wait_for = [last * 2]
+        last = code
+    return np.array(keep)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_movie_events_match_state_machine(seed):
+    rng = np.random.default_rng(seed)
+    codes = np.ravel([[code, 0] for code in np.tile(data_utils.MOVIE_EVENT_CODES, 40)])
+    # noise: stray codes, dropped and repeated rows
+    codes = np.insert(codes, rng.integers(0, len(codes), 60), rng.choice([0, 1, 2, 4, 8, 16, 32, 64, 128, 101], 60))
+    codes = np.delete(codes, rng.integers(0, len(codes), 20))
+    codes = np.repeat(codes, rng.choice([1, 1, 1, 2], len(codes)))
+    ev_array = np.column_stack((np.cumsum(rng.uniform(10, 100, len(codes))), codes))
+
+    expected = reference_movie_events(ev_array)
+    keep, broken = data_utils.process_movie_events(ev_array, return_broken=True)
+
+    np.testing.assert_array_equal(keep, expected)
+    pings = np.flatnonzero(np.isin(codes, data_utils.MOVIE_EVENT_CODES))
+    assert len(broken) == len(pings) - len(expected)
+    assert not np.isin(ev_array[broken, 0], expected[:, 0]).any()
+
+
+@pytest.mark.parametrize("field", [b"16000.5", b"1e6", b"12-3", b"-", b"0x10"])
+def test_watchlog_rejects_non_integer_time(field):
+    data = make_watchlog(n_frames=20).replace(b"\n", b"\npts\t0.80\ttime\t" + field + b"\n", 5)
+    with pytest.raises(ValueError, match="int"):
+        data_utils.parse_watchlog_buffer(data)
+
+
+def test_watchlog_accepts_signed_time():
+    data = b"hdr a b c\npts 0.00 time +1000\npts 0.04 time -40\n"
+    assert data_utils.parse_watchlog_buffer(data).cpu_time.tolist() == [1000, -40]
+
+
+@pytest.mark.parametrize("field", [b"16000.5", b"12-3", b"+"])
+def test_daqlog_skips_non_integer_fields(tmp_path, field):
+    data = make_daqlog(n_rows=20).replace(b"\n8\t3\t", b"\n8\t" + field + b"\t", 1)
+    path = tmp_path / "daq.log"
+    path.write_bytes(data)
+
+    records, malformed_lines = data_utils.load_daqlog(path)
+    assert malformed_lines.tolist() == [6]
+    np.testing.assert_array_equal(records['stamp'], np.delete(np.arange(20), 3))
+
+
+def reference_convert_skips(pts, daq_time):
+    # the original convert_skips, after self.convert()
+    threshold = 1
+    max_jump = np.max(np.abs(np.diff(pts)))
+    if max_jump >= threshold:
+        beyond_threshold = np.where(np.abs(np.diff(pts)) > threshold)[0]
+        timepoints_of_skips = [daq_time[0]]
+        for index in beyond_threshold:
+            timepoints_of_skips.append(daq_time[index])
+            timepoints_of_skips.append(daq_time[index + 1])
+        timepoints_of_skips.append(daq_time[-1])
+        start_values = timepoints_of_skips[0:-1:2]
+        stop_values = timepoints_of_skips[1::2]
+        values = np.array(range(0, len(start_values)))
+    else:
+        start_values = daq_time[0]
+        stop_values = daq_time[-1]
+        values = np.array([0])
+    return start_values, stop_values, values
+
+
+@pytest.mark.parametrize("n_skips", [0, 1, 5])
+def test_convert_skips_matches_original(n_skips):
+    rng = np.random.default_rng(n_skips)
+    pts = np.arange(5000) * 0.04
+    for frame in rng.choice(np.arange(1, 5000), n_skips, replace=False):
+        pts[frame:] += rng.choice([-1, 1]) * rng.integers(30, 500) * 0.04
+    # small jitter and jumps below the threshold are not skips
+    pts[100:] += 0.4
+    daq_time = 1e6 + np.cumsum(rng.uniform(39, 41, 5000))
+    conversion = data_utils.TimeConversion(None, None, None)
+
+    starts, stops, values = conversion.convert_skips(pts, daq_time)
+    expected_starts, expected_stops, expected_values = reference_convert_skips(pts, daq_time)
+
+    assert isinstance(starts, list) == isinstance(expected_starts, list)
+    np.testing.assert_array_equal(starts, expected_starts)
+    np.testing.assert_array_equal(stops, expected_stops)
+    np.testing.assert_array_equal(values, expected_values)
+    assert np.ndim(starts) == np.ndim(expected_starts)
+
+    skips = data_utils.detect_skips(pts, daq_time)
+    np.testing.assert_array_equal(skips.start_times, np.atleast_1d(expected_starts))
+    np.testing.assert_array_equal(skips.stop_times, np.atleast_1d(expected_stops))
+    assert len(skips) == n_skips + 1
+    np.testing.assert_allclose(pts[skips.frame_starts[1:]] - pts[skips.frame_starts[1:] - 1],
+                               skips.jumps[1:] * 0.04)
+
+
+def write_nev(path, n_events=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    records = np.zeros(n_events, data_utils.nev_type)
+    records['timestamp'] = 10 ** 12 + np.cumsum(rng.integers(1, 10 ** 5, n_events), dtype=np.uint64)
+    records['nttl'] = rng.choice([0, 1, 2, 4, 8, 101], n_events)
+    records['ev_string'] = [b"TTL %d" % i for i in range(n_events)]
+    with open(path, 'wb') as nevfile:
+        nevfile.write(b"######## Neuralynx Data File Header\r\n".ljust(data_utils.NLX_OFFSET, b"\x00"))
+        nevfile.write(records.tobytes())
+    return records
+
+
+def reference_nev_read(filename):
+    """(timestamp, nttl) array read from a memmap, as nev_read did before nev_events."""
+    eventmap = np.memmap(filename, dtype=data_utils.nev_type, mode='r', offset=data_utils.NLX_OFFSET)
+    return np.array([eventmap['timestamp'], eventmap['nttl']]).T
+
+
+def test_nev_read_matches_memmap(tmp_path):
+    path = tmp_path / "Events.nev"
+    records = write_nev(path)
+
+    np.testing.assert_array_equal(data_utils.nev_read(path), reference_nev_read(path))
+    events = data_utils.nev_events(path)
+    assert events.dtype == data_utils.nev_type and not events.flags.writeable
+    np.testing.assert_array_equal(events['timestamp'], records['timestamp'])
+    np.testing.assert_array_equal(data_utils.nev_string_read(path)[:, 1], records['ev_string'])
+    np.testing.assert_array_equal(np.concatenate(list(data_utils.iter_nev_chunks(path, chunk_size=700))), events)
+
+
+@pytest.mark.parametrize("codes, start_index, stop_index", [
+    (None, None, None), ([1, 101], None, None), (None, 1200, 3300), ([4], 10, 4999), ([7], 0, 100)])
+def test_nev_select_matches_masks(tmp_path, codes, start_index, stop_index):
+    path = tmp_path / "Events.nev"
+    records = write_nev(path)
+    reference = reference_nev_read(path)
+    # boundaries on and between event timestamps
+    start = None if start_index is None else int(records['timestamp'][start_index])
+    stop = None if stop_index is None else int(records['timestamp'][stop_index]) - 1
+
+    selected = data_utils.nev_select(path, codes, start, stop, chunk_size=333)
+
+    mask = np.ones(len(records), dtype=bool)
+    if codes is not None:
+        mask &= np.isin(reference[:, 1], codes)
+    if start is not None:
+        mask &= reference[:, 0] >= start
+    if stop is not None:
+        mask &= reference[:, 0] <= stop
+    assert selected.dtype == data_utils.nev_type
+    np.testing.assert_array_equal(np.array([selected['timestamp'], selected['nttl']]).T, reference[mask])
+    np.testing.assert_array_equal(selected['ev_string'], records['ev_string'][mask])
+
+
+def test_nev_select_mock_npy(tmp_path):
+    ev_array = np.array([[100, 1], [200, 0], [300, 2], [400, 1]])
+    np.save(tmp_path / "events.npy", ev_array)
+
+    selected = data_utils.nev_select(tmp_path / "events.npy", [1], start=150)
+    assert selected['timestamp'].tolist() == [400]
+    assert selected['nttl'].tolist() == [1]
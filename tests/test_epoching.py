@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from conftest import import_or_skip
+
+
+@pytest.fixture(scope="module")
+def epoching():
+    return import_or_skip("epiphyte.preprocessing.data_preprocessing.epoching")
+
+
+@pytest.fixture
+def spike_trains():
+    rng = np.random.default_rng(0)
+    # unsorted trains, an empty one, and spikes exactly on segment bounds
+    trains = [rng.permutation(np.round(rng.uniform(0, 20000, n), 1)) for n in (0, 50, 3000)]
+    trains[2][:5] = [1000., 2000., 2040., 5000., 5000.]
+    return trains
+
+
+def test_psth_counts_match_masks(epoching, spike_trains):
+    event_times = np.array([950., 1000., 4980.5, 19900.])
+    counts, bin_edges = epoching.psth_counts(spike_trains, event_times, (-500, 1000), 20)
+
+    assert counts.shape == (4, 3, 75)
+    np.testing.assert_allclose(bin_edges, np.arange(-500, 1001, 20))
+    for event, event_time in enumerate(event_times):
+        for unit, train in enumerate(spike_trains):
+            expected = [np.sum((train >= event_time + low) & (train < event_time + high))
+                        for low, high in zip(bin_edges[:-1], bin_edges[1:])]
+            np.testing.assert_array_equal(counts[event, unit], expected)
+
+
+def test_epoch_spikes_match_masks(epoching, spike_trains):
+    start_times = np.array([1000., 1500., 2000., 5000., 12000.])
+    stop_times = np.array([2000., 1960., 2040., 5000., 11000.])
+    spikes = epoching.epoch_spikes(spike_trains, start_times, stop_times)
+
+    assert spikes.shape == (5, 3)
+    for segment, (start, stop) in enumerate(zip(start_times, stop_times)):
+        for unit, train in enumerate(spike_trains):
+            expected = np.sort(train[(train >= start) & (train <= stop)]) - start
+            np.testing.assert_array_equal(spikes[segment, unit], expected)
+            assert spikes.counts[segment, unit] == len(expected)
+
+
+def test_epoch_durations_include_stop_frame(epoching, spike_trains):
+    # a single-frame segment lasts one frame, not zero
+    spikes = epoching.epoch_spikes(spike_trains, [5000., 1000.], [5000., 1960.])
+
+    np.testing.assert_allclose(spikes.durations, [40., 1000.])
+    assert np.isfinite(spikes.rates()).all()
+    assert spikes.rates()[0, 2] == pytest.approx(2 / 0.04)
+
+
+@pytest.fixture
+def session(epoching, spike_trains, monkeypatch):
+    values = np.array([0, 1, 0, 2, 0, 1])
+    start_times = np.array([0., 1000., 3000., 4980., 9000., 19800.])
+    stop_times = np.append(start_times[1:] - 40, 20000.)
+    unit_ids = np.array([3, 5, 8])
+    trains = np.empty(3, dtype=object)
+    trains[:] = spike_trains
+
+    monkeypatch.setattr(epoching, "get_patient_aligned_label_info", lambda *_: (values, start_times, stop_times))
+    monkeypatch.setattr(epoching, "get_session_spike_times", lambda *_: (unit_ids, trains))
+    monkeypatch.setattr(epoching, "get_start_stop_times_pauses", lambda *_: ([5500.], [6000.]))
+    return start_times[values != 0]
+
+
+@pytest.mark.parametrize("exclude_pauses", [False, True])
+def test_psth_matches_per_event_masks(epoching, spike_trains, session, exclude_pauses):
+    counts, mean, sem, bin_edges, event_times = epoching.psth(1, 1, "label", (-500, 1000), 50, units=[3, 8],
+                                                              exclude_pauses=exclude_pauses)
+
+    # the window of the onset at 4980 ms reaches into the pause
+    expected_events = session[session != 4980.] if exclude_pauses else session
+    np.testing.assert_array_equal(event_times, expected_events)
+    expected = np.array([[[np.sum((train >= event + low) & (train < event + low + 50)) for low in bin_edges[:-1]]
+                          for train in (spike_trains[0], spike_trains[2])] for event in expected_events])
+    np.testing.assert_array_equal(counts, expected)
+    np.testing.assert_allclose(mean, expected.mean(axis=0))
+    np.testing.assert_allclose(sem, expected.std(axis=0, ddof=1) / np.sqrt(len(expected_events)))
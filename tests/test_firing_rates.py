@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from conftest import import_or_skip
+
+
+@pytest.fixture(scope="module")
+def binning():
+    return import_or_skip("epiphyte.preprocessing.data_preprocessing.binning")
+
+
+@pytest.fixture(scope="module")
+def firing_rates():
+    return import_or_skip("epiphyte.preprocessing.data_preprocessing.firing_rates")
+
+
+def test_counts_match_histogram_per_unit(binning, firing_rates):
+    rng = np.random.default_rng(0)
+    grid = binning.BinGrid(1000., 12345.6, 25, [2300.5, 7000.], [3100., 7450.2])
+    spike_trains = [np.sort(rng.uniform(900., 12400., n)) for n in (0, 10, 3000)]
+
+    counts = firing_rates.count_spikes_per_unit(grid, spike_trains)
+
+    for unit, train in enumerate(spike_trains):
+        train = train[~((train >= 2300.5) & (train <= 3100.) | (train >= 7000.) & (train <= 7450.2))]
+        np.testing.assert_array_equal(counts[unit], np.histogram(train, bins=grid.edges())[0])
+
+
+def test_no_units(binning, firing_rates):
+    grid = binning.BinGrid(1000., 12345.6, 25)
+
+    assert firing_rates.count_spikes_per_unit(grid, []).shape == (0, grid.n_bins)
+    assert firing_rates.smoothed_firing_rates(grid, []).shape == (0, grid.n_bins)
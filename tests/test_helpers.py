@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+import epiphyte.database.helpers as helpers
+
+
+def reference_match_label(default_label, patient_pts):
+    """Per-frame lookup of match_label_to_patient_pts_time before it was vectorized."""
+    return [default_label[int(np.round(frame / 0.04, 0)) - 1] for _, frame in enumerate(patient_pts)]
+
+
+@pytest.fixture
+def watched_pts():
+    # watched frames with pauses (repeated frames) and skips back and forth
+    rng = np.random.default_rng(0)
+    frames = np.arange(1, 3001)
+    frames = np.concatenate((frames[:800], np.repeat(frames[800], 25), frames[800:1500],
+                             frames[2400:], frames[1000:1200]))
+    return np.round(frames * 0.04, 2), rng.integers(0, 4, size=(20, 3000))
+
+
+def test_match_label_to_patient_pts_time_matches_frame_loop(watched_pts):
+    patient_pts, labels = watched_pts
+    for default_label in labels[:3]:
+        aligned = helpers.match_label_to_patient_pts_time(default_label, patient_pts)
+        assert isinstance(aligned, list)
+        assert aligned == reference_match_label(default_label, patient_pts)
+
+
+def test_align_labels_to_pts_matches_frame_loop(watched_pts):
+    patient_pts, labels = watched_pts
+    aligned = helpers.align_labels_to_pts(labels, patient_pts)
+
+    assert aligned.shape == (len(labels), len(patient_pts))
+    for default_label, aligned_label in zip(labels, aligned):
+        assert aligned_label.tolist() == reference_match_label(default_label, patient_pts)
+
+
+def test_align_labels_to_pts_single_label(watched_pts):
+    patient_pts, labels = watched_pts
+    aligned = helpers.align_labels_to_pts(labels[0], patient_pts)
+
+    assert aligned.shape == (len(patient_pts),)
+    np.testing.assert_array_equal(aligned, helpers.align_labels_to_pts(labels, patient_pts)[0])
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from conftest import import_or_skip
+
+
+@pytest.fixture(scope="module")
+def label_statistics():
+    return import_or_skip("epiphyte.preprocessing.annotation.stimulus_driven_annotation.movies.label_statistics")
+
+
+@pytest.fixture
+def annotations(label_statistics, monkeypatch):
+    keys = [{"label_name": name, "annotator_id": "ann", "annotation_date": "2020-01-01"}
+            for name in ("a", "b", "c")]
+    values = [np.array([0, 1, 0]), np.array([1, 0]), np.array([0, 1])]
+    start_times = [np.array([0., 10., 20.]), np.array([0., 15.]), np.array([0., 5.])]
+    stop_times = [np.array([9., 19., 30.]), np.array([14., 30.]), np.array([4., 30.])]
+
+    query_functions = label_statistics.query_functions
+    monkeypatch.setattr(query_functions, "get_movie_annotation_keys", lambda: keys)
+    monkeypatch.setattr(query_functions, "get_movie_annotation_segments",
+                        lambda: (keys, values, start_times, stop_times))
+    label_statistics.clear_cooccurrence_cache()
+    yield
+    label_statistics.clear_cooccurrence_cache()
+
+
+def test_cached_cooccurrence_is_read_only(label_statistics, annotations):
+    overlap, label_keys = label_statistics.label_cooccurrence()
+
+    with pytest.raises(ValueError):
+        overlap[0, 0] = -1.
+    label_keys.append(("d", "ann"))
+
+    cached_overlap, cached_keys = label_statistics.label_cooccurrence()
+    assert cached_overlap is overlap
+    assert cached_keys == [("a", "ann"), ("b", "ann"), ("c", "ann")]
+    assert overlap[0, 1] == overlap[1, 0] == pytest.approx(4.04)
+
+
+def dense_overlap(values, start_times, stop_times, frames):
+    # overlaps of the indicator functions built frame by frame
+    processing_labels = import_or_skip(
+        "epiphyte.preprocessing.annotation.stimulus_driven_annotation.movies.processing_labels")
+    dense = np.array([processing_labels.make_label_from_start_stop_times(v, start, stop, frames)
+                      for v, start, stop in zip(values, start_times, stop_times)]) != 0
+    dense = dense.astype(float)
+    return dense @ dense.T * 0.04
+
+
+def test_disjoint_segments_do_not_overlap(label_statistics):
+    activity, durations = label_statistics.label_activity(
+        [np.array([1, 1]), np.array([1])],
+        [np.array([10., 100.]), np.array([50.])],
+        [np.array([20., 110.]), np.array([60.])])
+    overlap = label_statistics.overlap_matrix(activity, durations)
+
+    assert overlap[0, 1] == 0
+    np.testing.assert_allclose(np.diag(overlap), [20.08, 10.04])
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_overlaps_match_dense_labels(label_statistics, seed):
+    rng = np.random.default_rng(seed)
+    frames = np.round(np.arange(3000) * 0.04, 2)
+    values, start_times, stop_times = [], [], []
+    for _ in range(6):
+        # segments with gaps, overlaps, single frames and explicit default values
+        n_segments = rng.integers(1, 30)
+        first = np.sort(rng.integers(0, 2990, n_segments))
+        last = np.minimum(first + rng.integers(0, 200, n_segments), 2999)
+        values.append(rng.choice([0, 1, 1, 2], n_segments))
+        start_times.append(frames[first])
+        stop_times.append(frames[last])
+
+    activity, durations = label_statistics.label_activity(values, start_times, stop_times)
+
+    np.testing.assert_allclose(label_statistics.overlap_matrix(activity, durations),
+                               dense_overlap(values, start_times, stop_times, frames), atol=1e-6)
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from conftest import import_or_skip
+
+
+@pytest.fixture(scope="module")
+def label_store():
+    return import_or_skip("epiphyte.preprocessing.annotation.stimulus_driven_annotation.movies.label_store")
+
+
+class MockAnnotations(object):
+    """``MovieAnnotation`` stand-in: ``{(label_name, annotator_id, annotation_date): indicator_function}``."""
+
+    def __init__(self, labels):
+        self.labels = dict(labels)
+        self.fetched = []
+
+    def keys(self):
+        return [{"label_name": name, "annotator_id": annotator, "annotation_date": date}
+                for name, annotator, date in sorted(self.labels)]
+
+    def indicator_functions(self, keys):
+        versions = [(key["label_name"], key["annotator_id"], key["annotation_date"]) for key in keys]
+        self.fetched += versions
+        return keys, [self.labels[version] for version in versions]
+
+
+@pytest.fixture
+def annotations(label_store, monkeypatch):
+    rng = np.random.default_rng(0)
+    mock = MockAnnotations({(name, "ann", "20200101"): rng.integers(0, 2, 100) for name in ("a", "b", "c")})
+    monkeypatch.setattr(label_store.query_functions, "get_movie_annotation_keys", mock.keys)
+    monkeypatch.setattr(label_store.query_functions, "get_movie_indicator_functions", mock.indicator_functions)
+    return mock
+
+
+def test_sync_fetches_only_changes(label_store, annotations, tmp_path):
+    store = label_store.FrameLabelStore(str(tmp_path))
+    assert store.sync() == {"fetched": 3, "kept": 0, "removed": 0}
+    assert store.labels.dtype == bool
+    np.testing.assert_array_equal(store.label("b"), annotations.labels[("b", "ann", "20200101")])
+
+    # a new label with a wider dtype, a deleted label and a new annotation date
+    annotations.labels[("d", "ann", "20200101")] = np.arange(100) * 10
+    del annotations.labels[("a", "ann", "20200101")]
+    annotations.labels[("c", "ann", "20210101")] = annotations.labels.pop(("c", "ann", "20200101"))
+    annotations.fetched.clear()
+
+    assert store.sync() == {"fetched": 2, "kept": 1, "removed": 2}
+    assert sorted(annotations.fetched) == [("c", "ann", "20210101"), ("d", "ann", "20200101")]
+    assert store.labels.dtype == np.uint16
+    assert store.label_names() == ["b", "c", "d"]
+
+    reopened = label_store.FrameLabelStore(str(tmp_path))
+    for name, annotator, date in annotations.labels:
+        np.testing.assert_array_equal(reopened.label(name), annotations.labels[(name, annotator, date)])
+    assert reopened.sync() == {"fetched": 0, "kept": 3, "removed": 0}
+
+
+def test_select_unknown_label(label_store, annotations, tmp_path):
+    store = label_store.FrameLabelStore(str(tmp_path))
+    store.sync()
+
+    assert store.select(["a", "b"]).shape == (2, 100)
+    with pytest.raises(KeyError, match="missing"):
+        store.select(["a", "missing"])
+
+
+def test_half_swapped_store_is_rebuilt(label_store, annotations, tmp_path):
+    store = label_store.FrameLabelStore(str(tmp_path))
+    store.sync()
+    # crash between the two replaces: new matrix, old index
+    np.save(store.labels_path, np.zeros((4, 100), dtype=bool))
+
+    reopened = label_store.FrameLabelStore(str(tmp_path))
+    assert reopened.labels is None and len(reopened) == 0
+    assert reopened.sync() == {"fetched": 3, "kept": 0, "removed": 0}
+    np.testing.assert_array_equal(reopened.label("a"), annotations.labels[("a", "ann", "20200101")])
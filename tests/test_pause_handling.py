@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from epiphyte.preprocessing.annotation.stimulus_driven_annotation.movies import pause_handling
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_overlaps_pauses_matches_pairwise_check(seed):
+    rng = np.random.default_rng(seed)
+    # overlapping and nested pauses
+    start = rng.uniform(0, 10000, 8)
+    stop = start + rng.uniform(0, 1500, 8)
+    interval_starts = rng.uniform(-500, 10500, 300)
+    interval_stops = interval_starts + rng.uniform(0, 300, 300)
+    # intervals touching a pause bound from outside
+    interval_starts = np.concatenate((interval_starts, stop[:3]))
+    interval_stops = np.concatenate((interval_stops, stop[:3] + 10))
+
+    expected = [any(low <= pause_stop and pause_start <= high for pause_start, pause_stop in zip(start, stop))
+                for low, high in zip(interval_starts, interval_stops)]
+    np.testing.assert_array_equal(pause_handling.overlaps_pauses(interval_starts, interval_stops, start, stop),
+                                  expected)
+
+
+def test_overlaps_pauses_without_pauses():
+    assert not pause_handling.overlaps_pauses([1., 2.], [3., 4.], [], []).any()
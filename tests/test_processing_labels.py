@@ -0,0 +1,114 @@
+import json
+
+import numpy as np
+import pytest
+
+from conftest import import_or_skip
+
+
+@pytest.fixture(scope="module")
+def processing_labels():
+    return import_or_skip("epiphyte.preprocessing.annotation.stimulus_driven_annotation.movies.processing_labels")
+
+
+@pytest.fixture
+def advene_file(tmp_path):
+    rng = np.random.default_rng(0)
+    annotations = [{"id": "a{}".format(i), "type": "lab{}".format(rng.integers(5)),
+                    "begin": int(rng.integers(0, 10 ** 6)), "end": int(rng.integers(0, 10 ** 6)),
+                    "title": str(rng.integers(2)), "content": {"data": 'x "]} ,'}}
+                   for i in range(300)]
+    path = tmp_path / "advene.json"
+    path.write_text(json.dumps({"meta": {"x": [1, 2]}, "annotations": annotations}, indent=1))
+    return path, annotations
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_read_advene_json_matches_annotations(processing_labels, advene_file, streaming):
+    path, annotations = advene_file
+    labels = processing_labels.read_advene_json(str(path), streaming=streaming)
+
+    assert sorted(labels) == sorted({annotation["type"] for annotation in annotations})
+    for label_name, (values, start_times, stop_times) in labels.items():
+        expected = [annotation for annotation in annotations if annotation["type"] == label_name]
+        assert values.tolist() == [annotation["title"] for annotation in expected]
+        np.testing.assert_array_equal(start_times, [annotation["begin"] / 1000 for annotation in expected])
+        np.testing.assert_array_equal(stop_times, [annotation["end"] / 1000 for annotation in expected])
+
+
+def test_cached_advene_labels_are_read_only(processing_labels, advene_file):
+    path, _ = advene_file
+    values, start_times, stop_times = processing_labels.start_stop_values_from_json(str(path), "lab1")
+
+    with pytest.raises(ValueError):
+        values[0] = "2"
+    with pytest.raises(ValueError):
+        values.sort()
+    assert processing_labels.start_stop_values_from_json(str(path), "lab1")[0] is values
+
+
+def test_make_label_from_start_stop_times(processing_labels):
+    ref_vec = np.round(np.arange(10) * 0.04, 2)
+    label = processing_labels.make_label_from_start_stop_times([1, 2], [0.04, 0.2], [0.12, 0.2], ref_vec)
+    assert label == [0, 1, 1, 1, 0, 2, 0, 0, 0, 0]
+
+    rle = processing_labels.rle_label.RLELabel(np.array([1, 2]), np.array([0.04, 0.2]), np.array([0.12, 0.2]))
+    assert processing_labels.make_label_from_start_stop_times(rle, ref_vec=ref_vec) == label
+
+
+def test_make_label_without_reference_vector(processing_labels):
+    assert processing_labels.make_label_from_start_stop_times([1], [0.04], [0.12]) == -1
+    assert processing_labels.make_label_from_start_stop_times([1], ref_vec=np.arange(5)) == -1
+    assert processing_labels.make_label_from_start_stop_times([1, 2], [0.04], [0.12], np.arange(5)) == -1
+
+
+def reference_create_xml_for_advene(id_name, start_end_times_vector, label_name, values=None):
+    """Advene XML built by string concatenation, as create_xml_for_advene did before streaming."""
+    new_annotations = ""
+    for id_, (start, end) in enumerate(start_end_times_vector):
+        value = 1 if values is None else values[id_]
+        new_annotations += '<annotation id="{}{}" type="#{}"><millisecond-fragment begin="{}" end="{}"/>' \
+                           '<content>num={}</content></annotation>'.format(id_name, id_, label_name,
+                                                                          int(start * 1000), int(end * 1000), value)
+    return new_annotations
+
+
+@pytest.fixture
+def annotation_rows():
+    rng = np.random.default_rng(0)
+    rows = []
+    for i_label in range(4):
+        values = rng.integers(0, 3, 50)
+        start_times = np.round(np.sort(rng.choice(5000, 50, replace=False)) * 0.04, 2)
+        rows.append({"label_name": "label{}".format(i_label), "annotator_id": "ann{}".format(i_label % 2),
+                     "values": values, "start_times": start_times, "stop_times": start_times + 0.4})
+    return rows
+
+
+def test_create_xml_for_advene_matches_concatenation(processing_labels, annotation_rows):
+    row = annotation_rows[0]
+    start_end_times = list(zip(row["start_times"], row["stop_times"]))
+
+    assert processing_labels.create_xml_for_advene("id_", start_end_times, "lab") == \
+        reference_create_xml_for_advene("id_", start_end_times, "lab")
+    assert processing_labels.create_xml_for_advene("id_", [], "lab") == ""
+
+
+def test_write_advene_xml_matches_present_segments(processing_labels, annotation_rows, tmp_path):
+    expected = ""
+    for row in annotation_rows:
+        present = row["values"] != 0
+        expected += reference_create_xml_for_advene(
+            "{}_{}_".format(row["label_name"], row["annotator_id"]),
+            list(zip(row["start_times"][present], row["stop_times"][present])),
+            row["label_name"], row["values"][present].tolist())
+
+    path = tmp_path / "annotations.xml"
+    n_written = processing_labels.write_advene_xml(str(path), iter(annotation_rows))
+
+    assert path.read_text() == expected
+    assert n_written == sum(int(np.sum(row["values"] != 0)) for row in annotation_rows)
+
+    with open(tmp_path / "handle.xml", "w") as handle:
+        processing_labels.write_advene_xml(handle, annotation_rows)
+    assert (tmp_path / "handle.xml").read_text() == expected
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from conftest import import_or_skip
+
+
+@pytest.fixture(scope="module")
+def rle_label():
+    return import_or_skip("epiphyte.preprocessing.annotation.stimulus_driven_annotation.movies.rle_label")
+
+
+def frames(n_frames, first=0):
+    return np.round(np.arange(first, first + n_frames) * 0.04, 2)
+
+
+def indicator(n_frames, first, last):
+    label = np.zeros(n_frames, dtype=int)
+    label[first:last + 1] = 1
+    return label
+
+
+def test_durations_count_the_stop_frame(rle_label):
+    rng = np.random.default_rng(0)
+    label = rle_label.RLELabel.from_dense(rng.integers(0, 3, 1000), frames(1000))
+
+    assert label.durations().sum() == pytest.approx(40.)
+    assert sum(label.duration_per_value().values()) == pytest.approx(40.)
+
+
+def test_duration_per_value_matches_frame_count(rle_label):
+    dense = indicator(100, 10, 34)
+    label = rle_label.RLELabel.from_dense(dense, frames(100))
+
+    assert label.duration_per_value() == pytest.approx({0: 75 * 0.04, 1: 25 * 0.04})
+
+
+def test_overlap_of_misaligned_labels(rle_label):
+    # A covers frames 0-24 of a 25 frame range, B frames 10-49 of a 50 frame range
+    a = rle_label.RLELabel.from_dense(np.ones(25, dtype=int), frames(25))
+    b = rle_label.RLELabel.from_dense(indicator(50, 10, 49), frames(50))
+
+    assert a.overlap(b) == pytest.approx(15 * 0.04)
+    assert b.overlap(a) == pytest.approx(15 * 0.04)
+    assert (a & b).duration_per_value()[1] == pytest.approx(15 * 0.04)
+    assert (a | b).duration_per_value() == pytest.approx({1: 50 * 0.04})
+
+
+@pytest.mark.parametrize("first", [0, 1, 2537])
+@pytest.mark.parametrize("seed", range(5))
+def test_combined_labels_match_dense_logic(rle_label, seed, first):
+    rng = np.random.default_rng(seed)
+    a_dense = (rng.random(300) < 0.3).astype(int)
+    b_dense = (rng.random(220) < 0.5).astype(int)
+    a = rle_label.RLELabel.from_dense(a_dense, frames(300, first))
+    b = rle_label.RLELabel.from_dense(b_dense, frames(220, first))
+
+    b_padded = np.append(b_dense, np.zeros(80, dtype=int))
+    assert a.overlap(b) == pytest.approx(np.sum(a_dense & b_padded) * 0.04)
+    np.testing.assert_array_equal((a & b).to_dense(frames(300, first)), a_dense & b_padded)
+    np.testing.assert_array_equal((a | b).to_dense(frames(300, first)), a_dense | b_padded)
+    assert (a | b).duration_per_value()[1] == pytest.approx(np.sum(a_dense | b_padded) * 0.04)
+
+
+def test_end_of_shorter_label_on_offset_grid(rle_label):
+    t = frames(10, 1)
+    a = rle_label.RLELabel.from_dense(np.array([0, 2, 0, 0, 1, 1, 1, 1, 0, 0]), t)
+    b = rle_label.RLELabel.from_dense(np.array([1, 1, 1, 0, 1]), t[:5])
+
+    np.testing.assert_array_equal((a & b).to_dense(t), [0, 1, 0, 0, 1, 0, 0, 0, 0, 0])
+    np.testing.assert_array_equal((a | b).to_dense(t), [1, 1, 1, 0, 1, 1, 1, 1, 0, 0])
+
+
+def gappy_label(rle_label, rng, t):
+    # sorted segments where the label is present, with gaps in between (as imported from Advene)
+    bounds = np.sort(rng.choice(len(t), 20, replace=False)).reshape(-1, 2)
+    dense = np.zeros(len(t), dtype=int)
+    for first, last in bounds:
+        dense[first:last + 1] = 1
+    label = rle_label.RLELabel(np.ones(len(bounds), dtype=int), t[bounds[:, 0]], t[bounds[:, 1]])
+    return label, dense
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_labels_with_gaps_match_dense_logic(rle_label, seed):
+    rng = np.random.default_rng(seed)
+    t = frames(400, 3)
+    a, a_dense = gappy_label(rle_label, rng, t)
+    b, b_dense = gappy_label(rle_label, rng, t)
+
+    np.testing.assert_array_equal(a.to_dense(t), a_dense)
+    assert a.duration_per_value()[1] == pytest.approx(a_dense.sum() * 0.04)
+    assert a.overlap(b) == pytest.approx(np.sum(a_dense & b_dense) * 0.04)
+    np.testing.assert_array_equal((a & b).to_dense(t), a_dense & b_dense)
+    np.testing.assert_array_equal((a | b).to_dense(t), a_dense | b_dense)
+    labelled = (t >= a.start_times[0]) & (t <= a.stop_times[-1])
+    np.testing.assert_array_equal((~a).to_dense(t), np.where(labelled, 1 - a_dense, 0))
+    assert (a | b).duration_per_value()[1] == pytest.approx(np.sum(a_dense | b_dense) * 0.04)
+    np.testing.assert_array_equal(a.resample(t).to_dense(t), a_dense)
@@ -0,0 +1,87 @@
+import json
+
+import numpy as np
+import pytest
+
+import epiphyte.database.helpers as helpers
+from epiphyte.preprocessing.data_preprocessing import data_utils, session_pipeline
+
+from conftest import make_watchlog
+
+
+def make_session(directory, seed=0, n_events=200, with_daqlog=True):
+    """Mock raw session: watchlog, DAQ log, events that match it (neural = 0.001 * cpu + 5000) and channels."""
+    rng = np.random.default_rng(seed)
+    for name in ("watchlogs", "daq_files", "event_file"):
+        (directory / name).mkdir(parents=True)
+
+    (directory / "watchlogs" / "ffplay-watchlog-1.log").write_bytes(make_watchlog(seed))
+
+    values = 2 ** (np.arange(n_events) % 8)
+    pretime = 1600000000000000 + np.cumsum(rng.integers(10 ** 5, 10 ** 7, n_events))
+    posttime = pretime + rng.integers(10, 90, n_events)
+    if with_daqlog:
+        lines = ["Initial signature: 255\t255", "255\t255\t", "data\tStamp\tpre\tpost"]
+        lines += ["{}\t{}\t{}\t{}".format(*row) for row in zip(values, range(n_events), pretime, posttime)]
+        (directory / "daq_files" / "timedDAQ-log-1.log").write_text("\n".join(lines) + "\n")
+    np.save(directory / "event_file" / "Events.npy", np.array([posttime * 0.001 + 5000, values]).T)
+
+    (directory / "ChannelNames.txt").write_text("".join("CSC{}.ncs\n".format(i) for i in range(1, 9)))
+
+
+@pytest.fixture
+def patient_data(tmp_path):
+    make_session(tmp_path / "12" / "session_2", seed=1)
+    make_session(tmp_path / "12" / "session_1", seed=2)
+    make_session(tmp_path / "3" / "session_1", seed=3, with_daqlog=False)
+    # not sessions
+    (tmp_path / "12" / "session_x").mkdir()
+    (tmp_path / "12" / "notes").mkdir()
+    (tmp_path / "config").mkdir()
+    (tmp_path / "4").write_text("")
+    return tmp_path
+
+
+def test_discover_sessions(patient_data):
+    sessions = session_pipeline.discover_sessions(patient_data)
+
+    assert [(session.patient_id, session.session_nr) for session in sessions] == [(3, 1), (12, 1), (12, 2)]
+    assert sessions[0].missing() == ["daqlog"]
+    assert sessions[1].missing() == []
+    assert sessions[1].events == patient_data / "12" / "session_1" / "event_file" / "Events.npy"
+
+
+def test_run_pipeline_writes_outputs_and_captures_failures(patient_data):
+    results = session_pipeline.run_pipeline(root=patient_data, max_workers=1)
+
+    assert [(result.patient_id, result.session_nr, result.ok) for result in results] == \
+        [(3, 1, False), (12, 1, True), (12, 2, True)]
+    assert "FileNotFoundError" in results[0].error and "daqlog" in results[0].error
+
+    session_dir = patient_data / "12" / "session_1"
+    movie_info = session_dir / session_pipeline.OUTPUT_DIRNAME
+    pts, cpu_time = data_utils.read_watchlog(next((session_dir / "watchlogs").glob("ffplay*")))
+    np.testing.assert_array_equal(np.load(movie_info / "pts.npy"), pts)
+    np.testing.assert_array_equal(np.load(movie_info / "dts.npy"), cpu_time)
+    np.testing.assert_allclose(np.load(movie_info / "neural_rec_time.npy"), cpu_time * 0.001 + 5000)
+
+    skips = np.load(movie_info / "skips.npz")
+    pauses = np.load(movie_info / "pauses.npz")
+    assert results[1].summary == {"frames": len(pts), "skips": len(skips["start_times"]) - 1,
+                                  "pauses": len(pauses["start_times"]), "channels": 8}
+    assert json.loads((movie_info / "channel_names.json").read_text()) == \
+        helpers.get_channel_names(session_dir / "ChannelNames.txt")
+    assert not list(movie_info.glob("*.tmp*"))
+
+
+def test_format_report(patient_data):
+    results = session_pipeline.run_pipeline(root=patient_data, max_workers=1)
+    report = session_pipeline.format_report(results).splitlines()
+
+    assert report[0].split() == ["patient", "session", "status", "seconds", "summary"]
+    assert report[1].split()[:3] == ["3", "1", "FAILED"]
+    assert report[2].split()[:3] == ["12", "1", "ok"]
+    assert report[2].endswith(", ".join("{}={}".format(*item) for item in results[1].summary.items()))
+    assert report[4].startswith("2 of 3 sessions succeeded")
+    assert "Patient 3, session 1:" in report
+    assert report[-1] == results[0].error.splitlines()[-1]
@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+
+from epiphyte.preprocessing.annotation.stimulus_driven_annotation.movies import watch_log
+from epiphyte.preprocessing.data_preprocessing import data_utils
+
+from conftest import make_watchlog
+
+
+def follow_in_chunks(path, data, cuts, **kwargs):
+    """Append ``data`` to ``path`` piece by piece, polling after every piece."""
+    path.write_bytes(b"")
+    follower = watch_log.WatchLogFollower(str(path), **kwargs)
+    events = []
+    previous = 0
+    for cut in list(cuts) + [len(data)]:
+        with open(path, "ab") as handle:
+            handle.write(data[previous:cut])
+        previous = cut
+        events += follower.poll()
+    return follower, events
+
+
+def assert_matches_full_parse(data, follower, events):
+    full = data_utils.parse_watchlog_buffer(data)
+    skips = data_utils.detect_skips(full.pts, full.cpu_time.astype(float))
+
+    def cpu_times(kind):
+        return [event.cpu_time for event in events if event.kind == kind]
+
+    assert cpu_times("pause") == full.pause_start_times.tolist()
+    assert cpu_times("resume") + cpu_times("end") == full.pause_stop_times.tolist()
+    assert [event.line_number for event in events if event.kind == "skip"] == \
+        full.line_numbers[skips.frame_starts[1:]].tolist()
+    assert follower.frames.n_frames == len(full.pts)
+    np.testing.assert_array_equal(follower.frames.pts, full.pts[-len(follower.frames):])
+    assert follower.ended == full.properly_terminated
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_follow_random_chunks(tmp_path, seed):
+    data = make_watchlog(seed=seed, n_frames=400)
+    rng = np.random.default_rng(seed)
+    cuts = np.cumsum(rng.integers(1, 200, len(data)))
+    cuts = cuts[cuts < len(data)]
+
+    follower, events = follow_in_chunks(tmp_path / "live.log", data, cuts, max_frames=100)
+    assert_matches_full_parse(data, follower, events)
+
+
+def test_follow_split_after_continuing_and_mid_line(tmp_path, watchlog_bytes):
+    continuing = watchlog_bytes.index(b"Continuing\tafter\tpause\n") + len(b"Continuing\tafter\tpause\n")
+    mid_line = watchlog_bytes.index(b"time", continuing) + 2
+
+    follower, events = follow_in_chunks(tmp_path / "live.log", watchlog_bytes, [continuing, mid_line])
+    assert_matches_full_parse(watchlog_bytes, follower, events)
+
+
+def test_continuing_before_next_frame_is_pending(tmp_path):
+    path = tmp_path / "live.log"
+    path.write_bytes(b"hdr a b c\npts 0.00 time 1000000\nPausing\nContinuing after pause\n")
+    follower = watch_log.WatchLogFollower(str(path))
+
+    assert [event.kind for event in follower.poll()] == ["pause"]
+    with open(path, "ab") as handle:
+        handle.write(b"pts 0.04 time 9000000\n")
+    (resume,) = follower.poll()
+    assert (resume.kind, resume.cpu_time) == ("resume", 9000000)
+
+
+def test_bounded_chunks_match_single_read(tmp_path, watchlog_bytes):
+    path = tmp_path / "done.log"
+    path.write_bytes(watchlog_bytes)
+
+    single = watch_log.WatchLogFollower(str(path))
+    chunked = watch_log.WatchLogFollower(str(path), chunk_bytes=256)
+    assert [vars(event) for event in chunked.poll()] == [vars(event) for event in single.poll()]
+    assert chunked.offset == single.offset == len(watchlog_bytes)
+
+
+def test_failed_parse_keeps_state(tmp_path, watchlog_bytes, monkeypatch):
+    path = tmp_path / "live.log"
+    path.write_bytes(watchlog_bytes)
+    follower = watch_log.WatchLogFollower(str(path))
+
+    def fail(data):
+        raise RuntimeError("parse failed")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(data_utils, "parse_watchlog_buffer", fail)
+        with pytest.raises(RuntimeError):
+            follower.poll()
+    assert (follower.offset, follower.frames.n_frames) == (0, 0)
+
+    assert_matches_full_parse(watchlog_bytes, follower, follower.poll())
+
+
+def test_truncated_log_resets(tmp_path, watchlog_bytes):
+    path = tmp_path / "live.log"
+    path.write_bytes(watchlog_bytes)
+    follower = watch_log.WatchLogFollower(str(path))
+    follower.poll()
+
+    path.write_bytes(watchlog_bytes[:watchlog_bytes.index(b"Pausing")])
+    events = follower.poll()
+    assert follower.offset == path.stat().st_size
+    assert not follower.ended and all(event.kind == "skip" for event in events)
+
+
+def test_frame_buffer_keeps_most_recent_frames():
+    buffer = watch_log.FrameBuffer(max_frames=5)
+    for first in range(0, 23, 3):
+        frames = np.arange(first, first + 3)
+        buffer.append(frames * 0.04, frames, frames)
+
+    assert buffer.n_frames == 24
+    np.testing.assert_array_equal(buffer.cpu_time, np.arange(19, 24))